@@ -0,0 +1,130 @@
+"""Queue-backed logging and one structured access-log record per request
+
+Request threads only put log records on an in-memory queue; a background
+QueueListener thread formats and writes them, so slow stdout/disk I/O never
+sits on the request path. Records are formatted lazily by the listener, not
+by the request thread.
+
+Environment:
+    LOG_LEVEL           root log level (default INFO)
+    ACCESS_LOG_SAMPLE   fraction of successful requests to log (default 1.0);
+                        responses with status >= 400 are always logged
+    ACCESS_LOG_FORMAT   'text' (default) or 'json'
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+from flask import g, request
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+ACCESS_FIELDS = ('method', 'path', 'status', 'latency_ms', 'bytes', 'remote_addr')
+
+access_logger = logging.getLogger('access')
+
+_sample_rate = 1.0
+_listener = None
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread
+
+    The stock prepare() renders the message in the calling thread so the
+    record can be pickled; our queue never leaves the process.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class AccessTextFormatter(logging.Formatter):
+    def format(self, record):
+        if not hasattr(record, 'status'):
+            return super().format(record)
+        return (f"{self.formatTime(record)} - ACCESS - {record.method} {record.path} "
+                f"{record.status} {record.latency_ms:.1f}ms {record.bytes}B {record.remote_addr}")
+
+
+class AccessJsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'time': record.created, 'level': record.levelname}
+        if hasattr(record, 'status'):
+            entry.update((field, getattr(record, field)) for field in ACCESS_FIELDS)
+        else:
+            entry['message'] = record.getMessage()
+            if record.exc_info:
+                entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def configure_logging(level=None, stream=None, sample_rate=None, json_format=None):
+    """Route every log record through a queue to a background writer
+
+    Replaces any handlers on the root logger. Returns the started listener;
+    call stop_logging() before exit to flush it.
+    """
+    global _sample_rate, _listener
+    stop_logging()
+    level = level or os.environ.get('LOG_LEVEL', 'INFO').upper()
+    if sample_rate is None:
+        sample_rate = float(os.environ.get('ACCESS_LOG_SAMPLE', '1.0'))
+    if json_format is None:
+        json_format = os.environ.get('ACCESS_LOG_FORMAT', 'text').lower() == 'json'
+    _sample_rate = max(0.0, min(1.0, sample_rate))
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(AccessJsonFormatter() if json_format else AccessTextFormatter(LOG_FORMAT))
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Write out everything still queued and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def mark_request_start():
+    g.request_started = time.perf_counter()
+
+
+def request_latency():
+    """Seconds since mark_request_start() for the current request"""
+    started = g.get('request_started')
+    return time.perf_counter() - started if started is not None else 0.0
+
+
+def log_access(response, latency=None):
+    """Emit the access record for response, subject to sampling"""
+    status = response.status_code
+    if status < 400 and _sample_rate < 1.0 and random.random() >= _sample_rate:
+        return response
+    if not access_logger.isEnabledFor(logging.INFO):
+        return response
+    latency_ms = (request_latency() if latency is None else latency) * 1000
+    length = response.content_length
+    access_logger.info('access', extra={
+        'method': request.method,
+        'path': request.full_path if request.query_string else request.path,
+        'status': status,
+        'latency_ms': latency_ms,
+        'bytes': length if length is not None else '-',
+        'remote_addr': request.remote_addr,
+    })
+    return response
@@ -0,0 +1,160 @@
+"""Accept-Encoding negotiated gzip / brotli compression of API responses
+
+compress_response() runs from an after_request hook. It leaves alone bodies
+under MIN_SIZE, responses that are already encoded or partial, anything that
+is not text-like (media files) and event streams, which must reach clients
+one event at a time. Brotli is offered only when the brotli module is
+installed.
+
+Versioned responses (those carrying an ETag, see http_cache.py) are
+compressed once: the result is kept per URL and encoding together with the
+ETag and a digest of the body it came from, and reused while both match.
+Large bodies that miss the cache are compressed while they are sent instead
+of before, so the first bytes leave without waiting for the whole body.
+"""
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this (bytes) are sent uncompressed
+MIN_SIZE = 1024
+# Bodies at least this large are compressed while being sent on a cache miss
+STREAM_MIN_SIZE = 256 * 1024
+# Uncompressed bytes fed to the compressor per streamed chunk
+STREAM_CHUNK_SIZE = 64 * 1024
+# Total size of the compressed bodies kept for reuse (bytes)
+CACHE_SIZE = 64 * 1024 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Content types worth compressing; text/event-stream is excluded separately
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+# In server preference order, for equally acceptable encodings
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def _compressor(encoding):
+    """(compress(chunk), finish()) functions of a streaming compressor"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    # wbits 31: gzip framing with a zero mtime, so equal bodies compress equally
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    compress_chunk, finish = _compressor(encoding)
+    return compress_chunk(body) + finish()
+
+
+def compress_stream(body, encoding, done=None):
+    """Yield body compressed chunk by chunk; done(compressed) is called once all is sent"""
+    compress_chunk, finish = _compressor(encoding)
+    parts = []
+    for offset in range(0, len(body), STREAM_CHUNK_SIZE):
+        part = compress_chunk(body[offset:offset + STREAM_CHUNK_SIZE])
+        if part:
+            parts.append(part)
+            yield part
+    part = finish()
+    parts.append(part)
+    yield part
+    if done is not None:
+        done(b''.join(parts))
+
+
+class CompressedBodies:
+    """Least recently used compressed bodies per (url, encoding), bounded by total size
+
+    Each entry remembers the ETag and body digest it was made from; a
+    lookup with any other pair misses, and storing replaces the stale entry.
+    """
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, etag, digest):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag or entry[1] != digest:
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, key, etag, digest, body):
+        if len(body) > self.max_size:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[2])
+            self._entries[key] = (etag, digest, body)
+            self.size += len(body)
+            while self.size > self.max_size:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+def compressible(response):
+    """True if response is a whole, unencoded, text-like body that may be transformed"""
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.is_streamed or response.direct_passthrough:
+        return False
+    headers = response.headers
+    if 'Content-Encoding' in headers or 'Content-Range' in headers or response.cache_control.no_transform:
+        return False
+    mimetype = response.mimetype or ''
+    return mimetype != 'text/event-stream' and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress_response(response, cache):
+    """Encode response as the client's Accept-Encoding prefers, reusing cache for versioned bodies"""
+    if not compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < MIN_SIZE:
+        return response
+
+    etag, _ = response.get_etag()
+    key = (request.full_path, encoding)
+    digest = compressed = None
+    if etag is not None:
+        digest = hashlib.sha256(body).digest()
+        compressed = cache.get(key, etag, digest)
+
+    if compressed is None and len(body) >= STREAM_MIN_SIZE:
+        done = (lambda result: cache.put(key, etag, digest, result)) if etag is not None else None
+        response.response = compress_stream(body, encoding, done)
+        response.headers.pop('Content-Length', None)
+    else:
+        if compressed is None:
+            compressed = compress(body, encoding)
+            if etag is not None:
+                cache.put(key, etag, digest, compressed)
+        response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # Each encoding is a different byte sequence of the same resource
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,84 @@
+"""Sharded in-memory counters with write-behind batched flushing"""
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARDS = 16
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+class _Shard:
+    __slots__ = ('lock', 'pending')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+
+
+class ShardedCounter:
+    """Absorbs increments per key and hands them to flush() in batches
+
+    Threads are assigned shards round-robin on first use, so concurrent
+    requests rarely contend on the same lock, and an increment is just a dict
+    update. A background thread swaps every shard's pending deltas out at
+    flush_interval and passes the merged {key: delta} to flush in one call.
+    """
+
+    def __init__(self, flush, flush_interval=DEFAULT_FLUSH_INTERVAL, shards=DEFAULT_SHARDS):
+        self._flush = flush
+        self.flush_interval = flush_interval
+        self._shards = [_Shard() for _ in range(shards)]
+        self._next_shard = itertools.count()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='counter-flush', daemon=True)
+            self._thread.start()
+        return self
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = self._shards[next(self._next_shard) % len(self._shards)]
+        return shard
+
+    def increment(self, key, amount=1):
+        shard = self._shard()
+        with shard.lock:
+            shard.pending[key] = shard.pending.get(key, 0) + amount
+
+    def pending(self, key):
+        """Increments for key that have not been flushed yet"""
+        return sum(shard.pending.get(key, 0) for shard in self._shards)
+
+    def flush(self):
+        """Hand every pending delta to the flush callback now"""
+        with self._flush_lock:
+            merged = {}
+            for shard in self._shards:
+                with shard.lock:
+                    pending, shard.pending = shard.pending, {}
+                for key, amount in pending.items():
+                    merged[key] = merged.get(key, 0) + amount
+            if merged:
+                try:
+                    self._flush(merged)
+                except Exception as e:
+                    logger.error("❌ Counter flush failed, dropping %s keys: %s", len(merged), e)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
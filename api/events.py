@@ -0,0 +1,442 @@
+"""Server-sent event streams fed by an in-process publish/subscribe hub
+
+Writers publish (event id, name, JSON bytes) to a channel; every subscriber
+of that channel gets the encoded event appended to its own bounded queue.
+A subscriber whose queue fills up is evicted (its stream ends) rather than
+letting one slow reader grow memory without limit; the client reconnects
+with Last-Event-ID and catches up from the channel's ring buffer of recent
+events. A client whose Last-Event-ID is older than the ring covers gets a
+'reset' event and should refetch the listing.
+
+Streams are written in one of two ways:
+
+- When the server offers DETACH_ENVIRON_KEY (start_backend.py --production
+  does), the handler sends the response headers, hands the connection to
+  the hub and returns, freeing its request thread. One writer thread per
+  process then serves every stream with a selector, so an idle viewer costs
+  a socket and a small Subscription, not a thread.
+- Otherwise the response body is a generator that waits for events on the
+  request thread (the development server runs a thread per connection).
+"""
+import collections
+import logging
+import selectors
+import socket
+import threading
+import time
+
+from flask import current_app, request
+
+logger = logging.getLogger(__name__)
+
+# Recent events kept per channel for Last-Event-ID replay
+REPLAY_SIZE = 100
+# Seconds a channel without subscribers is kept for reconnecting clients to
+# replay from; after that it is dropped and late reconnects get a reset
+CHANNEL_IDLE_TIMEOUT = 60.0
+# Undelivered events a subscriber may have before it is evicted
+MAX_QUEUE = 256
+# Comment line sent on otherwise idle streams so proxies keep them open
+HEARTBEAT_INTERVAL = 15.0
+# How often idle streams check for changes made by other worker processes
+POLL_INTERVAL = 1.0
+# Milliseconds browsers wait before reconnecting
+RETRY_MS = 3000
+
+# WSGI environ key of a server callable that returns a duplicate of the
+# client socket and stops the server from closing the connection
+DETACH_ENVIRON_KEY = 'app.detach_socket'
+# Set in the environ once a stream took its connection over, so metrics know
+# its bytes are written by the hub rather than through the response
+DETACHED_ENVIRON_KEY = 'app.stream_detached'
+
+HEARTBEAT = b': ping\n\n'
+RESET = b'event: reset\ndata: {}\n\n'
+
+
+def format_event(event_id, name, data):
+    """Encode one event; data is single-line JSON bytes"""
+    return b'id: %d\nevent: %s\ndata: %s\n\n' % (event_id, name.encode('ascii'), data)
+
+
+def requested_event_id():
+    """Last event the client saw: Last-Event-ID header or lastEventId parameter"""
+    value = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+class _Channel:
+    __slots__ = ('subscribers', 'history', 'floor', 'idle_since')
+
+    def __init__(self, floor, replay_size):
+        self.subscribers = set()
+        self.history = collections.deque(maxlen=replay_size)
+        # Events with ids up to floor can no longer be replayed
+        self.floor = floor
+        self.idle_since = None
+
+
+class Subscription:
+    """One client's stream: its queued events and, once detached, its socket"""
+
+    __slots__ = ('channel', 'queue', 'closed', 'sock', 'outgoing', 'last_write', 'mask', 'ready')
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.queue = collections.deque()
+        self.closed = False
+        self.sock = None
+        self.outgoing = None
+        self.last_write = time.monotonic()
+        self.mask = 0
+        self.ready = None
+
+
+class EventHub:
+    """Channels of subscribers plus the writer thread for detached streams
+
+    poll, if given, is called about every POLL_INTERVAL while streams are
+    open, so events committed by other worker processes (picked up by
+    CatalogStore.refresh) reach idle streams without waiting for a request.
+    """
+
+    def __init__(self, poll=None, replay_size=REPLAY_SIZE, max_queue=MAX_QUEUE,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, idle_timeout=CHANNEL_IDLE_TIMEOUT):
+        self._poll = poll
+        self.replay_size = replay_size
+        self.idle_timeout = idle_timeout
+        self.max_queue = max_queue
+        self.heartbeat_interval = heartbeat_interval
+        self._lock = threading.Lock()
+        self._channels = {}
+        # Channels whose last subscriber left, oldest first
+        self._idle = {}
+        self._subscribers = 0
+        self.evicted = 0
+        self._next_poll = 0.0
+        # Detached subscriptions with new events or closed, for the writer
+        self._dirty = set()
+        self._selector = None
+        self._wake_send = self._wake_receive = None
+        self._thread = None
+        self._stopped = False
+
+    def __len__(self):
+        return self._subscribers
+
+    # Publishing
+
+    def publish(self, channel, event_id, name, data):
+        """Send an event to the channel's subscribers and keep it for replay
+
+        Channels exist once someone has subscribed; before that there is
+        nobody to deliver to and nothing a reconnecting client could miss.
+        """
+        if channel not in self._channels:
+            return
+        message = format_event(event_id, name, data)
+        wake = False
+        with self._lock:
+            state = self._channels.get(channel)
+            if state is None:
+                # Dropped as idle since the check above
+                return
+            if len(state.history) == state.history.maxlen:
+                state.floor = state.history[0][0]
+            state.history.append((event_id, message))
+            slow = []
+            for subscription in state.subscribers:
+                if len(subscription.queue) >= self.max_queue:
+                    slow.append(subscription)
+                    continue
+                subscription.queue.append(message)
+                if subscription.sock is not None:
+                    self._dirty.add(subscription)
+                    wake = True
+                elif subscription.ready is not None:
+                    subscription.ready.set()
+            for subscription in slow:
+                self.evicted += 1
+                logger.debug("🐢 Evicting slow event subscriber on %s", channel)
+                self._remove(subscription)
+                wake = wake or subscription.sock is not None
+        if wake:
+            self._wake()
+
+    # Subscribing
+
+    def subscribe(self, channel, last_event_id=None, newest_event_id=0):
+        """Start a subscription, queueing the retry hint and any replay
+
+        newest_event_id is the id of the newest event already reflected in
+        the listing clients fetch; it becomes the replay floor of a new
+        channel.
+        """
+        subscription = Subscription(channel)
+        subscription.queue.append(b'retry: %d\n\n' % RETRY_MS)
+        with self._lock:
+            self._drop_idle()
+            state = self._channels.get(channel)
+            if state is None:
+                state = self._channels[channel] = _Channel(newest_event_id, self.replay_size)
+            elif state.idle_since is not None:
+                state.idle_since = None
+                del self._idle[channel]
+            if last_event_id is not None:
+                if last_event_id < state.floor:
+                    subscription.queue.append(RESET)
+                else:
+                    subscription.queue.extend(message for event_id, message in state.history
+                                              if event_id > last_event_id)
+            state.subscribers.add(subscription)
+            self._subscribers += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._remove(subscription)
+
+    def _remove(self, subscription):
+        if subscription.closed:
+            return
+        subscription.closed = True
+        state = self._channels[subscription.channel]
+        state.subscribers.discard(subscription)
+        self._subscribers -= 1
+        if not state.subscribers:
+            state.idle_since = time.monotonic()
+            self._idle[subscription.channel] = state
+            self._drop_idle()
+        if subscription.sock is not None:
+            self._dirty.add(subscription)
+        elif subscription.ready is not None:
+            subscription.ready.set()
+
+    def _drop_idle(self):
+        """Forget channels that have had no subscribers for idle_timeout"""
+        expired = time.monotonic() - self.idle_timeout
+        while self._idle:
+            channel, state = next(iter(self._idle.items()))
+            if state.idle_since > expired:
+                break
+            del self._idle[channel]
+            del self._channels[channel]
+
+    def maybe_poll(self):
+        if self._poll is None:
+            return
+        now = time.monotonic()
+        if now >= self._next_poll:
+            self._next_poll = now + POLL_INTERVAL
+            try:
+                self._poll()
+            except Exception as e:
+                logger.error("❌ Error polling for events: %s", e)
+
+    # Streaming on the request thread
+
+    def stream(self, subscription):
+        """Yield the subscription's events as they arrive; ends when evicted"""
+        subscription.ready = threading.Event()
+        subscription.ready.set()
+        wait = min(self.heartbeat_interval, POLL_INTERVAL) if self._poll else self.heartbeat_interval
+        try:
+            while True:
+                subscription.ready.wait(wait)
+                with self._lock:
+                    subscription.ready.clear()
+                    chunk = b''.join(subscription.queue)
+                    subscription.queue.clear()
+                if subscription.closed:
+                    return
+                now = time.monotonic()
+                if chunk:
+                    subscription.last_write = now
+                    yield chunk
+                elif now - subscription.last_write >= self.heartbeat_interval:
+                    subscription.last_write = now
+                    yield HEARTBEAT
+                self.maybe_poll()
+        finally:
+            self.unsubscribe(subscription)
+
+    # Streaming from the writer thread
+
+    def attach(self, subscription, sock):
+        """Hand a connection whose headers were sent to the writer thread"""
+        with self._lock:
+            if self._stopped:
+                sock.close()
+                self._remove(subscription)
+                return
+            if self._thread is None:
+                self._selector = selectors.DefaultSelector()
+                self._wake_receive, self._wake_send = socket.socketpair()
+                self._wake_receive.setblocking(False)
+                self._wake_send.setblocking(False)
+                self._selector.register(self._wake_receive, selectors.EVENT_READ)
+                self._thread = threading.Thread(target=self._run, name='event-writer', daemon=True)
+                self._thread.start()
+            subscription.sock = sock
+            self._dirty.add(subscription)
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_send.send(b'\0')
+        except (OSError, AttributeError):
+            pass  # a wake-up is already pending, or the writer is not running
+
+    def _run(self):
+        selector = self._selector
+        detached = set()
+        next_heartbeat = time.monotonic() + self.heartbeat_interval
+        while not self._stopped:
+            timeout = next_heartbeat - time.monotonic()
+            if self._poll is not None and detached:
+                timeout = min(timeout, POLL_INTERVAL)
+            for key, mask in selector.select(max(0.0, timeout)):
+                if key.fileobj is self._wake_receive:
+                    try:
+                        while self._wake_receive.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                subscription = key.data
+                if mask & selectors.EVENT_READ and not self._client_open(subscription):
+                    self.unsubscribe(subscription)
+                if mask & selectors.EVENT_WRITE or subscription.closed:
+                    self._dirty_add(subscription)
+
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+            now = time.monotonic()
+            if now >= next_heartbeat:
+                for subscription in detached:
+                    if now - subscription.last_write >= self.heartbeat_interval and not subscription.outgoing:
+                        with self._lock:
+                            subscription.queue.append(HEARTBEAT)
+                        dirty.add(subscription)
+                next_heartbeat = now + self.heartbeat_interval
+            for subscription in dirty:
+                if self._flush(subscription, now):
+                    detached.add(subscription)
+                else:
+                    detached.discard(subscription)
+            if detached:
+                self.maybe_poll()
+
+        for subscription in detached:
+            self._close_socket(subscription)
+        selector.close()
+
+    def _dirty_add(self, subscription):
+        with self._lock:
+            self._dirty.add(subscription)
+
+    @staticmethod
+    def _client_open(subscription):
+        """Read and discard whatever the client sent; False once it hung up"""
+        try:
+            return subscription.sock.recv(4096, socket.MSG_DONTWAIT) != b''
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+
+    def _flush(self, subscription, now):
+        """Write queued events without blocking; False once the stream is over
+
+        MSG_DONTWAIT keeps the socket itself blocking: the request handler
+        still holds the original descriptor, which shares its flags.
+        """
+        if subscription.closed:
+            self._close_socket(subscription)
+            return False
+        sock = subscription.sock
+        try:
+            while True:
+                if not subscription.outgoing:
+                    with self._lock:
+                        if not subscription.queue:
+                            break
+                        subscription.outgoing = memoryview(b''.join(subscription.queue))
+                        subscription.queue.clear()
+                sent = sock.send(subscription.outgoing, socket.MSG_DONTWAIT)
+                subscription.outgoing = subscription.outgoing[sent:]
+                subscription.last_write = now
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.unsubscribe(subscription)
+            self._close_socket(subscription)
+            return False
+        mask = selectors.EVENT_READ | (selectors.EVENT_WRITE if subscription.outgoing else 0)
+        if mask != subscription.mask:
+            if subscription.mask:
+                self._selector.modify(sock, mask, subscription)
+            else:
+                self._selector.register(sock, mask, subscription)
+            subscription.mask = mask
+        return True
+
+    def _close_socket(self, subscription):
+        if subscription.mask:
+            self._selector.unregister(subscription.sock)
+            subscription.mask = 0
+        subscription.outgoing = None
+        subscription.sock.close()
+
+    def close(self):
+        """End every stream and stop the writer thread"""
+        with self._lock:
+            self._stopped = True
+            for state in list(self._channels.values()):
+                for subscription in list(state.subscribers):
+                    self._remove(subscription)
+            thread = self._thread
+        if thread is not None:
+            self._wake()
+            thread.join(timeout=5)
+            self._wake_send.close()
+            self._wake_receive.close()
+
+
+def _detached_body(hub, channel, last_event_id, newest_event_id, environ):
+    sock = environ[DETACH_ENVIRON_KEY]()
+    environ[DETACHED_ENVIRON_KEY] = True
+    subscription = hub.subscribe(channel, last_event_id, newest_event_id)
+    try:
+        # The empty chunk makes the server send the status line and headers
+        yield b''
+    except BaseException:
+        sock.close()
+        hub.unsubscribe(subscription)
+        raise
+    hub.attach(subscription, sock)
+
+
+def _threaded_body(hub, channel, last_event_id, newest_event_id):
+    # Subscribe once the server iterates the body, so a response that is
+    # never sent (e.g. HEAD) leaves no subscription behind
+    yield from hub.stream(hub.subscribe(channel, last_event_id, newest_event_id))
+
+
+def event_stream_response(hub, channel, newest_event_id=0):
+    """text/event-stream response following channel for the current request"""
+    response = current_app.response_class(mimetype='text/event-stream', direct_passthrough=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Tell nginx-style proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    if request.method == 'HEAD':
+        return response
+    last_event_id = requested_event_id()
+    if DETACH_ENVIRON_KEY in request.environ:
+        response.response = _detached_body(hub, channel, last_event_id, newest_event_id, request.environ)
+    else:
+        response.response = _threaded_body(hub, channel, last_event_id, newest_event_id)
+    return response
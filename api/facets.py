@@ -0,0 +1,96 @@
+"""Facet sets and counts for filtering the video list"""
+import math
+from collections import Counter
+
+# name -> (shortest, longest) duration in seconds, both inclusive
+DURATION_BUCKETS = {
+    'short': (0, 239),
+    'medium': (240, 1199),
+    'long': (1200, math.inf),
+}
+# Channels listed in facet counts, most videos first
+MAX_CHANNEL_FACETS = 50
+# Rough cost of counting one match in Python relative to one set probe in C
+PER_MATCH_COST = 16
+
+
+def duration_bucket(seconds):
+    for name, (shortest, longest) in DURATION_BUCKETS.items():
+        if shortest <= seconds <= longest:
+            return name
+    return None
+
+
+class VideoFacets:
+    """Video ids per channel and per duration bucket
+
+    Each set is a frozenset replaced on change, so readers intersect and
+    iterate them without locking while the store lock serializes writers.
+    Facet counts of the whole catalog are the set sizes, so they are kept
+    current by every upload at no extra cost.
+    """
+
+    def __init__(self):
+        self._channels = {}
+        self._names = {}
+        self._durations = {name: frozenset() for name in DURATION_BUCKETS}
+
+    def add_many(self, ids, channels, durations):
+        """Add videos given as parallel lists of ids, channel names and durations"""
+        self._names.update(zip(ids, channels))
+        by_channel = {}
+        by_duration = {}
+        # Far fewer distinct durations than videos
+        buckets = {}
+        for video_id, name, seconds in zip(ids, channels, durations):
+            by_channel.setdefault(name, []).append(video_id)
+            bucket = buckets.get(seconds)
+            if bucket is None:
+                bucket = buckets[seconds] = duration_bucket(seconds)
+            by_duration.setdefault(bucket, []).append(video_id)
+        for name, ids_of in by_channel.items():
+            self._channels[name] = self._channels.get(name, frozenset()).union(ids_of)
+        for name, ids_of in by_duration.items():
+            self._durations[name] = self._durations[name].union(ids_of)
+
+    def move_duration(self, video_id, old_seconds, new_seconds):
+        """Rebucket a video whose duration changed"""
+        old, new = duration_bucket(old_seconds), duration_bucket(new_seconds)
+        if old != new:
+            self._durations[old] = self._durations[old] - {video_id}
+            self._durations[new] = self._durations[new] | {video_id}
+
+    def channel(self, name):
+        """Ids of the videos of the named channel"""
+        return self._channels.get(name, frozenset())
+
+    def counts(self, matches=None):
+        """Facet counts over the video ids in matches, or the whole catalog if None"""
+        if matches is None:
+            channels = Counter({name: len(ids) for name, ids in self._channels.items()})
+            durations = {name: len(ids) for name, ids in self._durations.items()}
+        else:
+            durations = {name: len(ids & matches) for name, ids in self._durations.items()}
+            catalog_size = sum(map(len, self._durations.values()))
+            # Set intersections touch up to the whole catalog at C speed;
+            # counting per match is Python code, so it wins only for few matches
+            if len(matches) * PER_MATCH_COST < catalog_size + len(self._channels):
+                names = self._names
+                channels = Counter(names[video_id] for video_id in matches)
+            else:
+                channels = Counter({name: len(ids & matches) for name, ids in self._channels.items()})
+        return {
+            'channels': [
+                {'value': name, 'count': count}
+                for name, count in channels.most_common(MAX_CHANNEL_FACETS) if count
+            ],
+            'durations': [
+                {
+                    'value': name,
+                    'minDuration': shortest,
+                    'maxDuration': longest if longest != math.inf else None,
+                    'count': durations.get(name, 0),
+                }
+                for name, (shortest, longest) in DURATION_BUCKETS.items()
+            ],
+        }
@@ -0,0 +1,189 @@
+"""Conversions between stored numbers and the display strings clients see
+
+Records keep integer view/subscriber counts, durations in seconds and epoch
+timestamps. The "125K", "15:42" and "2 days ago" strings the frontend shows
+are produced at serialization time, so they can be sorted, incremented and
+never go stale. Stored records are the slotted classes of records.py.
+"""
+import math
+import re
+import time
+
+from records import Channel, Comment, Video, channels
+
+_SUFFIXES = {'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}
+
+_RELATIVE_RE = re.compile(r'(\d+)\s+(second|minute|hour|day|week|month|year)s?\s+ago')
+
+# (seconds per unit, unit name), largest first
+TIME_UNITS = (
+    (365 * 86400, 'year'),
+    (30 * 86400, 'month'),
+    (7 * 86400, 'week'),
+    (86400, 'day'),
+    (3600, 'hour'),
+    (60, 'minute'),
+)
+_UNIT_SECONDS = {name: seconds for seconds, name in TIME_UNITS}
+_UNIT_SECONDS['second'] = 1
+
+# Labels never change before this many seconds have passed
+JUST_NOW_SECONDS = 60
+
+VIDEO_DISPLAY_FIELDS = ('views', 'duration', 'uploadDate')
+
+
+def parse_count(text):
+    """'125K' -> 125000, '1.2M' -> 1200000, '89' -> 89; unknown -> 0"""
+    if isinstance(text, (int, float)):
+        return int(text)
+    text = str(text).strip().upper().replace(',', '')
+    multiplier = _SUFFIXES.get(text[-1:], 1)
+    if multiplier > 1:
+        text = text[:-1]
+    try:
+        return int(float(text) * multiplier)
+    except ValueError:
+        return 0
+
+
+def format_count(count):
+    """125000 -> '125K', 1234567 -> '1.2M', 999 -> '999'"""
+    for suffix, size in (('B', 1_000_000_000), ('M', 1_000_000), ('K', 1_000)):
+        if count >= size:
+            scaled = count / size
+            if scaled < 10:
+                # Truncate rather than round so 1999 never shows as 2K
+                return f"{int(scaled * 10) / 10:g}{suffix}"
+            return f"{int(scaled)}{suffix}"
+    return str(count)
+
+
+def parse_duration(text):
+    """'15:42' -> 942, '1:02:03' -> 3723; unknown -> 0"""
+    if isinstance(text, (int, float)):
+        return int(text)
+    seconds = 0
+    try:
+        for part in str(text).split(':'):
+            seconds = seconds * 60 + int(part)
+    except ValueError:
+        return 0
+    return seconds
+
+
+def format_duration(seconds):
+    """942 -> '15:42', 3723 -> '1:02:03'"""
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def parse_relative_time(text, now=None):
+    """'2 days ago' -> the epoch time two days before now"""
+    now = time.time() if now is None else now
+    if isinstance(text, (int, float)):
+        return float(text)
+    match = _RELATIVE_RE.search(str(text).lower())
+    if not match:
+        return now
+    return now - int(match.group(1)) * _UNIT_SECONDS[match.group(2)]
+
+
+def relative_time(timestamp, now):
+    """Return (label, expires_at): '2 days ago' and when that label changes"""
+    elapsed = max(0.0, now - timestamp)
+    if elapsed < JUST_NOW_SECONDS:
+        return "just now", timestamp + JUST_NOW_SECONDS
+    for unit_seconds, unit in TIME_UNITS:
+        if elapsed >= unit_seconds:
+            amount = int(elapsed // unit_seconds)
+            label = f"{amount} {unit}{'s' if amount != 1 else ''} ago"
+            return label, timestamp + (amount + 1) * unit_seconds
+
+
+def normalize_video(video, now=None):
+    """Stored form of a video: a Video with numeric fields instead of display strings
+
+    Accepts both the legacy display shape ('views': '125K', ...) and already
+    normalized records, so it is safe to apply more than once. The channel
+    is the shared Channel from records.channels.
+    """
+    now = time.time() if now is None else now
+    record = Video.from_items((key, value) for key, value in video.items() if key not in VIDEO_DISPLAY_FIELDS)
+    record.viewCount = int(video.get('viewCount', parse_count(video.get('views', 0))))
+    record.durationSeconds = int(video.get('durationSeconds', parse_duration(video.get('duration', 0))))
+    record.uploadedAt = float(video.get('uploadedAt', parse_relative_time(video.get('uploadDate'), now)))
+    channel = dict((video.get('channel') or {}).items())
+    channel['subscriberCount'] = int(channel.get('subscriberCount', parse_count(channel.pop('subscribers', 0))))
+    channel.pop('subscribers', None)
+    record.channel = channels.intern(channel)
+    return record
+
+
+def normalize_comment(comment, now=None):
+    """Stored form of a comment: a Comment with epoch postedAt instead of a timestamp label"""
+    now = time.time() if now is None else now
+    record = Comment.from_items((key, value) for key, value in comment.items() if key != 'timestamp')
+    record.likes = parse_count(comment.get('likes', 0))
+    record.postedAt = float(comment.get('postedAt', parse_relative_time(comment.get('timestamp'), now)))
+    return record
+
+
+def display_channel(channel):
+    """The channel as videos embed it in responses; shared Channels build it once
+
+    The result may be shared between payloads, so it must not be modified.
+    """
+    payload = getattr(channel, 'payload', None)
+    if payload is None:
+        payload = dict(channel.items(), subscribers=format_count(channel['subscriberCount']))
+        if isinstance(channel, Channel):
+            channel.payload = payload
+    return payload
+
+
+def display_video(video, now):
+    """Return (payload, expires_at): the record plus its display strings"""
+    upload_label, expires_at = relative_time(video['uploadedAt'], now)
+    payload = dict(video.items())
+    payload['views'] = format_count(video['viewCount'])
+    payload['duration'] = format_duration(video['durationSeconds'])
+    payload['uploadDate'] = upload_label
+    payload['channel'] = display_channel(video['channel'])
+    return payload, expires_at
+
+
+def display_video_fields(video, now, fields=None):
+    """display_video() restricted to fields, ((name, subfields or None), ...)
+
+    Only the requested values are built, so a narrow projection never copies
+    the whole record or formats labels it does not return.
+    """
+    if fields is None:
+        return display_video(video, now)
+    payload = {}
+    expires_at = math.inf
+    for name, subfields in fields:
+        if name == 'uploadDate':
+            payload[name], expires_at = relative_time(video['uploadedAt'], now)
+        elif name == 'views':
+            payload[name] = format_count(video['viewCount'])
+        elif name == 'duration':
+            payload[name] = format_duration(video['durationSeconds'])
+        elif name in video:
+            value = video[name]
+            if name == 'channel':
+                value = display_channel(value)
+            if subfields is not None and isinstance(value, dict):
+                value = {key: value[key] for key in subfields if key in value}
+            payload[name] = value
+    return payload, expires_at
+
+
+def display_comment(comment, now):
+    """Return (payload, expires_at): the record plus its timestamp label"""
+    label, expires_at = relative_time(comment['postedAt'], now)
+    return dict(comment.items(), timestamp=label), expires_at
@@ -0,0 +1,79 @@
+"""Pre-encoded JSON fragments for building list responses without jsonify"""
+import json
+import math
+
+from flask import current_app
+
+# Same output as Flask's default jsonify: sorted keys, compact, ASCII-escaped
+_encoder = json.JSONEncoder(ensure_ascii=True, sort_keys=True, separators=(',', ':'))
+
+
+def encode(record):
+    """Encode one record to the bytes jsonify would produce for it"""
+    return _encoder.encode(record).encode('ascii')
+
+
+def _as_is(record, now):
+    return record, math.inf
+
+
+class FragmentCache:
+    """Encoded bytes per record key, computed on first use
+
+    render(record, now) turns a stored record into its response payload and
+    says when that payload goes stale (e.g. when "2 hours ago" would become
+    "3 hours ago"). Entries are reused until then, or until invalidate() is
+    called because the underlying record changed.
+    """
+
+    def __init__(self, render=_as_is):
+        self._render = render
+        self._fragments = {}
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def get(self, key, record, now):
+        """Return (encoded bytes, expires_at) for record"""
+        entry = self._fragments.get(key)
+        if entry is None or entry[1] <= now:
+            payload, expires_at = self._render(record, now)
+            entry = self._fragments[key] = (encode(payload), expires_at)
+        return entry
+
+    def get_many(self, keyed_records, now):
+        """Return ([encoded bytes], earliest expires_at) for (key, record) pairs"""
+        get = self.get
+        entries = [get(key, record, now) for key, record in keyed_records]
+        return [entry[0] for entry in entries], min((entry[1] for entry in entries), default=math.inf)
+
+    def invalidate(self, key):
+        self._fragments.pop(key, None)
+
+    def clear(self):
+        self._fragments.clear()
+
+
+def json_response(fragment, status=200):
+    """Response for a single pre-encoded record"""
+    return current_app.response_class(fragment + b'\n', status=status, mimetype='application/json')
+
+
+def json_array(fragments):
+    """Encoded JSON array of pre-encoded values"""
+    return b'[' + b','.join(fragments) + b']'
+
+
+def json_object_response(members, status=200):
+    """Response for a JSON object whose member values are pre-encoded
+
+    Members are written in key order, as jsonify would.
+    """
+    body = b'{' + b','.join(encode(name) + b':' + value for name, value in sorted(members.items())) + b'}\n'
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+def json_list_response(fragments, status=200):
+    """Response for a JSON array assembled from pre-encoded records"""
+    body = b'[' + b','.join(fragments) + b']\n'
+    return current_app.response_class(body, status=status, mimetype='application/json')
@@ -0,0 +1,74 @@
+"""Resource versions and HTTP conditional request handling
+
+Write paths bump the version of every resource they change; read handlers
+answer If-None-Match / If-Modified-Since from the version alone, so an
+unchanged resource costs a 304 without ever being serialized.
+"""
+import threading
+import time
+import uuid
+
+from flask import current_app, request
+
+DEFAULT_CACHE_CONTROL = 'public, no-cache'
+
+
+class ResourceVersions:
+    """Monotonic version and modification time per resource key
+
+    Keys that were never bumped share version 0 and the creation time, so
+    tracking a million videos costs nothing until they change. The token is
+    unique per instance, which keeps ETags from different worker processes
+    (each with its own counters) from ever colliding.
+    """
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex[:12]
+        self.created = time.time()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (version, last_modified) for key"""
+        return self._versions.get(key, (0, self.created))
+
+    def bump(self, *keys):
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                version, _ = self._versions.get(key, (0, self.created))
+                self._versions[key] = (version + 1, now)
+
+
+def conditional(versions, key, build, cache_control=DEFAULT_CACHE_CONTROL):
+    """Answer with 304 if the client's copy of key is current, else build()
+
+    build is only called for a full response; the response gets a strong
+    ETag, Last-Modified and Cache-Control either way. If-None-Match uses
+    weak comparison, so the weak ETags of compressed copies match too.
+    """
+    return conditional_all(versions, [key], build, cache_control)
+
+
+def conditional_all(versions, keys, build, cache_control=DEFAULT_CACHE_CONTROL):
+    """conditional() for a response assembled from several resources
+
+    The ETag combines every key's version, so a change to any of them
+    makes the client's copy stale.
+    """
+    states = [versions.get(key) for key in keys]
+    etag = f"{versions.token}-{'.'.join(str(version) for version, _ in states)}"
+    modified = max(modified for _, modified in states)
+
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since:
+        fresh = int(modified) <= request.if_modified_since.timestamp()
+    else:
+        fresh = False
+
+    response = current_app.response_class(status=304) if fresh else build()
+    response.set_etag(etag)
+    response.last_modified = int(modified)
+    response.headers['Cache-Control'] = cache_control
+    return response
@@ -1,11 +1,33 @@
+import atexit
 import logging
 import sys
 import os
+import time
+from urllib.parse import urlsplit
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_content_range_header
 
-# Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from access_log import configure_logging, log_access, mark_request_start, request_latency, stop_logging
+from compression import CompressedBodies, compress_response
+from events import EventHub, event_stream_response
+from fragments import encode, json_array, json_list_response, json_object_response, json_response
+from http_cache import conditional, conditional_all
+from media import MEDIA_NAME_RE, media_response
+from media_jobs import MediaJobs
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics
+from pagination import NEXT_CURSOR_HEADER, PaginationError, page_size, requested_limit, with_next_cursor
+from projection import parse_fields
+from snapshot import SnapshotScheduler, snapshot_path
+from storage import create_backend
+from store import CatalogStore
+from suggest import DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS
+from uploads import UploadError, UploadManager
+
+# Setup logging: records are queued and written by a background thread.
+# LOG_LEVEL, ACCESS_LOG_SAMPLE and ACCESS_LOG_FORMAT tune it (see access_log.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -14,7 +36,9 @@ app = Flask(__name__)
 CORS(app, 
      origins=["http://localhost:3000", "http://127.0.0.1:3000", "http://localhost:3001"],
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-     allow_headers=["Content-Type", "Accept", "Authorization"],
+     allow_headers=["Content-Type", "Accept", "Authorization", "Content-Range", "X-Chunk-SHA256",
+                    "Range", "If-Range", "Last-Event-ID"],
+     expose_headers=[NEXT_CURSOR_HEADER, "Upload-Offset", "Content-Range", "Accept-Ranges"],
      supports_credentials=True)
 
 # Mock data for videos
@@ -135,15 +159,77 @@ comments_data = {
     ]
 }
 
-# Add request logging
+# Catalog store seeded with the mock data above; handlers go through it
+# rather than touching the module-level lists directly. Set
+# STORAGE_BACKEND=sqlite (and optionally STORAGE_PATH) to persist it.
+# New videos and comments are pushed to live streams through the event hub,
+# which also polls for other workers' writes while streams are idle.
+events = EventHub(poll=lambda: store.refresh())
+backend = create_backend()
+# A persistent catalog is also snapshotted (to SNAPSHOT_PATH, by default
+# next to the database) every SNAPSHOT_INTERVAL seconds and at shutdown, so
+# restarted workers start from the snapshot instead of reloading every row
+SNAPSHOT_FILE = snapshot_path(backend)
+store = CatalogStore(videos_data, comments_data, backend=backend, events=events, snapshot=SNAPSHOT_FILE)
+snapshots = None
+if SNAPSHOT_FILE:
+    snapshots = SnapshotScheduler(SNAPSHOT_FILE, lambda: store.write_snapshot(SNAPSHOT_FILE)).start()
+
+def shutdown():
+    """End live streams, finish media jobs, flush view counts and writes, snapshot, then the log queue"""
+    events.close()
+    media_jobs.close()
+    store.close()
+    if snapshots is not None:
+        snapshots.close()
+    stop_logging()
+
+atexit.register(shutdown)
+
+# Resumable chunked uploads land in MEDIA_PATH (default api/data/media)
+uploads = UploadManager()
+
+def save_media_job(video_id, job, info):
+    """Store a processing job on its video, with what probing found once it succeeds"""
+    fields = {"processing": job}
+    if info is not None:
+        fields["durationSeconds"] = int(round(info['durationSeconds']))
+        fields["media"] = {key: info[key] for key in ('width', 'height', 'videoCodec', 'audioCodec', 'faststart')
+                           if info.get(key) is not None}
+    store.update_video(video_id, fields)
+
+def load_media_job(video_id):
+    video = store.get_video(video_id)
+    return video.get('processing') if video is not None else None
+
+# Probing and faststart rewriting of uploads run in child processes; job
+# state is kept on the video so any worker can answer for it
+media_jobs = MediaJobs(save_media_job, load_media_job)
+
+# Request counts, latency histograms and catalog sizes for /api/metrics
+metrics = Metrics()
+metrics.gauge('catalog_videos', 'Videos in the catalog.', lambda: len(store))
+metrics.gauge('catalog_comments', 'Comments in the catalog.', lambda: store.comment_count())
+metrics.gauge('event_subscribers', 'Open live event streams.', lambda: len(events))
+
+# Compressed bodies of versioned responses, reused until the version changes
+compressed_bodies = CompressedBodies()
+metrics.gauge('compressed_cache_bytes', 'Bytes of compressed response bodies cached.',
+              lambda: compressed_bodies.size)
+
+# Add request logging: one access record per request
 @app.before_request
 def log_request():
-    logger.info(f"📨 {request.method} {request.path} from {request.remote_addr}")
+    mark_request_start()
+    metrics.request_started()
+    store.refresh()
 
 @app.after_request
 def after_request(response):
-    logger.info(f"📤 Response: {response.status_code}")
-    return response
+    response = compress_response(response, compressed_bodies)
+    latency = request_latency()
+    metrics.request_finished(response, latency)
+    return log_access(response, latency)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -155,141 +241,656 @@ def health_check():
         "endpoints": [
             "GET /api/health",
             "GET /api/videos",
+            "GET /api/suggest",
+            "GET /api/videos/stream",
             "GET /api/videos/<id>",
+            "GET /api/videos/<id>/related",
+            "GET /api/watch/<id>",
             "GET /api/videos/<id>/comments",
             "POST /api/videos/<id>/comments",
-            "POST /api/upload"
+            "GET /api/videos/<id>/comments/stream",
+            "GET /api/videos/<id>/comments/<comment_id>/replies",
+            "POST /api/videos/<id>/comments/<comment_id>/like",
+            "POST /api/videos/<id>/view",
+            "POST /api/upload",
+            "POST /api/uploads",
+            "PUT /api/uploads/<id>",
+            "GET /api/uploads/<id>",
+            "POST /api/uploads/<id>/finalize",
+            "GET /api/media/<file>",
+            "GET /api/videos/<id>/processing",
+            "GET /api/metrics",
+            "POST /api/batch"
         ]
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics for this worker process"""
+    return app.response_class(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+# get_videos filter parameter -> value type; channel may be repeated
+VIDEO_FILTERS = {
+    'minDuration': int,
+    'maxDuration': int,
+    'uploadedAfter': float,
+    'uploadedBefore': float,
+    'minViews': int,
+}
+
+def listing_json(videos):
+    """(fragments, shared) for a video listing, shaped by ?fields= and ?compact=1
+
+    shared is the encoded table compact fragments refer to, or None.
+    """
+    fields = parse_fields(request.args.get('fields'))
+    compact = request.args.get('compact', '').lower() in ('1', 'true')
+    if fields is None and not compact:
+        return store.videos_json(videos), None
+    return store.projected_videos_json(videos, fields, compact)
+
+def listing_response(videos):
+    """JSON array of videos, or {videos, shared} when compact"""
+    fragments, shared = listing_json(videos)
+    if shared is None:
+        return json_list_response(fragments)
+    return json_object_response({'videos': json_array(fragments), 'shared': shared})
+
+def video_filters(args):
+    """Filters for store.filter_videos() from the query string"""
+    filters = {name: args.get(name, type=kind) for name, kind in VIDEO_FILTERS.items()}
+    filters = {name: value for name, value in filters.items() if value is not None}
+    channels = args.getlist('channel')
+    if channels:
+        filters['channels'] = channels
+    return filters
+
 @app.route('/api/videos', methods=['GET'])
 def get_videos():
-    """Get all videos or search videos"""
+    """Get all videos or search videos
+
+    Passing limit, cursor or sort pages the results; the cursor for the next
+    page is returned in the X-Next-Cursor header. Filtering by channel,
+    minDuration/maxDuration, uploadedAfter/uploadedBefore or minViews (or
+    passing facets=1) returns {videos, total, facets, nextCursor} instead
+    of a list. fields= and compact=1 shape the videos (see projection.py);
+    compact responses add the shared table they refer to.
+    """
     try:
-        search_query = request.args.get('search', '').lower().strip()
+        search_query = request.args.get('search', '').strip()
+        limit = requested_limit(request.args)
+        cursor = request.args.get('cursor')
+        sort = request.args.get('sort')
+        filters = video_filters(request.args)
+        
+        if filters or request.args.get('facets'):
+            if search_query:
+                return jsonify({"error": "Filters cannot be combined with search"}), 400
+            
+            def build_filtered():
+                videos, next_cursor, total, facets = store.filter_videos(filters, sort, page_size(limit), cursor)
+                logger.debug("📊 Returning %s of %s videos matching %s", len(videos), total, filters)
+                fragments, shared = listing_json(videos)
+                members = {
+                    'videos': json_array(fragments),
+                    'total': encode(total),
+                    'facets': encode(facets),
+                    'nextCursor': encode(next_cursor),
+                }
+                if shared is not None:
+                    members['shared'] = shared
+                return with_next_cursor(json_object_response(members), next_cursor)
+            
+            return conditional(store.versions, 'videos', build_filtered)
         
         if search_query:
-            logger.info(f"🔍 Searching for: {search_query}")
-            filtered_videos = [
-                video for video in videos_data 
-                if (search_query in video['title'].lower() or 
-                    search_query in video['description'].lower() or
-                    search_query in video['channel']['name'].lower())
-            ]
-            logger.info(f"📊 Found {len(filtered_videos)} videos matching '{search_query}'")
-            return jsonify(filtered_videos)
-        
-        logger.info(f"📊 Returning all {len(videos_data)} videos")
-        return jsonify(videos_data)
+            logger.debug("🔍 Searching for: %s", search_query)
+            
+            def build_results():
+                filtered_videos, next_cursor = store.page_search(search_query, limit=limit, cursor=cursor)
+                logger.debug("📊 Found %s videos matching '%s'", len(filtered_videos), search_query)
+                return with_next_cursor(listing_response(filtered_videos), next_cursor)
+            
+            return conditional(store.versions, 'videos', build_results)
         
+        if limit is not None or cursor or sort:
+            def build_page():
+                videos, next_cursor = store.page_videos(sort, page_size(limit), cursor)
+                logger.debug("📊 Returning a page of %s videos", len(videos))
+                return with_next_cursor(listing_response(videos), next_cursor)
+            
+            return conditional(store.versions, 'videos', build_page)
+        
+        def build_list():
+            videos = store.list_videos()
+            logger.debug("📊 Returning all %s videos", len(videos))
+            return listing_response(videos)
+        
+        return conditional(store.versions, 'videos', build_list)
+        
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        logger.error(f"❌ Error in get_videos: {str(e)}")
+        logger.error("❌ Error in get_videos: %s", e)
         return jsonify({"error": "Failed to fetch videos", "details": str(e)}), 500
 
+@app.route('/api/suggest', methods=['GET'])
+def suggest():
+    """Search-as-you-type completions for q: the most viewed matching titles and channels (limit)"""
+    try:
+        query = request.args.get('q', '')
+        limit = requested_limit(request.args)
+        limit = DEFAULT_SUGGESTIONS if limit is None else max(1, min(limit, MAX_SUGGESTIONS))
+        
+        def build_suggestions():
+            return json_list_response(store.suggest(query, limit))
+        
+        # Completions may lag the catalog by a rebuild interval anyway
+        return conditional(store.versions, 'suggestions', build_suggestions, cache_control='public, max-age=60')
+        
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error("❌ Error in suggest: %s", e)
+        return jsonify({"error": "Failed to fetch suggestions", "details": str(e)}), 500
+
+@app.route('/api/videos/stream', methods=['GET'])
+def stream_videos():
+    """Live stream (server-sent events) of newly uploaded videos
+
+    Each 'video' event carries the video as /api/videos lists it. Resume
+    with Last-Event-ID (or ?lastEventId=); a 'reset' event means the gap
+    is too old to replay and the listing should be refetched.
+    """
+    try:
+        return event_stream_response(events, 'videos', store.newest_event_id('videos'))
+        
+    except Exception as e:
+        logger.error("❌ Error in stream_videos: %s", e)
+        return jsonify({"error": "Failed to open video stream", "details": str(e)}), 500
+
 @app.route('/api/videos/<video_id>', methods=['GET'])
 def get_video(video_id):
     """Get a specific video by ID"""
     try:
-        logger.info(f"🎥 Fetching video with ID: {video_id}")
-        video = next((v for v in videos_data if v['id'] == video_id), None)
+        logger.debug("🎥 Fetching video with ID: %s", video_id)
+        video = store.get_video(video_id)
         
         if video:
-            logger.info(f"✅ Found video: {video['title']}")
-            return jsonify(video)
+            logger.debug("✅ Found video: %s", video['title'])
+            return conditional(store.versions, ('video', video_id), lambda: json_response(store.video_json(video)))
         
-        logger.warning(f"⚠️  Video not found: {video_id}")
+        logger.warning("⚠️  Video not found: %s", video_id)
         return jsonify({'error': f'Video with ID {video_id} not found'}), 404
         
     except Exception as e:
-        logger.error(f"❌ Error in get_video: {str(e)}")
+        logger.error("❌ Error in get_video: %s", e)
         return jsonify({"error": "Failed to fetch video", "details": str(e)}), 500
 
+@app.route('/api/videos/<video_id>/related', methods=['GET'])
+def get_related_videos(video_id):
+    """Videos similar to a video by title, channel and description (limit; fields, compact as for get_videos)"""
+    try:
+        if store.get_video(video_id) is None:
+            return jsonify({'error': f'Video with ID {video_id} not found'}), 404
+        
+        limit = page_size(requested_limit(request.args))
+        
+        def build_related():
+            related = store.related_videos(video_id, limit)
+            logger.debug("🔗 Returning %s related videos for %s", len(related), video_id)
+            return listing_response(related)
+        
+        return conditional(store.versions, 'videos', build_related)
+        
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error("❌ Error in get_related_videos: %s", e)
+        return jsonify({"error": "Failed to fetch related videos", "details": str(e)}), 500
+
+@app.route('/api/watch/<video_id>', methods=['GET'])
+def get_watch_page(video_id):
+    """Everything the watch page shows, in one response
+
+    Returns the video, the first page of its comments (commentLimit,
+    commentSort) with commentsNextCursor for the next one, and related
+    videos (relatedLimit).
+    """
+    try:
+        video = store.get_video(video_id)
+        if video is None:
+            return jsonify({'error': f'Video with ID {video_id} not found'}), 404
+        
+        comment_limit = page_size(requested_limit(request.args, 'commentLimit'))
+        comment_sort = request.args.get('commentSort')
+        related_limit = page_size(requested_limit(request.args, 'relatedLimit'))
+        
+        def build_watch_page():
+            comments, next_cursor = store.page_comments(video_id, comment_sort, comment_limit)
+            related = store.related_videos(video_id, related_limit)
+            return json_object_response({
+                'video': store.video_json(video),
+                'comments': json_array(store.comments_json(video_id, comments)),
+                'commentsNextCursor': encode(next_cursor),
+                'related': json_array(store.videos_json(related)),
+            })
+        
+        return conditional_all(store.versions, [('video', video_id), ('comments', video_id), 'videos'],
+                               build_watch_page)
+        
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error("❌ Error in get_watch_page: %s", e)
+        return jsonify({"error": "Failed to fetch watch page", "details": str(e)}), 500
+
 @app.route('/api/videos/<video_id>/comments', methods=['GET'])
 def get_comments(video_id):
-    """Get comments for a specific video"""
+    """Get comments for a specific video
+
+    Passing limit, cursor or sort (oldest, newest, top) pages the top-level
+    comments; replies are fetched per comment from .../replies.
+    """
     try:
-        logger.info(f"💬 Fetching comments for video: {video_id}")
-        comments = comments_data.get(video_id, [])
-        logger.info(f"📊 Found {len(comments)} comments")
-        return jsonify(comments)
+        logger.debug("💬 Fetching comments for video: %s", video_id)
+        limit = requested_limit(request.args)
+        cursor = request.args.get('cursor')
+        sort = request.args.get('sort')
+        
+        if limit is not None or cursor or sort:
+            def build_page():
+                comments, next_cursor = store.page_comments(video_id, sort, page_size(limit), cursor)
+                logger.debug("📊 Returning a page of %s comments", len(comments))
+                return with_next_cursor(json_list_response(store.comments_json(video_id, comments)), next_cursor)
+            
+            return conditional(store.versions, ('comments', video_id), build_page)
+        
+        def build_comments():
+            comments = store.get_comments(video_id)
+            logger.debug("📊 Found %s comments", len(comments))
+            return json_list_response(store.comments_json(video_id, comments))
         
+        return conditional(store.versions, ('comments', video_id), build_comments)
+        
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        logger.error(f"❌ Error in get_comments: {str(e)}")
+        logger.error("❌ Error in get_comments: %s", e)
         return jsonify({"error": "Failed to fetch comments", "details": str(e)}), 500
 
+@app.route('/api/videos/<video_id>/comments/stream', methods=['GET'])
+def stream_comments(video_id):
+    """Live stream (server-sent events) of comments and replies posted on a video"""
+    try:
+        if store.get_video(video_id) is None:
+            return jsonify({'error': f'Video with ID {video_id} not found'}), 404
+        
+        channel = ('comments', video_id)
+        return event_stream_response(events, channel, store.newest_event_id(channel))
+        
+    except Exception as e:
+        logger.error("❌ Error in stream_comments: %s", e)
+        return jsonify({"error": "Failed to open comment stream", "details": str(e)}), 500
+
 @app.route('/api/videos/<video_id>/comments', methods=['POST'])
 def add_comment(video_id):
     """Add a new comment to a video"""
     try:
         data = request.get_json()
-        logger.info(f"💬 Adding comment to video: {video_id}")
+        logger.debug("💬 Adding comment to video: %s", video_id)
         
         if not data or not data.get('content'):
             return jsonify({"error": "Comment content is required"}), 400
         
-        if video_id not in comments_data:
-            comments_data[video_id] = []
-        
-        new_comment = {
-            "id": f"c{len(comments_data[video_id]) + 1}",
+        fields = {
             "author": data.get('author', 'Anonymous'),
             "avatar": "/placeholder.svg?height=32&width=32",
             "content": data.get('content', ''),
-            "timestamp": "just now",
+            "postedAt": time.time(),
             "likes": 0
         }
+        parent_id = data.get('parentId')
+        if parent_id:
+            parent = store.get_comment(video_id, parent_id)
+            if parent is None:
+                return jsonify({"error": f"Comment {parent_id} not found on video {video_id}"}), 400
+            # Replies to replies join the top-level comment's thread
+            fields["parentId"] = parent.get('parentId') or parent_id
         
-        comments_data[video_id].append(new_comment)
-        logger.info(f"✅ Comment added successfully")
-        return jsonify(new_comment), 201
+        new_comment = store.add_comment(video_id, fields)
+        logger.debug("✅ Comment added successfully")
+        return json_response(store.comment_json(video_id, new_comment), status=201)
         
     except Exception as e:
-        logger.error(f"❌ Error in add_comment: {str(e)}")
+        logger.error("❌ Error in add_comment: %s", e)
         return jsonify({"error": "Failed to add comment", "details": str(e)}), 500
 
+@app.route('/api/videos/<video_id>/comments/<comment_id>/replies', methods=['GET'])
+def get_replies(video_id, comment_id):
+    """Get one page of the replies to a comment (limit, cursor, sort as for comments)"""
+    try:
+        if store.get_comment(video_id, comment_id) is None:
+            return jsonify({"error": f"Comment {comment_id} not found on video {video_id}"}), 404
+        limit = requested_limit(request.args)
+        cursor = request.args.get('cursor')
+        sort = request.args.get('sort')
+        
+        def build_page():
+            replies, next_cursor = store.page_replies(comment_id, sort, page_size(limit), cursor)
+            logger.debug("📊 Returning a page of %s replies to %s", len(replies), comment_id)
+            return with_next_cursor(json_list_response(store.comments_json(video_id, replies)), next_cursor)
+        
+        return conditional(store.versions, ('comments', video_id), build_page)
+        
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error("❌ Error in get_replies: %s", e)
+        return jsonify({"error": "Failed to fetch replies", "details": str(e)}), 500
+
+@app.route('/api/videos/<video_id>/comments/<comment_id>/like', methods=['POST'])
+def like_comment(video_id, comment_id):
+    """Like a comment; totals and the top ranking are updated in batches"""
+    try:
+        if store.get_comment(video_id, comment_id) is None:
+            return jsonify({"error": f"Comment {comment_id} not found on video {video_id}"}), 404
+        
+        return jsonify({"id": comment_id, "likes": store.like_comment(comment_id)})
+        
+    except Exception as e:
+        logger.error("❌ Error in like_comment: %s", e)
+        return jsonify({"error": "Failed to like comment", "details": str(e)}), 500
+
+@app.route('/api/videos/<video_id>/view', methods=['POST'])
+def record_view(video_id):
+    """Count a view of a video; totals are updated in batches"""
+    try:
+        if store.get_video(video_id) is None:
+            return jsonify({'error': f'Video with ID {video_id} not found'}), 404
+        
+        store.record_view(video_id)
+        return jsonify({"status": "accepted"}), 202
+        
+    except Exception as e:
+        logger.error("❌ Error in record_view: %s", e)
+        return jsonify({"error": "Failed to record view", "details": str(e)}), 500
+
+def new_video_fields(title, description, channel, video_url):
+    """Stored fields of a video uploaded through the API"""
+    return {
+        "title": title,
+        "description": description,
+        "thumbnail": "/placeholder.svg?height=180&width=320",
+        "durationSeconds": 0,
+        "viewCount": 0,
+        "uploadedAt": time.time(),
+        "channel": {
+            "name": channel,
+            "avatar": "/placeholder.svg?height=40&width=40",
+            "subscriberCount": 1000
+        },
+        "videoUrl": video_url
+    }
+
 @app.route('/api/upload', methods=['POST'])
 def upload_video():
     """Upload a new video"""
     try:
         data = request.get_json()
-        logger.info("📤 Processing video upload")
+        logger.debug("📤 Processing video upload")
         
         if not data or not data.get('title'):
             return jsonify({"error": "Video title is required"}), 400
         
-        new_video = {
-            "id": str(len(videos_data) + 1),
-            "title": data.get('title', 'Untitled Video'),
-            "description": data.get('description', ''),
-            "thumbnail": "/placeholder.svg?height=180&width=320",
-            "duration": "0:00",
-            "views": "0",
-            "uploadDate": "just now",
-            "channel": {
-                "name": data.get('channel', 'Your Channel'),
-                "avatar": "/placeholder.svg?height=40&width=40",
-                "subscribers": "1K"
-            },
-            "videoUrl": data.get('videoUrl', '')
-        }
-        
-        videos_data.append(new_video)
-        logger.info(f"✅ Video uploaded: {new_video['title']}")
-        return jsonify(new_video), 201
+        new_video = store.add_video(new_video_fields(
+            data.get('title', 'Untitled Video'),
+            data.get('description', ''),
+            data.get('channel', 'Your Channel'),
+            data.get('videoUrl', '')
+        ))
+        logger.debug("✅ Video uploaded: %s", new_video['title'])
+        return json_response(store.video_json(new_video), status=201)
         
     except Exception as e:
-        logger.error(f"❌ Error in upload_video: {str(e)}")
+        logger.error("❌ Error in upload_video: %s", e)
         return jsonify({"error": "Failed to upload video", "details": str(e)}), 500
 
+@app.route('/api/videos/<video_id>/processing', methods=['GET'])
+def get_processing(video_id):
+    """Status of the post-upload processing job for a video"""
+    job = media_jobs.status(video_id)
+    if job is None:
+        return jsonify({"error": "No processing job for this video"}), 404
+    response = jsonify(job)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/media/<name>', methods=['GET'])
+def get_media(name):
+    """Stream an uploaded media file, honouring Range requests"""
+    try:
+        path = uploads.media_path(name)
+        if not MEDIA_NAME_RE.match(name) or not os.path.isfile(path):
+            return jsonify({"error": "Media not found"}), 404
+        return media_response(path)
+        
+    except Exception as e:
+        logger.error("❌ Error in get_media: %s", e)
+        return jsonify({"error": "Failed to serve media", "details": str(e)}), 500
+
+def upload_error(error):
+    """JSON response for an UploadError, with the offset to resume from"""
+    body = {"error": str(error)}
+    if error.offset is not None:
+        body["offset"] = error.offset
+    response = jsonify(body)
+    response.status_code = error.status
+    if error.offset is not None:
+        response.headers['Upload-Offset'] = str(error.offset)
+    return response
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable chunked upload session"""
+    try:
+        data = request.get_json(silent=True)
+        if not data or not data.get('title'):
+            return jsonify({"error": "Video title is required"}), 400
+        
+        upload = uploads.create(
+            data['title'],
+            data.get('description', ''),
+            data.get('channel', 'Your Channel'),
+            data.get('size'),
+            data.get('filename', '')
+        )
+        logger.debug("📤 Upload session %s created", upload['uploadId'])
+        response = jsonify(upload)
+        response.status_code = 201
+        response.headers['Location'] = f"/api/uploads/{upload['uploadId']}"
+        return response
+        
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        logger.error("❌ Error in create_upload: %s", e)
+        return jsonify({"error": "Failed to create upload", "details": str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Upload progress: the offset to resume from"""
+    try:
+        upload = uploads.status(upload_id)
+        response = jsonify(upload)
+        response.headers['Upload-Offset'] = str(upload['offset'])
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+        
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        logger.error("❌ Error in get_upload: %s", e)
+        return jsonify({"error": "Failed to fetch upload", "details": str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Append a chunk (Content-Range: bytes start-end/total) to an upload"""
+    try:
+        content_range = request.headers.get('Content-Range')
+        start = total = None
+        length = request.content_length
+        if content_range:
+            parsed = parse_content_range_header(content_range)
+            if parsed is None or parsed.units != 'bytes':
+                return jsonify({"error": "Invalid Content-Range header"}), 400
+            start, total = parsed.start, parsed.length
+            if length is not None and length != parsed.stop - parsed.start:
+                return jsonify({"error": "Content-Length does not match Content-Range"}), 400
+            length = parsed.stop - parsed.start
+        if length is None:
+            return jsonify({"error": "Content-Length or Content-Range is required"}), 411
+        
+        # Read the body as a stream: request.data would buffer the whole chunk
+        offset = uploads.write(upload_id, request.stream, length, start, total,
+                               request.headers.get('X-Chunk-SHA256'))
+        response = jsonify({"uploadId": upload_id, "offset": offset})
+        response.headers['Upload-Offset'] = str(offset)
+        return response
+        
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        logger.error("❌ Error in upload_chunk: %s", e)
+        return jsonify({"error": "Failed to store chunk", "details": str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """Verify a complete upload, publish the file and register the video"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        def register(session):
+            video = store.add_video(new_video_fields(
+                session['title'],
+                session['description'],
+                session['channel'],
+                f"/api/media/{session['mediaFile']}"
+            ))
+            return video['id']
+        
+        session, created = uploads.finalize(upload_id, register, data.get('checksum'))
+        video = store.get_video(session['videoId'])
+        if video is None:
+            return jsonify({"error": "Video not found"}), 404
+        if created:
+            media_jobs.submit(video['id'], uploads.media_path(session['mediaFile']))
+        logger.debug("✅ Upload %s finalized as video %s", upload_id, video['id'])
+        return json_response(store.video_json(video), status=201 if created else 200)
+        
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        logger.error("❌ Error in finalize_upload: %s", e)
+        return jsonify({"error": "Failed to finalize upload", "details": str(e)}), 500
+
+# Sub-requests per /api/batch call
+MAX_BATCH_REQUESTS = 25
+# Endpoints a batch cannot run: streams, non-JSON bodies and batch itself
+BATCH_EXCLUDED_ENDPOINTS = {'stream_videos', 'stream_comments', 'get_media', 'get_metrics', 'batch'}
+# Sub-response headers passed back to the client
+BATCH_HEADERS = ('ETag', 'Last-Modified', NEXT_CURSOR_HEADER)
+
+def batch_error(path, status, message):
+    return json_object_response({
+        'path': encode(path), 'status': encode(status), 'headers': b'{}', 'body': encode({"error": message}),
+    })
+
+def run_batch_request(item):
+    """Run one GET sub-request of a batch; return its encoded result object"""
+    if isinstance(item, str):
+        item = {'path': item}
+    path = item.get('path') if isinstance(item, dict) else None
+    headers = item.get('headers') or {}
+    if not isinstance(path, str) or not path.startswith('/api/') or not isinstance(headers, dict):
+        return batch_error(path, 400, "Each request needs a path starting with /api/ and optional headers")
+    
+    url = urlsplit(path)
+    with app.test_request_context(url.path, method='GET', query_string=url.query, headers=headers):
+        if request.routing_exception is not None:
+            error = request.routing_exception
+            return batch_error(path, getattr(error, 'code', 400), getattr(error, 'description', str(error)))
+        endpoint = request.url_rule.endpoint
+        if endpoint in BATCH_EXCLUDED_ENDPOINTS:
+            return batch_error(path, 400, f"{url.path} cannot be batched")
+        try:
+            response = app.make_response(app.view_functions[endpoint](**request.view_args))
+        except HTTPException as e:
+            return batch_error(path, e.code, e.description)
+    
+    body = response.get_data()
+    if not body:
+        body = b'null'
+    elif not response.is_json:
+        body = encode(response.get_data(as_text=True))
+    return json_object_response({
+        'path': encode(path),
+        'status': encode(response.status_code),
+        'headers': encode({name: response.headers[name] for name in BATCH_HEADERS if name in response.headers}),
+        'body': body.rstrip(b'\n'),
+    })
+
+@app.route('/api/batch', methods=['POST'])
+def batch():
+    """Run several read requests in one round trip
+
+    Body: {"requests": ["/api/videos/1", {"path": "/api/videos/1/comments?limit=5",
+    "headers": {"If-None-Match": "..."}}]}. Only GET routes can be batched.
+    Returns {"responses": [{"path", "status", "headers", "body"}]} in
+    request order; headers holds the ETag, Last-Modified and next-page
+    cursor of each sub-response.
+    """
+    try:
+        data = request.get_json(silent=True)
+        items = data.get('requests') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "Body must be {\"requests\": [...]}"}), 400
+        if len(items) > MAX_BATCH_REQUESTS:
+            return jsonify({"error": f"At most {MAX_BATCH_REQUESTS} requests per batch"}), 400
+        
+        logger.debug("📦 Running a batch of %s requests", len(items))
+        responses = [run_batch_request(item).get_data().rstrip(b'\n') for item in items]
+        return json_object_response({'responses': json_array(responses)})
+        
+    except Exception as e:
+        logger.error("❌ Error in batch: %s", e)
+        return jsonify({"error": "Failed to run batch", "details": str(e)}), 500
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({"error": "Endpoint not found", "available_endpoints": [
         "GET /api/health",
         "GET /api/videos", 
+        "GET /api/suggest",
+        "GET /api/videos/stream",
         "GET /api/videos/<id>",
+        "GET /api/videos/<id>/related",
+        "GET /api/watch/<id>",
         "GET /api/videos/<id>/comments",
         "POST /api/videos/<id>/comments",
-        "POST /api/upload"
+        "GET /api/videos/<id>/comments/stream",
+        "GET /api/videos/<id>/comments/<comment_id>/replies",
+        "POST /api/videos/<id>/comments/<comment_id>/like",
+        "POST /api/videos/<id>/view",
+        "POST /api/upload",
+        "POST /api/uploads",
+        "PUT /api/uploads/<id>",
+        "GET /api/uploads/<id>",
+        "POST /api/uploads/<id>/finalize",
+        "GET /api/media/<file>",
+        "GET /api/videos/<id>/processing",
+        "GET /api/metrics",
+        "POST /api/batch"
     ]}), 404
 
 @app.errorhandler(500)
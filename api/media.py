@@ -0,0 +1,155 @@
+"""Byte-range media responses with zero-copy transfer
+
+media_response() answers Range / If-Range / conditional GETs for a file on
+disk: 200 for the whole file, 206 for one range, multipart/byteranges for
+several, 416 when nothing is satisfiable. The body is sent, in order of
+preference:
+
+- with socket.sendfile() on the client connection when the server exposes it
+  (werkzeug's servers, including start_backend.py --production), so the
+  kernel copies file pages straight to the socket;
+- through the server's wsgi.file_wrapper for whole-file responses
+  (gunicorn, uWSGI, mod_wsgi do their own sendfile);
+- otherwise as fixed-size slices of an mmap of the file.
+"""
+import mimetypes
+import mmap
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+
+from flask import current_app, request
+from werkzeug.http import is_resource_modified, parse_date
+
+BLOCK_SIZE = 256 * 1024
+# More ranges than this (after merging) are answered with the whole file
+MAX_RANGES = 16
+CACHE_CONTROL = 'public, max-age=3600'
+
+MEDIA_NAME_RE = re.compile(r'^[0-9a-f]{32}(\.[a-z0-9]{1,8})?$')
+
+
+def _satisfiable_ranges(header_ranges, size):
+    """Clamp (start, stop) pairs to size, drop empty ones, merge overlaps"""
+    ranges = []
+    for start, stop in header_ranges:
+        if start < 0:
+            start, stop = max(0, size + start), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+    ranges.sort()
+    merged = []
+    for start, stop in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _if_range_matches(etag, modified):
+    """True if the If-Range validator (if any) still names this file"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    date = parse_date(if_range)
+    return date is not None and int(date.timestamp()) == modified
+
+
+def _mmap_body(path, parts):
+    """Yield the body from an mmap of path; parts are bytes or (start, stop)"""
+    with open(path, 'rb') as f:
+        view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+        try:
+            for part in parts:
+                if isinstance(part, bytes):
+                    yield part
+                    continue
+                start, stop = part
+                for offset in range(start, stop, BLOCK_SIZE):
+                    yield view[offset:min(offset + BLOCK_SIZE, stop)]
+        finally:
+            if isinstance(view, mmap.mmap):
+                view.close()
+
+
+def _sendfile_body(path, parts, sock):
+    """Yield headers and separators; copy file ranges with socket.sendfile()"""
+    with open(path, 'rb') as f:
+        # The empty chunk makes the server send the status line and headers
+        yield b''
+        for part in parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                start, stop = part
+                sock.sendfile(f, start, stop - start)
+
+
+def _body(path, parts, size, environ):
+    sock = environ.get('werkzeug.socket')
+    if sock is not None and hasattr(sock, 'sendfile'):
+        return _sendfile_body(path, parts, sock)
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None and parts == [(0, size)]:
+        return file_wrapper(open(path, 'rb'), BLOCK_SIZE)
+    return _mmap_body(path, parts)
+
+
+def media_response(path):
+    """Response serving the file at path for the current request"""
+    stat = os.stat(path)
+    size, modified = stat.st_size, int(stat.st_mtime)
+    etag = f'"{stat.st_ino:x}-{size:x}-{stat.st_mtime_ns:x}"'
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    response = current_app.response_class(mimetype=mimetype, direct_passthrough=True)
+    response.headers['ETag'] = etag
+    response.last_modified = modified
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = CACHE_CONTROL
+
+    last_modified = datetime.fromtimestamp(modified, timezone.utc)
+    if not is_resource_modified(request.environ, etag=etag.strip('"'), last_modified=last_modified):
+        response.status_code = 304
+        return response
+
+    ranges = None
+    if request.range is not None and request.range.units == 'bytes' and _if_range_matches(etag, modified):
+        ranges = _satisfiable_ranges(request.range.ranges, size)
+        if not ranges:
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+        if len(ranges) > MAX_RANGES:
+            ranges = None
+
+    if ranges is None:
+        parts = [(0, size)]
+        length = size
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        parts = ranges
+        length = stop - start
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    else:
+        boundary = uuid.uuid4().hex
+        parts = []
+        for start, stop in ranges:
+            parts.append((f'\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n'
+                          f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('latin-1'))
+            parts.append((start, stop))
+        parts.append(f'\r\n--{boundary}--\r\n'.encode('latin-1'))
+        length = sum(len(part) if isinstance(part, bytes) else part[1] - part[0] for part in parts)
+        response.status_code = 206
+        response.headers['Content-Type'] = f'multipart/byteranges; boundary={boundary}'
+
+    response.content_length = length
+    if request.method != 'HEAD':
+        response.response = _body(path, parts, size, request.environ)
+    return response
@@ -0,0 +1,112 @@
+"""Post-upload media processing in child processes
+
+Probing and the faststart rewrite are CPU and I/O heavy, so each job runs
+mp4.py in a fresh interpreter, started from a small thread pool that bounds
+how many run at once. Nothing is forked from the multithreaded server, and
+the app module is never re-imported the way a spawn or forkserver pool
+would. Job state is stored on the video record through the store, so every
+worker process can report it.
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mp4 import Mp4Error
+
+logger = logging.getLogger(__name__)
+
+MEDIA_WORKERS = int(os.environ.get('MEDIA_WORKERS', '2'))
+MP4_EXTENSIONS = {'.mp4', '.m4v', '.mov'}
+MP4_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mp4.py')
+# Exit status mp4.py uses for a file it cannot process
+MP4_ERROR_STATUS = 2
+
+
+def run_process_media(path):
+    """process_media(path) in a child process; raises Mp4Error for a bad file"""
+    result = subprocess.run([sys.executable, MP4_SCRIPT, path], capture_output=True, text=True)
+    if result.returncode == MP4_ERROR_STATUS:
+        raise Mp4Error(result.stderr.strip())
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip()
+                           else f"mp4.py exited with status {result.returncode}")
+    return json.loads(result.stdout)
+
+
+class MediaJobs:
+    """Runs process_media() for uploaded files and reports their status
+
+    save(video_id, job, info) stores a job's state, with the probe result as
+    info once it succeeds; load(video_id) returns the stored job or None.
+    Jobs are keyed by video id; a new job replaces the old one.
+    """
+
+    def __init__(self, save, load, workers=MEDIA_WORKERS):
+        self._save = save
+        self._load = load
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='media-job')
+        return self._executor
+
+    def submit(self, video_id, path):
+        """Queue processing of the media file at path for video_id"""
+        job = {
+            'state': 'queued',
+            'submittedAt': time.time(),
+            'finishedAt': None,
+            'result': None,
+            'error': None,
+        }
+        if os.path.splitext(path)[1].lower() not in MP4_EXTENSIONS:
+            job.update(state='skipped', finishedAt=job['submittedAt'], error="Not an MP4 file")
+            self._save(video_id, job, None)
+            return job
+        self._save(video_id, job, None)
+        with self._lock:
+            self._pool().submit(self._run, video_id, dict(job), path)
+        return job
+
+    def _run(self, video_id, job, path):
+        job['state'] = 'running'
+        self._save(video_id, job, None)
+        info = None
+        try:
+            info = run_process_media(path)
+            job.update(state='done', result=info)
+        except Mp4Error as e:
+            job.update(state='failed', error=str(e))
+        except Exception as e:
+            logger.error("❌ Media processing failed for video %s: %s", video_id, e)
+            job.update(state='failed', error=str(e))
+        job['finishedAt'] = time.time()
+        try:
+            self._save(video_id, job, info)
+        except Exception as e:
+            logger.error("❌ Could not store media processing result for video %s: %s", video_id, e)
+
+    def status(self, video_id):
+        """The job for video_id as a dict, or None"""
+        job = self._load(video_id)
+        if not job:
+            return None
+        # Keys set to null are dropped by the backend's JSON merge patch
+        status = {'videoId': video_id, 'state': job['state']}
+        for key in ('submittedAt', 'finishedAt', 'result', 'error'):
+            status[key] = job.get(key)
+        return status
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,191 @@
+"""Request metrics exposed in the Prometheus text format
+
+Each request thread accumulates into its own ThreadStats, so recording a
+request takes no lock; a scrape sums every thread's stats. Stats of threads
+that have exited are folded into a retired total at scrape time, which keeps
+the thread-per-request development server from growing the list forever.
+
+Response bytes are taken from Content-Length where there is one; streamed
+bodies (live events, generators) are counted chunk by chunk as the server
+sends them. Event streams that detach their connection are written by the
+event hub instead, so they are counted as untracked responses.
+"""
+import bisect
+import threading
+
+from flask import request
+
+from events import DETACHED_ENVIRON_KEY
+
+# Upper bounds in seconds; +Inf is implied
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class ThreadStats:
+    """Counters written by exactly one thread"""
+
+    __slots__ = ('requests', 'latency', 'bytes', 'untracked', 'started', 'finished')
+
+    def __init__(self):
+        self.requests = {}   # (method, route, status) -> count
+        self.latency = {}    # (method, route) -> bucket counts + [sum]
+        self.bytes = {}      # route -> response bytes
+        self.untracked = {}  # route -> responses whose bytes were sent outside WSGI
+        self.started = 0
+        self.finished = 0
+
+    def merge(self, other):
+        for key, count in other.requests.copy().items():
+            self.requests[key] = self.requests.get(key, 0) + count
+        for key, values in other.latency.copy().items():
+            totals = self.latency.setdefault(key, [0] * (len(LATENCY_BUCKETS) + 2))
+            for i, value in enumerate(list(values)):
+                totals[i] += value
+        for key, size in other.bytes.copy().items():
+            self.bytes[key] = self.bytes.get(key, 0) + size
+        for key, count in other.untracked.copy().items():
+            self.untracked[key] = self.untracked.get(key, 0) + count
+        self.started += other.started
+        self.finished += other.finished
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Registry of request stats and gauges rendered on /api/metrics"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._threads = []  # (thread, ThreadStats)
+        self._retired = ThreadStats()
+        self._lock = threading.Lock()
+        self._gauges = []   # (name, help, callback)
+
+    def _stats(self):
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            stats = self._local.stats = ThreadStats()
+            with self._lock:
+                self._threads.append((threading.current_thread(), stats))
+        return stats
+
+    def gauge(self, name, help_text, callback):
+        """Report callback() as gauge name on every scrape"""
+        self._gauges.append((name, help_text, callback))
+
+    def request_started(self):
+        self._stats().started += 1
+
+    def request_finished(self, response, seconds):
+        """Record the current request, which took seconds, and its response"""
+        stats = self._stats()
+        stats.finished += 1
+        current = request._get_current_object()  # one proxy lookup, not three
+        rule = current.url_rule
+        route = rule.rule if rule is not None else UNMATCHED_ROUTE
+        key = (current.method, route, response.status_code)
+        stats.requests[key] = stats.requests.get(key, 0) + 1
+        latency_key = key[:2]
+        counts = stats.latency.get(latency_key)
+        if counts is None:
+            counts = stats.latency[latency_key] = [0] * (len(LATENCY_BUCKETS) + 2)
+        counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        counts[-1] += seconds
+        if current.method == 'HEAD':
+            size = 0
+        elif response.content_length is None and response.is_streamed:
+            response.response = self._counted(response.response, route, current.environ)
+            size = 0
+        else:
+            size = response.content_length or 0
+        stats.bytes[route] = stats.bytes.get(route, 0) + size
+
+    def _counted(self, body, route, environ):
+        """body, adding each chunk to route's bytes as the server sends it"""
+        try:
+            for chunk in body:
+                # Taken per chunk: the stats of whichever thread sends it
+                stats = self._stats()
+                stats.bytes[route] = stats.bytes.get(route, 0) + len(chunk)
+                yield chunk
+        finally:
+            close = getattr(body, 'close', None)
+            if close is not None:
+                close()
+            if environ.get(DETACHED_ENVIRON_KEY):
+                stats = self._stats()
+                stats.untracked[route] = stats.untracked.get(route, 0) + 1
+
+    def snapshot(self):
+        """Merged ThreadStats of every thread, live and exited"""
+        total = ThreadStats()
+        with self._lock:
+            live = []
+            for thread, stats in self._threads:
+                if thread.is_alive():
+                    live.append((thread, stats))
+                else:
+                    self._retired.merge(stats)
+            self._threads = live
+            total.merge(self._retired)
+        for _, stats in live:
+            total.merge(stats)
+        return total
+
+    def render(self):
+        """Prometheus text exposition of every metric"""
+        stats = self.snapshot()
+        lines = [
+            '# HELP http_requests_total Requests handled, by method, route and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (method, route, status), count in sorted(stats.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{_label(route)}",'
+                         f'status="{status}"}} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Time spent handling requests.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (method, route), counts in sorted(stats.latency.items()):
+            labels = f'method="{method}",route="{_label(route)}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {_number(counts[-1])}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+        lines += [
+            '# HELP http_response_bytes_total Response body bytes sent, by route.',
+            '# TYPE http_response_bytes_total counter',
+        ]
+        for route, size in sorted(stats.bytes.items()):
+            lines.append(f'http_response_bytes_total{{route="{_label(route)}"}} {size}')
+
+        lines += [
+            '# HELP http_response_bytes_untracked_total Responses whose body bytes are not in '
+            'http_response_bytes_total (detached event streams), by route.',
+            '# TYPE http_response_bytes_untracked_total counter',
+        ]
+        for route, count in sorted(stats.untracked.items()):
+            lines.append(f'http_response_bytes_untracked_total{{route="{_label(route)}"}} {count}')
+
+        lines += [
+            '# HELP http_requests_in_flight Requests currently being handled.',
+            '# TYPE http_requests_in_flight gauge',
+            f'http_requests_in_flight {stats.started - stats.finished}',
+        ]
+        for name, help_text, callback in self._gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {_number(callback())}']
+        return '\n'.join(lines) + '\n'
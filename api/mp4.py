@@ -0,0 +1,278 @@
+"""Streaming ISO-BMFF (MP4) metadata probe and faststart rewriter
+
+probe() walks the top-level boxes with seeks, reading only box headers and
+the moov box, so a multi-GB file costs a few small reads. faststart()
+moves moov in front of the media data so playback can start before the
+download finishes, patching every stco/co64 chunk offset (and promoting
+stco to co64 if an offset would overflow 32 bits); the media data is copied
+in fixed-size blocks.
+"""
+import os
+import struct
+
+BLOCK_SIZE = 1024 * 1024
+# A moov larger than this is treated as corrupt rather than read into memory
+MAX_MOOV_SIZE = 256 * 1024 * 1024
+
+# Boxes whose payload is just more boxes, on the way down to stco/co64
+CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts', b'dinf', b'udta', b'mvex'}
+MEDIA_BOXES = {b'mdat'}
+
+
+class Mp4Error(ValueError):
+    """The file is not an MP4 this module can read"""
+
+
+class _OffsetOverflow(Exception):
+    """A shifted stco offset no longer fits in 32 bits"""
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise Mp4Error("Unexpected end of file")
+    return data
+
+
+def top_level_boxes(f):
+    """Yield (type, start, header_size, size) for each top-level box, seeking past payloads"""
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    offset = 0
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack('>I4s', _read_exact(f, 8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', _read_exact(f, 8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise Mp4Error(f"Invalid size for box {box_type!r} at {offset}")
+        yield box_type, offset, header, size
+        offset += size
+
+
+def child_boxes(data, start=0, end=None):
+    """Yield (type, start, header_size, size) for boxes inside data[start:end]"""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise Mp4Error(f"Invalid size for box {box_type!r} at {offset}")
+        yield box_type, offset, header, size
+        offset += size
+
+
+def _find(data, path, start=0, end=None):
+    """Payload (start, end) of the first box along path, or None"""
+    for box_type, offset, header, size in child_boxes(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return offset + header, offset + size
+            return _find(data, path[1:], offset + header, offset + size)
+    return None
+
+
+def _read_moov(f):
+    """(boxes, moov bytes) for the file; moov is None if there is none"""
+    boxes = list(top_level_boxes(f))
+    for box_type, offset, header, size in boxes:
+        if box_type == b'moov':
+            if size > MAX_MOOV_SIZE:
+                raise Mp4Error(f"moov box of {size} bytes is too large")
+            f.seek(offset)
+            return boxes, _read_exact(f, size)
+    return boxes, None
+
+
+def _parse_mvhd(data, start):
+    version = data[start]
+    if version == 1:
+        timescale, duration = struct.unpack_from('>IQ', data, start + 20)
+    else:
+        timescale, duration = struct.unpack_from('>II', data, start + 12)
+    return duration / timescale if timescale else 0.0
+
+
+def _parse_tkhd(data, start, end):
+    # Width and height are 16.16 fixed point, the last 8 bytes of tkhd
+    width, height = struct.unpack_from('>II', data, end - 8)
+    return width >> 16, height >> 16
+
+
+def _sample_entry(data, stbl):
+    stsd = _find(data, [b'stsd'], *stbl)
+    if stsd is None or stsd[1] - stsd[0] < 16:
+        return None
+    # version/flags (4), entry count (4), then the first entry's size and format
+    return data[stsd[0] + 12:stsd[0] + 16].decode('latin-1').strip()
+
+
+def probe(path):
+    """Duration, resolution and codecs of the MP4 at path
+
+    Returns a dict with durationSeconds, width, height, videoCodec,
+    audioCodec and faststart (moov before the media data).
+    """
+    with open(path, 'rb') as f:
+        boxes, moov = _read_moov(f)
+    if moov is None:
+        raise Mp4Error("No moov box")
+
+    result = {'durationSeconds': 0.0, 'width': None, 'height': None,
+              'videoCodec': None, 'audioCodec': None, 'faststart': True}
+    moov_start = next(offset for box_type, offset, _, _ in boxes if box_type == b'moov')
+    result['faststart'] = not any(box_type in MEDIA_BOXES and offset < moov_start
+                                  for box_type, offset, _, _ in boxes)
+
+    mvhd = _find(moov, [b'moov', b'mvhd'])
+    if mvhd is not None:
+        result['durationSeconds'] = round(_parse_mvhd(moov, mvhd[0]), 3)
+
+    moov_payload = _find(moov, [b'moov'])
+    for box_type, offset, header, size in child_boxes(moov, *moov_payload):
+        if box_type != b'trak':
+            continue
+        trak = (offset + header, offset + size)
+        handler = _find(moov, [b'mdia', b'hdlr'], *trak)
+        kind = moov[handler[0] + 8:handler[0] + 12] if handler else b''
+        stbl = _find(moov, [b'mdia', b'minf', b'stbl'], *trak)
+        codec = _sample_entry(moov, stbl) if stbl else None
+        if kind == b'vide' and result['videoCodec'] is None:
+            result['videoCodec'] = codec
+            tkhd = _find(moov, [b'tkhd'], *trak)
+            if tkhd is not None:
+                result['width'], result['height'] = _parse_tkhd(moov, *tkhd)
+        elif kind == b'soun' and result['audioCodec'] is None:
+            result['audioCodec'] = codec
+    return result
+
+
+def _box(box_type, payload):
+    if len(payload) + 8 > 0xFFFFFFFF:
+        return struct.pack('>I4sQ', 1, box_type, len(payload) + 16) + payload
+    return struct.pack('>I4s', len(payload) + 8, box_type) + payload
+
+
+def _rewrite(data, start, end, shift, promote):
+    """Rebuild the boxes in data[start:end] with chunk offsets shifted
+
+    shift(offset) gives the new offset; with promote, stco boxes become co64.
+    """
+    out = []
+    for box_type, offset, header, size in child_boxes(data, start, end):
+        payload_start, payload_end = offset + header, offset + size
+        if box_type in CONTAINERS:
+            out.append(_box(box_type, _rewrite(data, payload_start, payload_end, shift, promote)))
+        elif box_type in (b'stco', b'co64'):
+            version_flags, count = struct.unpack_from('>II', data, payload_start)
+            wide = box_type == b'co64'
+            offsets = struct.unpack_from(f'>{count}{"Q" if wide else "I"}', data, payload_start + 8)
+            offsets = [shift(value) for value in offsets]
+            if wide or promote:
+                out.append(_box(b'co64', struct.pack(f'>II{count}Q', version_flags, count, *offsets)))
+            else:
+                if offsets and max(offsets) > 0xFFFFFFFF:
+                    raise _OffsetOverflow()
+                out.append(_box(b'stco', struct.pack(f'>II{count}I', version_flags, count, *offsets)))
+        else:
+            out.append(data[offset:payload_end])
+    return b''.join(out)
+
+
+def _copy_range(src, dst, start, length):
+    src.seek(start)
+    while length:
+        block = src.read(min(BLOCK_SIZE, length))
+        if not block:
+            raise Mp4Error("Unexpected end of file")
+        dst.write(block)
+        length -= len(block)
+
+
+def faststart(path):
+    """Move moov in front of the media data in place; False if already there
+
+    The new file is written next to path and renamed over it, so readers
+    see either the old or the new file, never a mix.
+    """
+    with open(path, 'rb') as src:
+        boxes, moov = _read_moov(src)
+        if moov is None:
+            raise Mp4Error("No moov box")
+        moov_index = next(i for i, box in enumerate(boxes) if box[0] == b'moov')
+        _, moov_start, _, moov_size = boxes[moov_index]
+        if not any(box_type in MEDIA_BOXES for box_type, _, _, _ in boxes[:moov_index]):
+            return False
+        if any(box_type == b'moof' for box_type, _, _, _ in boxes):
+            # Fragmented: fragments carry their own offsets and stream as is
+            return False
+
+        # moov goes right after ftyp (or first): bytes before its old place
+        # move forward by the new moov size, bytes after it by the difference
+        insert_at = 1 if boxes[0][0] == b'ftyp' else 0
+        payload = _find(moov, [b'moov'])
+        promote = False
+        while True:
+            # The rebuilt size depends only on whether stco is promoted
+            new_size = len(_box(b'moov', _rewrite(moov, *payload, lambda offset: offset, promote)))
+
+            def shift(offset):
+                return offset + (new_size if offset < moov_start else new_size - moov_size)
+
+            try:
+                new_moov = _box(b'moov', _rewrite(moov, *payload, shift, promote))
+                break
+            except _OffsetOverflow:
+                promote = True
+
+        temp_path = f"{path}.faststart.tmp"
+        try:
+            with open(temp_path, 'wb') as dst:
+                for index, (box_type, start, _, size) in enumerate(boxes):
+                    if index == insert_at:
+                        dst.write(new_moov)
+                    if index != moov_index:
+                        _copy_range(src, dst, start, size)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return True
+
+
+def process_media(path):
+    """Probe path and make it faststart; runs in its own process (see below)
+
+    Returns the probe result with 'rewritten' telling whether moov moved.
+    """
+    info = probe(path)
+    rewritten = False
+    if not info['faststart']:
+        rewritten = faststart(path)
+        info['faststart'] = True
+    info['rewritten'] = rewritten
+    return info
+
+
+if __name__ == '__main__':
+    # media_jobs.py runs this in a fresh interpreter for every upload
+    import json
+    import sys
+    try:
+        print(json.dumps(process_media(sys.argv[1])))
+    except Mp4Error as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
@@ -0,0 +1,262 @@
+"""Pre-sorted indexes and opaque cursors for paginated listings"""
+import base64
+import itertools
+import json
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Response header carrying the cursor for the following page
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+# Keys per SortedIndex bucket; a write copies the buckets it touches
+BUCKET_SIZE = 1000
+# Batches larger than BULK_THRESHOLD and more than 1/BULK_FRACTION of the
+# index are merged with one sort instead of bucket by bucket
+BULK_THRESHOLD = 64
+BULK_FRACTION = 8
+
+
+class PaginationError(ValueError):
+    """Bad sort order or cursor in a listing request"""
+
+
+class SortedIndex:
+    """Sort keys kept in ascending order, each a tuple ending with an item id
+
+    A page is a bisect to the cursor key plus a slice, O(log n + page size).
+    The keys are held in sorted buckets of about BUCKET_SIZE, with each
+    bucket's largest key and starting position alongside. Writers
+    (serialized by the store lock) copy only the buckets they change, plus
+    the short per-bucket lists, and publish the result as one tuple so
+    readers see a consistent snapshot without locking. Because cursors are
+    keys rather than offsets, items inserted while a client pages never
+    shift or duplicate the remaining results.
+    """
+
+    def __init__(self, keys=()):
+        self._key_by_id = {}
+        self._publish([])
+        self.add_many(keys)
+
+    def __len__(self):
+        return self._state[3]
+
+    @staticmethod
+    def _split(keys):
+        return [keys[start:start + BUCKET_SIZE] for start in range(0, len(keys), BUCKET_SIZE)]
+
+    def _publish(self, buckets):
+        """Make buckets (sorted, non-empty, in order) the current state"""
+        maxes = [bucket[-1] for bucket in buckets]
+        starts = list(itertools.accumulate((len(bucket) for bucket in buckets[:-1]), initial=0))
+        size = starts[-1] + len(buckets[-1]) if buckets else 0
+        self._state = (buckets, maxes, starts, size)
+
+    def key(self, item_id):
+        """Current sort key of item_id, or None"""
+        return self._key_by_id.get(item_id)
+
+    def add_many(self, keys):
+        """Insert new keys or move existing ids to their new key"""
+        keys = list(keys)
+        latest = dict(zip(map(itemgetter(-1), keys), keys))
+        if not self._key_by_id:
+            # Nothing to move; sorting keys that are already in order, as a
+            # snapshot's are, takes one pass
+            self._key_by_id = latest
+            if latest:
+                self._publish(self._split(sorted(latest.values())))
+            return
+        stale = []
+        inserted = []
+        for item_id, key in latest.items():
+            old = self._key_by_id.get(item_id)
+            if old == key:
+                continue
+            if old is not None:
+                stale.append(old)
+            inserted.append(key)
+            self._key_by_id[item_id] = key
+        if not inserted:
+            return
+        buckets, maxes, _, size = self._state
+        if len(inserted) > BULK_THRESHOLD and len(inserted) * BULK_FRACTION > size:
+            # Timsort merges the already sorted run with the new keys
+            stale = set(stale)
+            updated = [key for bucket in buckets for key in bucket if key not in stale]
+            updated.extend(inserted)
+            updated.sort()
+            self._publish(self._split(updated))
+            return
+        buckets = list(buckets)
+        copied = set()
+        last = len(buckets) - 1
+
+        def bucket_for(key):
+            # Routed by the maxes before this change: any bucket between its
+            # neighbours' old maxes keeps the buckets in order
+            position = min(bisect_left(maxes, key), last)
+            if position not in copied:
+                buckets[position] = list(buckets[position])
+                copied.add(position)
+            return buckets[position]
+
+        for old in stale:
+            bucket = bucket_for(old)
+            del bucket[bisect_left(bucket, old)]
+        if not buckets:
+            buckets, last = [[]], 0
+        for key in inserted:
+            insort(bucket_for(key), key)
+        self._publish(self._rebalanced(buckets, copied))
+
+    @staticmethod
+    def _rebalanced(buckets, changed):
+        """buckets with the changed ones split, merged or dropped back to size"""
+        result = []
+        for position, bucket in enumerate(buckets):
+            if position not in changed:
+                result.append(bucket)
+                continue
+            if not bucket:
+                continue
+            if result and len(bucket) < BUCKET_SIZE // 2 and len(result[-1]) + len(bucket) <= BUCKET_SIZE:
+                bucket = result.pop() + bucket
+            if len(bucket) > 2 * BUCKET_SIZE:
+                result.extend(SortedIndex._split(bucket))
+            else:
+                result.append(bucket)
+        return result
+
+    def add(self, key):
+        self.add_many([key])
+
+    @staticmethod
+    def _position(state, key, right=False):
+        """Where key would be inserted, like bisect_left (bisect_right if right)"""
+        buckets, maxes, starts, size = state
+        search = bisect_right if right else bisect_left
+        number = search(maxes, key)
+        if number == len(buckets):
+            return size
+        return starts[number] + search(buckets[number], key)
+
+    @staticmethod
+    def _slice(state, start, end):
+        """Keys at positions start..end-1"""
+        buckets, _, starts, _ = state
+        keys = []
+        number = max(0, bisect_right(starts, start) - 1)
+        while start < end and number < len(buckets):
+            offset = start - starts[number]
+            chunk = buckets[number][offset:offset + end - start]
+            keys.extend(chunk)
+            start += len(chunk)
+            number += 1
+        return keys
+
+    def between(self, low=None, high=None):
+        """Keys with low <= key < high, ascending; a None bound is open"""
+        state = self._state
+        start = 0 if low is None else self._position(state, low)
+        end = state[3] if high is None else self._position(state, high)
+        return self._slice(state, start, end)
+
+    def count_between(self, low=None, high=None):
+        """len(between(low, high)) without copying the keys"""
+        state = self._state
+        start = 0 if low is None else self._position(state, low)
+        end = state[3] if high is None else self._position(state, high)
+        return max(0, end - start)
+
+    def walk(self, after=None, reverse=False):
+        """Iterate the keys following the after key, in page order"""
+        state = self._state
+        buckets, _, starts, size = state
+        if not reverse:
+            start = 0 if after is None else self._position(state, after, right=True)
+            number = max(0, bisect_right(starts, start) - 1)
+            if number < len(buckets):
+                yield from itertools.islice(buckets[number], start - starts[number], None)
+            for bucket in itertools.islice(buckets, number + 1, None):
+                yield from bucket
+        else:
+            end = size if after is None else self._position(state, after)
+            number = bisect_right(starts, end - 1) - 1
+            if number < 0:
+                return
+            yield from reversed(buckets[number][:end - starts[number]])
+            for bucket in reversed(buckets[:number]):
+                yield from reversed(bucket)
+
+    def page(self, limit, after=None, reverse=False):
+        """Return (keys, has_more) for the page following the after key"""
+        state = self._state
+        size = state[3]
+        if not reverse:
+            start = 0 if after is None else self._position(state, after, right=True)
+            return self._slice(state, start, start + limit), start + limit < size
+        end = size if after is None else self._position(state, after)
+        chunk = self._slice(state, max(0, end - limit), end)[::-1]
+        return chunk, end - limit > 0
+
+
+def encode_cursor(sort, key):
+    """Opaque token for resuming a listing after key"""
+    raw = json.dumps([sort, list(key)], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def cursor_sort(token):
+    """Sort order a cursor was issued for, or None if it is malformed"""
+    try:
+        return _decode(token)[0]
+    except PaginationError:
+        return None
+
+
+def _decode(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        cursor_sort, key = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise PaginationError("Invalid cursor") from e
+    if not isinstance(key, list) or not all(isinstance(part, (int, float, str)) for part in key):
+        raise PaginationError("Invalid cursor")
+    return cursor_sort, tuple(key)
+
+
+def decode_cursor(token, sort):
+    """Key encoded in token; PaginationError if malformed or from another sort"""
+    cursor_sort, key = _decode(token)
+    if cursor_sort != sort:
+        raise PaginationError("Cursor does not match the requested sort order")
+    return key
+
+
+def requested_limit(args, name='limit'):
+    """Integer query parameter, None if absent; PaginationError if not a number"""
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise PaginationError(f"{name} must be an integer") from None
+
+
+def page_size(limit):
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE"""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def with_next_cursor(response, cursor):
+    """Advertise the next page's cursor on a list response"""
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+    return response
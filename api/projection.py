@@ -0,0 +1,111 @@
+"""Field projection and compact encoding of video listings
+
+?fields=id,title,channel.name keeps only the named fields (a dotted name
+picks fields of a nested object). ?compact=1 replaces values that repeat
+across many videos (channels, thumbnail and video URLs) with an index into
+a shared table sent once per response.
+"""
+import re
+import threading
+
+from formatting import display_video_fields
+from fragments import FragmentCache, encode
+
+FIELD_RE = re.compile(r"^(\w+)(?:\.(\w+))?$")
+# Video fields that compact listings send by reference
+SHARED_FIELDS = ('channel', 'thumbnail', 'videoUrl')
+# Distinct (fields, compact) combinations whose fragments are cached
+MAX_PROJECTIONS = 16
+
+
+def parse_fields(spec):
+    """Canonical ((name, subfields or None), ...) for a fields= value, None for all fields
+
+    Names that are not word[.word] are ignored; a bare name wins over
+    dotted names under it.
+    """
+    if not spec:
+        return None
+    fields = {}
+    for part in spec.split(','):
+        match = FIELD_RE.match(part.strip())
+        if not match:
+            continue
+        name, subfield = match.groups()
+        if subfield is None:
+            fields[name] = None
+        elif fields.get(name, ()) is not None:
+            fields[name] = fields.get(name, ()) + (subfield,)
+    return tuple(sorted((name, tuple(sorted(set(sub))) if sub is not None else None)
+                        for name, sub in fields.items()))
+
+
+class SharedValues:
+    """Append-only table of values shared by many records, each encoded once
+
+    Indexes never change for the life of the process, so fragments that
+    refer to them stay cacheable.
+    """
+
+    def __init__(self):
+        self._index = {}
+        self._encoded = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._encoded)
+
+    def ref(self, value):
+        """Index of value in the table, adding it if new"""
+        encoded = encode(value)
+        index = self._index.get(encoded)
+        if index is None:
+            with self._lock:
+                index = self._index.get(encoded)
+                if index is None:
+                    index = self._index[encoded] = len(self._encoded)
+                    self._encoded.append(encoded)
+        return index
+
+    def encoded(self, index):
+        return self._encoded[index]
+
+
+class Projection:
+    """Cached fragments of videos restricted to fields, optionally compact
+
+    For compact projections the shared indexes each fragment references are
+    kept next to it, so a response can send just the entries it needs.
+    """
+
+    def __init__(self, fields, compact, shared):
+        self.fields = fields
+        self.compact = compact
+        self._shared = shared
+        self._refs = {}
+        self._fragments = FragmentCache(self._render)
+
+    def _render(self, video, now):
+        payload, expires_at = display_video_fields(video, now, self.fields)
+        if self.compact:
+            refs = []
+            for name in SHARED_FIELDS:
+                if name in payload:
+                    payload[name] = self._shared.ref(payload[name])
+                    refs.append(payload[name])
+            self._refs[video['id']] = tuple(refs)
+        return payload, expires_at
+
+    def get_many(self, videos, now):
+        """Return ([encoded bytes], earliest expires_at) for videos"""
+        return self._fragments.get_many(((video['id'], video) for video in videos), now)
+
+    def shared_json(self, videos):
+        """Encoded {index: value} object of the shared values the videos' fragments reference"""
+        refs = self._refs
+        indexes = sorted({index for video in videos for index in refs.get(video['id'], ())})
+        encoded = self._shared.encoded
+        return b'{' + b','.join(b'"%d":%s' % (index, encoded(index)) for index in indexes) + b'}'
+
+    def invalidate(self, video_id):
+        self._fragments.invalidate(video_id)
@@ -0,0 +1,209 @@
+"""Compact in-memory records for videos, channels and comments
+
+A catalog holds millions of records of the same few fields, and as dicts
+each pays for its own hash table and its own copies of strings every record
+repeats (placeholder image URLs, channel details). These classes keep the
+known fields in __slots__, rarely used extra fields in an overflow dict
+created on first use, and intern the strings that repeat. Channels are
+shared: every video of a channel references one Channel from a ChannelTable.
+
+Records keep the mapping interface the store and serializers use
+(record['field'], get, items, update), with absent fields behaving as
+missing keys, so they serialize to exactly the JSON the dicts did. Copy one
+into a dict with dict(record.items()), which reads every field in one pass.
+"""
+import sys
+import threading
+from operator import attrgetter
+
+# Value of an unset slot in lookups, where None is a legitimate value
+_MISSING = object()
+
+
+class Record:
+    """Mapping over __slots__ fields, with other keys in an overflow dict"""
+
+    __slots__ = ('_extra',)
+    # Known fields in key order, and those whose string values are interned
+    FIELDS = ()
+    INTERNED = frozenset()
+    _FIELD_SET = frozenset()
+
+    def __init__(self, fields=(), **more):
+        self._extra = None
+        self.update(fields, **more)
+
+    @classmethod
+    def from_items(cls, items):
+        """Record of (key, value) pairs; the fast path for building many records"""
+        record = cls.__new__(cls)
+        record._extra = None
+        field_set, interned = cls._FIELD_SET, cls.INTERNED
+        for key, value in items:
+            if key in field_set:
+                if key in interned and type(value) is str:
+                    value = sys.intern(value)
+                setattr(record, key, value)
+            else:
+                if record._extra is None:
+                    record._extra = {}
+                record._extra[key] = value
+        return record
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+        cls._ALL_FIELDS = staticmethod(attrgetter(*cls.FIELDS))
+
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            value = getattr(self, key, _MISSING)
+        elif self._extra is not None:
+            value = self._extra.get(key, _MISSING)
+        else:
+            value = _MISSING
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._FIELD_SET:
+            if key in self.INTERNED and type(value) is str:
+                value = sys.intern(value)
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is None or key not in self._extra:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key):
+        if key in self._FIELD_SET:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def get(self, key, default=None):
+        if key in self._FIELD_SET:
+            return getattr(self, key, default)
+        return default if self._extra is None else self._extra.get(key, default)
+
+    def items(self):
+        try:
+            # One C call while every field is set, as it usually is
+            items = list(zip(self.FIELDS, self._ALL_FIELDS(self)))
+        except AttributeError:
+            items = [(key, value) for key in self.FIELDS
+                     if (value := getattr(self, key, _MISSING)) is not _MISSING]
+        if self._extra:
+            items.extend(self._extra.items())
+        return items
+
+    def keys(self):
+        return [key for key, _ in self.items()]
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.items())
+
+    def update(self, fields=(), **more):
+        if isinstance(fields, (dict, Record)):
+            fields = fields.items()
+        elif hasattr(fields, 'keys'):
+            fields = [(key, fields[key]) for key in fields.keys()]
+        setitem = self.__setitem__
+        for key, value in fields:
+            setitem(key, value)
+        for key, value in more.items():
+            setitem(key, value)
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+
+class Channel(Record):
+    """A channel as embedded in videos; shared, so never modified once interned
+
+    payload caches the channel's display form (see formatting.py), built
+    once for all the videos that share it.
+    """
+
+    FIELDS = ('name', 'avatar', 'subscriberCount')
+    INTERNED = frozenset(('name', 'avatar'))
+    __slots__ = FIELDS + ('payload',)
+
+
+class Video(Record):
+    FIELDS = ('id', 'title', 'description', 'thumbnail', 'durationSeconds', 'viewCount',
+              'uploadedAt', 'channel', 'videoUrl')
+    INTERNED = frozenset(('thumbnail', 'videoUrl'))
+    __slots__ = FIELDS
+
+
+class Comment(Record):
+    FIELDS = ('id', 'author', 'avatar', 'content', 'likes', 'postedAt', 'parentId', 'replyCount')
+    INTERNED = frozenset(('author', 'avatar', 'parentId'))
+    __slots__ = FIELDS
+
+
+class ChannelTable:
+    """One shared Channel per distinct set of channel fields"""
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._channels)
+
+    def intern(self, fields):
+        """The shared Channel equal to fields (a mapping), created if new"""
+        key = tuple(sorted(fields.items()))
+        try:
+            channel = self._channels.get(key)
+        except TypeError:
+            # Unhashable values (nested objects) are not shared
+            return Channel(fields)
+        if channel is None:
+            with self._lock:
+                channel = self._channels.setdefault(key, Channel(fields))
+        return channel
+
+
+# Channels of every record built by formatting.normalize_video()
+channels = ChannelTable()
+
+
+def plain(record):
+    """Record (or dict) as nested plain dicts, e.g. for json.dumps"""
+    return {key: plain(value) if isinstance(value, Record) else value for key, value in record.items()}
+
+
+def columns(records, *fields):
+    """A list per field of its value in every record, read at C speed
+
+    Every record must have each field set, as normalized records do; dotted
+    names such as 'channel.name' read through nested records.
+    """
+    return tuple(list(map(attrgetter(field), records)) for field in fields)
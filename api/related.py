@@ -0,0 +1,322 @@
+"""TF-IDF similarity between videos, used to suggest related videos
+
+Scoring is vectorized with NumPy when it is installed and falls back to
+plain Python loops otherwise.
+"""
+import heapq
+import itertools
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from search import FIELD_BOOSTS, searchable_fields, tokenize
+
+# Neighbours computed per lookup however few are requested, so later
+# requests for the same video are answered from the cache
+NEIGHBOR_COUNT = 24
+# Videos whose neighbour lists are kept until the next catalog change
+NEIGHBOR_CACHE_SIZE = 4096
+# Rebuild every vector with fresh IDF weights once the catalog has grown by
+# this factor since the last build
+REBUILD_GROWTH = 1.25
+
+
+def _idf(size, document_frequency):
+    """Smoothed inverse document frequency"""
+    return math.log((1 + size) / (1 + document_frequency)) + 1.0
+
+
+class RelatedIndex:
+    """Cosine similarity of L2-normalized TF-IDF vectors over title, channel
+    and description
+
+    Term frequencies are field boosted the way search ranks matches and
+    dampened logarithmically. Vectors are sparse: postings hold, per term,
+    the rows containing it and their normalized weights, so scoring one
+    video against the whole catalog is a single sparse dot product (a
+    weighted bincount over the postings of its terms) followed by an
+    argpartition top-K.
+
+    Added videos are weighted with the IDF of the last build (new terms get
+    theirs when first seen) and appended without touching other rows; once
+    the catalog has grown by REBUILD_GROWTH every vector is rebuilt off the
+    lock and swapped in. Neighbour lists are cached per video until the next
+    catalog change. The arrays can be saved to and loaded from a snapshot
+    instead of being recomputed from text; loaded postings stay views of
+    the snapshot's mapping until a new row is appended to them.
+    """
+
+    def __init__(self, neighbor_count=NEIGHBOR_COUNT, cache_size=NEIGHBOR_CACHE_SIZE):
+        self.neighbor_count = neighbor_count
+        self.cache_size = cache_size
+        self._ids = []
+        self._rows = {}
+        # Per row: term ids and their dampened, field-boosted frequencies
+        self._row_terms = []
+        self._row_tf = []
+        self._term_ids = {}
+        self._df = array('i')
+        self._idf = array('f')
+        # Per term: the rows containing it and their normalized weights
+        self._post_rows = []
+        self._post_weights = []
+        self._built_size = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add_many(self, videos):
+        """Add videos that are not indexed yet"""
+        parsed = []
+        for video in videos:
+            counts = {}
+            for field, text in searchable_fields(video):
+                boost = FIELD_BOOSTS[field]
+                for token in tokenize(text):
+                    counts[token] = counts.get(token, 0.0) + boost
+            parsed.append((video['id'], counts))
+
+        with self._lock:
+            self._cache.clear()
+            first_row = len(self._ids)
+            first_term = len(self._df)
+            term_ids, df = self._term_ids, self._df
+            for video_id, counts in parsed:
+                if video_id in self._rows:
+                    continue
+                terms = array('i')
+                for token in counts:
+                    term = term_ids.get(token)
+                    if term is None:
+                        term = term_ids[token] = len(df)
+                        df.append(0)
+                    df[term] += 1
+                    terms.append(term)
+                self._rows[video_id] = len(self._ids)
+                self._ids.append(video_id)
+                self._row_terms.append(terms)
+                self._row_tf.append(array('f', [1.0 + math.log(count) for count in counts.values()]))
+            size = len(self._ids)
+            self._idf.extend(_idf(size, df[term]) for term in range(first_term, len(df)))
+            for _ in range(first_term, len(df)):
+                self._post_rows.append(array('i'))
+                self._post_weights.append(array('f'))
+            self._index_rows(first_row, size, self._idf, self._post_rows, self._post_weights)
+            if not self._built_size:
+                self._built_size = size
+
+    def _vector(self, row, idf):
+        """Term ids of row and their L2-normalized TF-IDF weights"""
+        terms = self._row_terms[row]
+        weights = [tf * idf[term] for term, tf in zip(terms, self._row_tf[row])]
+        norm = math.sqrt(sum(weight * weight for weight in weights)) or 1.0
+        return terms, [weight / norm for weight in weights]
+
+    def _index_rows(self, start, stop, idf, post_rows, post_weights):
+        """Append the vectors of rows start..stop to the postings"""
+        if np is not None and stop - start > 1:
+            return self._index_rows_numpy(start, stop, idf, post_rows, post_weights)
+        for row in range(start, stop):
+            terms, weights = self._vector(row, idf)
+            for term, weight in zip(terms, weights):
+                _appendable(post_rows, term, 'i').append(row)
+                _appendable(post_weights, term, 'f').append(weight)
+
+    def _index_rows_numpy(self, start, stop, idf, post_rows, post_weights):
+        row_terms = self._row_terms[start:stop]
+        lengths = np.fromiter(map(len, row_terms), dtype=np.int64, count=len(row_terms))
+        terms = np.frombuffer(b''.join(terms.tobytes() for terms in row_terms), dtype=np.int32)
+        if not len(terms):
+            return
+        tf = np.frombuffer(b''.join(tf.tobytes() for tf in self._row_tf[start:stop]), dtype=np.float32)
+        positions = np.repeat(np.arange(len(row_terms)), lengths)
+        weights = tf * np.frombuffer(idf, dtype=np.float32)[terms].astype(np.float64)
+        norms = np.sqrt(np.bincount(positions, weights=weights * weights, minlength=len(row_terms)))
+        weights = (weights / np.where(norms > 0, norms, 1.0)[positions]).astype(np.float32)
+        # Group by term; the stable sort keeps each term's rows ascending
+        order = np.argsort(terms, kind='stable')
+        terms = terms[order]
+        rows = (positions[order] + start).astype(np.int32)
+        weights = weights[order]
+        bounds = (np.flatnonzero(np.diff(terms)) + 1).tolist()
+        for begin, end in zip([0] + bounds, bounds + [len(terms)]):
+            term = int(terms[begin])
+            _appendable(post_rows, term, 'i').frombytes(rows[begin:end].tobytes())
+            _appendable(post_weights, term, 'f').frombytes(weights[begin:end].tobytes())
+
+    def _maybe_rebuild(self):
+        """Recompute every vector with current IDF once the catalog has grown enough"""
+        if len(self._ids) <= self._built_size * REBUILD_GROWTH:
+            return
+        if not self._rebuild_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                size = len(self._ids)
+                idf = array('f', (_idf(size, df) for df in self._df))
+            post_rows = [array('i') for _ in idf]
+            post_weights = [array('f') for _ in idf]
+            # Rows below size never change, so they are indexed off the lock
+            self._index_rows(0, size, idf, post_rows, post_weights)
+            with self._lock:
+                # Terms and rows added meanwhile keep the weights they were
+                # added with
+                idf.extend(self._idf[len(idf):])
+                for _ in range(len(post_rows), len(idf)):
+                    post_rows.append(array('i'))
+                    post_weights.append(array('f'))
+                self._index_rows(size, len(self._ids), idf, post_rows, post_weights)
+                self._idf, self._post_rows, self._post_weights = idf, post_rows, post_weights
+                self._built_size = len(self._ids)
+                self._cache.clear()
+        finally:
+            self._rebuild_lock.release()
+
+    def neighbors(self, video_id, limit=NEIGHBOR_COUNT):
+        """Ids of up to limit videos most similar to video_id, best first
+
+        Videos sharing no terms with video_id are never returned.
+        """
+        self._maybe_rebuild()
+        with self._lock:
+            cached = self._cache.get(video_id)
+            # A short list is complete: nothing else shares a term
+            if cached is not None and (len(cached[0]) >= limit or len(cached[0]) < cached[1]):
+                self._cache.move_to_end(video_id)
+                return list(cached[0][:limit])
+            row = self._rows.get(video_id)
+            if row is None:
+                return []
+            count = max(limit, self.neighbor_count)
+            score = _top_neighbors_numpy if np is not None else _top_neighbors_python
+            rows = score(self, row, count)
+            ids = tuple(self._ids[other] for other in rows)
+            self._cache[video_id] = (ids, count)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return list(ids[:limit])
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    # Snapshots (see snapshot.py)
+
+    def snapshot(self, ids):
+        """Capture the index for a snapshot of the videos ids, indexed in that
+        order, first; returns write(writer) to store it later, off the lock
+        """
+        with self._lock:
+            count = len(ids)
+            if self._ids[:count] != ids:
+                return None
+            terms = list(self._term_ids)
+            df = array('i', self._df)
+            idf = array('f', self._idf)
+            row_terms, row_tf = self._row_terms[:count], self._row_tf[:count]
+            # Rows and terms are only ever appended to these, and a rebuild
+            # swaps in new lists, so references stay valid off the lock
+            post_rows, post_weights = list(self._post_rows), list(self._post_weights)
+            built_size = min(self._built_size, count)
+
+        def write(writer):
+            writer.add('related.ids', writer.strings(ids))
+            writer.add('related.terms', writer.strings(terms))
+            writer.add('related.df', df)
+            writer.add('related.idf', idf)
+            writer.add('related.row.ends', array('Q', itertools.accumulate(map(len, row_terms))))
+            writer.add('related.row.terms', b''.join(row.tobytes() for row in row_terms))
+            writer.add('related.row.tf', b''.join(row.tobytes() for row in row_tf))
+            ends = array('Q')
+            rows = []
+            weights = []
+            size = 0
+            for term_rows, term_weights in zip(post_rows, post_weights):
+                # Rows are ascending; later ones were added after the capture
+                cut = bisect_left(term_rows, count)
+                rows.append(term_rows[:cut].tobytes())
+                weights.append(term_weights[:cut].tobytes())
+                size += cut
+                ends.append(size)
+            writer.add('related.post.ends', ends)
+            writer.add('related.post.rows', b''.join(rows))
+            writer.add('related.post.weights', b''.join(weights))
+            writer.add_json('related.meta', {'builtSize': built_size})
+        return write
+
+    def load_snapshot(self, snapshot):
+        """Replace the contents with those of a snapshot; False if it has none"""
+        if 'related.ids' not in snapshot:
+            return False
+        ids = snapshot.resolve(snapshot.array('related.ids', 'I'))
+        terms = snapshot.resolve(snapshot.array('related.terms', 'I'))
+        row_ends = snapshot.array('related.row.ends', 'Q')
+        row_terms = _split(snapshot.array('related.row.terms', 'i'), row_ends)
+        row_tf = _split(snapshot.array('related.row.tf', 'f'), row_ends)
+        post_ends = snapshot.array('related.post.ends', 'Q')
+        post_rows = _split(snapshot.array('related.post.rows', 'i'), post_ends)
+        post_weights = _split(snapshot.array('related.post.weights', 'f'), post_ends)
+        with self._lock:
+            self._cache.clear()
+            self._ids = ids
+            self._rows = dict(zip(ids, range(len(ids))))
+            self._row_terms, self._row_tf = row_terms, row_tf
+            self._term_ids = dict(zip(terms, range(len(terms))))
+            # One entry per term and updated in place, so copied
+            self._df = array('i', snapshot.array('related.df', 'i'))
+            self._idf = array('f', snapshot.array('related.idf', 'f'))
+            self._post_rows, self._post_weights = post_rows, post_weights
+            self._built_size = snapshot.json('related.meta')['builtSize']
+        return True
+
+
+def _appendable(lists, term, typecode):
+    """lists[term], first copied into an array if it is a snapshot view"""
+    values = lists[term]
+    if type(values) is memoryview:
+        values = lists[term] = array(typecode, values)
+    return values
+
+
+def _split(values, ends):
+    """values cut into one slice per [previous end, end) range"""
+    return [values[start:end] for start, end in zip(itertools.chain((0,), ends), ends)]
+
+
+def _top_neighbors_numpy(index, row, count):
+    terms, weights = index._vector(row, index._idf)
+    if not terms:
+        return []
+    rows = np.concatenate([np.frombuffer(index._post_rows[term], dtype=np.int32) for term in terms])
+    values = np.concatenate([
+        np.frombuffer(index._post_weights[term], dtype=np.float32) * weight
+        for term, weight in zip(terms, weights)
+    ])
+    scores = np.bincount(rows, weights=values, minlength=len(index._ids))
+    scores[row] = 0.0
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > count:
+        candidates = candidates[np.argpartition(scores[candidates], -count)[-count:]]
+    # Best score first, older videos first on ties
+    return candidates[np.lexsort((candidates, -scores[candidates]))].tolist()
+
+
+def _top_neighbors_python(index, row, count):
+    terms, weights = index._vector(row, index._idf)
+    scores = {}
+    for term, weight in zip(terms, weights):
+        for other, value in zip(index._post_rows[term], index._post_weights[term]):
+            scores[other] = scores.get(other, 0.0) + value * weight
+    scores.pop(row, None)
+    best = heapq.nsmallest(count, ((-score, other) for other, score in scores.items() if score > 0))
+    return [other for _, other in best]
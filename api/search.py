@@ -0,0 +1,338 @@
+"""Inverted index used to answer catalog search queries"""
+import heapq
+import itertools
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+TOKEN_RE = re.compile(r"\w+")
+PHRASE_RE = re.compile(r'"([^"]*)"')
+
+# Relevance boosts per searchable field
+FIELD_BOOSTS = {
+    "title": 3.0,
+    "channel": 2.0,
+    "description": 1.0,
+}
+
+# Separates fields in the phrase text so phrases never match across fields
+FIELD_SEPARATOR = " \x00 "
+
+DEFAULT_MAX_RESULTS = 100
+
+# Upper bound on the number of vocabulary terms a trailing prefix expands to
+MAX_PREFIX_EXPANSIONS = 64
+
+# Number of recent query results kept until the next catalog change
+RESULT_CACHE_SIZE = 256
+
+# Terms whose postings are copied per step while writing a snapshot
+SNAPSHOT_CHUNK = 1024
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def searchable_fields(video):
+    """Return (field, text) pairs for the searchable parts of a video"""
+    return (
+        ("title", video["title"]),
+        ("channel", video["channel"]["name"]),
+        ("description", video["description"]),
+    )
+
+
+def parse_query(query):
+    """Split a raw query into (terms, phrases)
+
+    Quoted parts become phrases; every word, quoted or not, is a required term.
+    """
+    phrases = []
+    for match in PHRASE_RE.findall(query):
+        tokens = tokenize(match)
+        if len(tokens) > 1:
+            phrases.append(" ".join(tokens))
+    terms = list(dict.fromkeys(tokenize(query)))
+    return terms, phrases
+
+
+class SearchIndex:
+    """Tokenized inverted index with field-boosted relevance ranking
+
+    Postings map each term to {video_id: weight}, where the weight is the sum
+    of field boosts for every occurrence of the term in that video. Queries
+    are AND-ed across terms, the last bare term also matches as a prefix so
+    partially typed words still find results, and quoted phrases must appear
+    verbatim within a single field. A result's score is the sum of its term
+    weights and does not depend on the rest of the catalog, so rank keys stay
+    valid as pagination cursors while videos are added. Results of recent
+    queries are cached until the next add or remove.
+
+    An index loaded from a snapshot keeps every term's postings packed in
+    views of the snapshot's mapping and unpacks a term into its dict the
+    first time it is used.
+    """
+
+    def __init__(self, max_results=DEFAULT_MAX_RESULTS):
+        self.max_results = max_results
+        self._postings = {}
+        self._phrase_text = {}
+        self._doc_terms = {}
+        self._order = {}
+        self._sequence = itertools.count()
+        self._vocabulary = []
+        self._vocabulary_dirty = False
+        # Snapshot postings not unpacked yet: term -> (start, stop) in the
+        # packed rows and weights, rows numbering the packed ids
+        self._packed = {}
+        self._packed_ids = []
+        self._packed_rows = array('I')
+        self._packed_weights = array('f')
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._order)
+
+    def add(self, video):
+        """Index a video, replacing any previous entry with the same id"""
+        video_id = video["id"]
+        weights = {}
+        phrase_parts = []
+        for field, text in searchable_fields(video):
+            tokens = tokenize(text)
+            boost = FIELD_BOOSTS[field]
+            for token in tokens:
+                weights[token] = weights.get(token, 0.0) + boost
+            phrase_parts.append(" ".join(tokens))
+
+        with self._lock:
+            self._cache.clear()
+            if video_id in self._order:
+                self._remove_locked(video_id)
+            self._order[video_id] = next(self._sequence)
+            for token, weight in weights.items():
+                postings = self._term_postings(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    self._vocabulary_dirty = True
+                postings[video_id] = weight
+            self._doc_terms[video_id] = tuple(weights)
+            self._phrase_text[video_id] = f" {FIELD_SEPARATOR.join(phrase_parts)} "
+
+    def add_many(self, videos):
+        for video in videos:
+            self.add(video)
+
+    def remove(self, video_id):
+        with self._lock:
+            self._cache.clear()
+            self._remove_locked(video_id)
+
+    def _remove_locked(self, video_id):
+        if self._order.pop(video_id, None) is None:
+            return
+        phrase_text = self._phrase_text.pop(video_id, "")
+        terms = self._doc_terms.pop(video_id, None)
+        if terms is None:
+            # Loaded from a snapshot: the phrase text holds every term
+            terms = set(phrase_text.split()) - {FIELD_SEPARATOR.strip()}
+        for token in terms:
+            postings = self._term_postings(token)
+            del postings[video_id]
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _term_postings(self, term):
+        """{video_id: weight} of term, or None; unpacks snapshot postings"""
+        postings = self._postings.get(term)
+        if postings is None and term in self._packed:
+            start, stop = self._packed.pop(term)
+            ids = self._packed_ids
+            postings = self._postings[term] = dict(zip(
+                map(ids.__getitem__, self._packed_rows[start:stop]), self._packed_weights[start:stop]))
+        return postings
+
+    def _prefix_postings(self, prefix):
+        """Postings for every term starting with prefix, merged by best weight"""
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(itertools.chain(self._postings, self._packed))
+            self._vocabulary_dirty = False
+        vocabulary = self._vocabulary
+        position = bisect_left(vocabulary, prefix)
+        end = position
+        while end < len(vocabulary) and vocabulary[end].startswith(prefix):
+            end += 1
+        matches = [self._term_postings(term) for term in vocabulary[position:end]]
+        if len(matches) == 1:
+            return matches[0]
+        if len(matches) > MAX_PREFIX_EXPANSIONS:
+            matches = heapq.nlargest(MAX_PREFIX_EXPANSIONS, matches, key=len)
+        merged = {}
+        for postings in matches:
+            for video_id, weight in postings.items():
+                if weight > merged.get(video_id, 0.0):
+                    merged[video_id] = weight
+        return merged
+
+    def search(self, query, limit=None):
+        """Return the ids of the best matching videos, most relevant first"""
+        return [key[-1] for key in self.search_page(query, limit=limit)]
+
+    def search_page(self, query, limit=None, after=None):
+        """Return rank keys (score, -order, video_id), most relevant first
+
+        With after set to a key from a previous page, only results ranking
+        below it are returned, which makes the key usable as a cursor.
+        """
+        limit = self.max_results if limit is None else max(0, min(limit, self.max_results))
+        after = tuple(after[:2]) if after is not None else None
+        cache_key = (query.strip().lower(), limit, after)
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+                return list(cached)
+            results = self._search_locked(query, limit, after)
+            self._cache[cache_key] = tuple(results)
+            if len(self._cache) > RESULT_CACHE_SIZE:
+                self._cache.popitem(last=False)
+            return results
+
+    def _search_locked(self, query, limit, after):
+        terms, phrases = parse_query(query)
+        if not terms or not limit:
+            return []
+
+        prefix_last = not query.rstrip().endswith('"')
+        term_postings = []
+        for position, term in enumerate(terms):
+            if prefix_last and position == len(terms) - 1:
+                postings = self._prefix_postings(term)
+            else:
+                postings = self._term_postings(term)
+            if not postings:
+                return []
+            term_postings.append(postings)
+
+        if len(term_postings) == 1 and not phrases:
+            scores = term_postings[0]
+        else:
+            # Intersect starting from the rarest term; walking its postings
+            # keeps candidates in catalog order so equal scores rank oldest first
+            term_postings.sort(key=len)
+            rarest, others = term_postings[0], term_postings[1:]
+            phrase_text = self._phrase_text
+            scores = {}
+            for video_id, score in rarest.items():
+                for postings in others:
+                    weight = postings.get(video_id)
+                    if weight is None:
+                        break
+                    score += weight
+                else:
+                    if phrases and not all(f" {phrase} " in phrase_text[video_id] for phrase in phrases):
+                        continue
+                    scores[video_id] = score
+
+        order = self._order
+        if after is None:
+            best = heapq.nlargest(limit, scores, key=scores.__getitem__)
+        else:
+            def rank(video_id):
+                return scores[video_id], -order[video_id]
+            best = heapq.nlargest(limit, (v for v in scores if rank(v) < after), key=rank)
+        return [(scores[video_id], -order[video_id], video_id) for video_id in best]
+
+    # Snapshots (see snapshot.py)
+
+    def snapshot(self, ids):
+        """Capture the index for a snapshot of the videos ids, indexed in that
+        order, first; returns write(writer) to store it later, off the lock
+        """
+        with self._lock:
+            docs = list(itertools.islice(self._order, len(ids)))
+            if docs != ids:
+                return None
+            numbers = array('q', map(self._order.__getitem__, docs))
+            phrases = list(map(self._phrase_text.__getitem__, docs))
+            terms = list(itertools.chain(self._postings, self._packed))
+            packed = dict(self._packed)
+            packed_ids = self._packed_ids
+            packed_rows, packed_weights = self._packed_rows, self._packed_weights
+
+        def write(writer):
+            written = []
+            rows = array('I')
+            weights = array('f')
+            ends = array('Q')
+            position = dict(zip(docs, range(len(docs))))
+            # Packed rows renumber cheaply when the documents kept their places
+            renumber = None if packed_ids == docs[:len(packed_ids)] else [position.get(i) for i in packed_ids]
+            for first in range(0, len(terms), SNAPSHOT_CHUNK):
+                chunk = terms[first:first + SNAPSHOT_CHUNK]
+                with self._lock:
+                    unpacked = [list(postings.items()) if (postings := self._postings.get(term)) is not None
+                                else None for term in chunk]
+                for term, items in zip(chunk, unpacked):
+                    if items is None:
+                        if term not in packed:
+                            # Its last video was removed since
+                            continue
+                        start, stop = packed[term]
+                        if renumber is None:
+                            rows.extend(packed_rows[start:stop])
+                            weights.extend(packed_weights[start:stop])
+                        else:
+                            for row, weight in zip(packed_rows[start:stop], packed_weights[start:stop]):
+                                if renumber[row] is not None:
+                                    rows.append(renumber[row])
+                                    weights.append(weight)
+                    else:
+                        # Videos indexed after the capture are left out
+                        for video_id, weight in items:
+                            row = position.get(video_id)
+                            if row is not None:
+                                rows.append(row)
+                                weights.append(weight)
+                    written.append(term)
+                    ends.append(len(rows))
+            writer.add('search.ids', writer.strings(docs))
+            writer.add('search.order', numbers)
+            writer.add('search.phrases', writer.strings(phrases))
+            writer.add('search.terms', writer.strings(written))
+            writer.add('search.ends', ends)
+            writer.add('search.rows', rows)
+            writer.add('search.weights', weights)
+        return write
+
+    def load_snapshot(self, snapshot):
+        """Replace the contents with those of a snapshot; False if it has none"""
+        if 'search.ids' not in snapshot:
+            return False
+        docs = snapshot.resolve(snapshot.array('search.ids', 'I'))
+        numbers = snapshot.array('search.order', 'q')
+        terms = snapshot.resolve(snapshot.array('search.terms', 'I'))
+        ends = snapshot.array('search.ends', 'Q')
+        with self._lock:
+            self._cache.clear()
+            self._order = dict(zip(docs, numbers))
+            self._sequence = itertools.count(max(numbers, default=-1) + 1)
+            self._phrase_text = dict(zip(docs, snapshot.resolve(snapshot.array('search.phrases', 'I'))))
+            self._doc_terms = {}
+            self._postings = {}
+            self._packed = dict(zip(terms, zip(itertools.chain((0,), ends), ends)))
+            self._packed_ids = docs
+            self._packed_rows = snapshot.array('search.rows', 'I')
+            self._packed_weights = snapshot.array('search.weights', 'f')
+            self._vocabulary_dirty = True
+        return True
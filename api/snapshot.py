@@ -0,0 +1,461 @@
+"""Binary catalog snapshots that workers map into memory at startup
+
+A snapshot is one file of named, 8-byte aligned sections:
+
+    header       magic, format version and a directory of (name, offset,
+                 length) entries
+    meta         JSON: when it was written, the backend position it is
+                 current to and record counts
+    strings      every distinct string once, UTF-8, back to back, with
+                 string.ends holding where each one ends
+    channels, videos, comments
+                 fixed-width rows (see the *_COLUMNS layouts): strings and
+                 channels are 32-bit references into their tables, numbers
+                 are stored inline
+    search.*, related.*, suggest.*
+                 the indexes' arrays, written and read by the index classes
+    order.*      the video rows' numbers in each saved sort order (see
+                 CatalogStore.write_snapshot)
+
+Starting from a snapshot skips parsing every JSON row and rebuilding the
+indexes from text. The file is opened with mmap and the index arrays are
+read through views cast from the mapping, not copied out of it, so every
+worker serves them from the same page-cache pages; only what has to become
+Python objects (strings, records) is private to each. Rows the backend added
+or changed after the snapshot's position are read from it on top (see
+SqliteBackend.load_changes), so a snapshot does not need to be current, only
+recent. Files are written under a temporary name and renamed into place:
+readers only ever see complete snapshots, and a worker still reading the
+previous one keeps its mapping.
+"""
+import functools
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+
+from records import Channel, Comment, Video, channels as channel_table, plain
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CATSNAP\x00'
+# Bumped whenever the layout changes; other versions are ignored, not read
+VERSION = 1
+# Seconds between snapshots, across all workers sharing the file
+SNAPSHOT_INTERVAL = float(os.environ.get('SNAPSHOT_INTERVAL', '600'))
+MAX_SECTIONS = 64
+ALIGNMENT = 8
+# Strings encoded or decoded per step, bounding the memory held at once
+STRING_CHUNK = 4096
+# Readable by workers running as other users; mkstemp() creates files 0600
+FILE_MODE = 0o644
+
+_HEADER = struct.Struct('<8sII')
+_ENTRY = struct.Struct('<24sQQ')
+_DATA_START = _HEADER.size + MAX_SECTIONS * _ENTRY.size
+
+# Row layouts: (field, kind) with kind 's' a string reference, 'c' a channel
+# reference, 'q' an integer or 'd' a float. Every row starts with a bitmask
+# of the fields held in their column and a reference to a JSON object of the
+# record's other fields (0, the empty string, when there are none)
+CHANNEL_COLUMNS = (('name', 's'), ('avatar', 's'), ('subscriberCount', 'q'))
+VIDEO_COLUMNS = (
+    ('id', 's'), ('title', 's'), ('description', 's'), ('thumbnail', 's'), ('videoUrl', 's'),
+    ('channel', 'c'), ('durationSeconds', 'q'), ('viewCount', 'q'), ('uploadedAt', 'd'),
+)
+COMMENT_COLUMNS = (
+    ('id', 's'), ('author', 's'), ('avatar', 's'), ('content', 's'), ('parentId', 's'),
+    ('replyCount', 'q'), ('likes', 'q'), ('postedAt', 'd'),
+)
+
+
+def _row_struct(columns):
+    return struct.Struct('<II' + ''.join('I' if kind in 'sc' else kind for _, kind in columns))
+
+
+CHANNEL_ROW = _row_struct(CHANNEL_COLUMNS)
+VIDEO_ROW = _row_struct(VIDEO_COLUMNS)
+COMMENT_ROW = _row_struct(COMMENT_COLUMNS)
+
+# Value types each column kind stores; anything else goes to the JSON part
+_COLUMN_TYPES = {'s': str, 'q': int, 'd': float}
+_INT_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+@functools.lru_cache(maxsize=None)
+def _absent_fields(columns, mask):
+    """Fields of columns a row with mask does not hold; rows share a few masks"""
+    return tuple(field for bit, (field, _) in enumerate(columns) if not mask & (1 << bit))
+
+
+class SnapshotError(Exception):
+    """The file is not a complete snapshot in this format"""
+
+
+class SnapshotWriter:
+    """Builds a snapshot section by section; nothing is visible at path until commit()"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, self._temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+        self._file = os.fdopen(fd, 'wb')
+        self._file.write(bytes(_DATA_START))
+        self._sections = {}
+        self._string_refs = {'': 0}
+        self._strings = ['']
+        self._channel_refs = {}
+        self._channels = []
+
+    def string(self, value):
+        """Reference to value in the string table, adding it if new"""
+        ref = self._string_refs.get(value)
+        if ref is None:
+            ref = self._string_refs[value] = len(self._strings)
+            self._strings.append(value)
+        return ref
+
+    def strings(self, values):
+        """array of references to each of values"""
+        return array('I', map(self.string, values))
+
+    def _start_section(self, name):
+        if name in self._sections or len(self._sections) >= MAX_SECTIONS or len(name.encode()) > 24:
+            raise ValueError(f"Cannot add snapshot section {name!r}")
+        offset = self._file.tell()
+        padding = -offset % ALIGNMENT
+        self._file.write(bytes(padding))
+        return offset + padding
+
+    def add(self, name, data):
+        """Add a section holding data: bytes or any other buffer, such as an array"""
+        offset = self._start_section(name)
+        with memoryview(data) as view:
+            self._file.write(view)
+            self._sections[name] = (offset, view.nbytes)
+
+    def add_json(self, name, value):
+        self.add(name, json.dumps(value).encode())
+
+    def _row(self, row, record, columns):
+        """row.pack() of record, with what the columns cannot hold in the JSON part"""
+        mask = 0
+        values = []
+        names = set()
+        extra = {}
+        for bit, (field, kind) in enumerate(columns):
+            names.add(field)
+            value = record.get(field)
+            if kind == 'c':
+                stored = isinstance(value, Channel)
+                if stored:
+                    key = id(value)
+                    if key not in self._channel_refs:
+                        self._channel_refs[key] = len(self._channels)
+                        self._channels.append(value)
+                    values.append(self._channel_refs[key])
+            else:
+                stored = type(value) is _COLUMN_TYPES[kind] and (kind != 'q' or value in _INT_RANGE)
+                if stored:
+                    values.append(self.string(value) if kind == 's' else value)
+            if stored:
+                mask |= 1 << bit
+            else:
+                values.append(0)
+                if field in record:
+                    extra[field] = value
+        for key, value in record.items():
+            if key not in names:
+                extra[key] = value
+        extra = self.string(json.dumps(extra, default=plain)) if extra else 0
+        return row.pack(mask, extra, *values)
+
+    def add_records(self, videos, comments):
+        """Add the videos and the (video_id, comment) pairs, in order"""
+        self.add('videos', b''.join(self._row(VIDEO_ROW, video, VIDEO_COLUMNS) for video in videos))
+        self.add('comments', b''.join(self._row(COMMENT_ROW, comment, COMMENT_COLUMNS) for _, comment in comments))
+        self.add('comment.videos', self.strings(video_id for video_id, _ in comments))
+        # Channels last: the video rows are what collects them
+        self.add('channels', b''.join(self._row(CHANNEL_ROW, channel, CHANNEL_COLUMNS) for channel in self._channels))
+
+    def _add_strings(self):
+        offset = self._start_section('strings')
+        ends = array('Q')
+        size = 0
+        for first in range(0, len(self._strings), STRING_CHUNK):
+            encoded = [value.encode('utf-8', 'surrogatepass') for value in self._strings[first:first + STRING_CHUNK]]
+            for value in encoded:
+                size += len(value)
+                ends.append(size)
+            self._file.write(b''.join(encoded))
+        self._sections['strings'] = (offset, size)
+        self.add('string.ends', ends)
+
+    def commit(self, meta):
+        """Finish the file and atomically replace path with it"""
+        self._add_strings()
+        self.add_json('meta', meta)
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(MAGIC, VERSION, len(self._sections)))
+        for name, (offset, length) in self._sections.items():
+            self._file.write(_ENTRY.pack(name.encode(), offset, length))
+        self._file.flush()
+        os.fchmod(self._file.fileno(), FILE_MODE)
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.unlink(self._temp_path)
+        except OSError:
+            pass
+
+
+class Snapshot:
+    """A snapshot file mapped read-only
+
+    Sections are read through views of the mapping. array() returns one
+    cast to the section's type, which holders keep using for as long as
+    they like: the mapping stays open until the last such view is gone,
+    whether or not close() was called.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            try:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise SnapshotError(f"Empty snapshot: {path}") from e
+        try:
+            self._sections = self._read_directory()
+            self.meta = self.json('meta')
+        except Exception:
+            self._map.close()
+            raise
+        self._strings = None
+
+    def _read_directory(self):
+        size = len(self._map)
+        if size < _DATA_START:
+            raise SnapshotError("Truncated snapshot")
+        magic, version, count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise SnapshotError("Not a catalog snapshot")
+        if version != VERSION:
+            raise SnapshotError(f"Snapshot format {version}, expected {VERSION}")
+        sections = {}
+        for number in range(min(count, MAX_SECTIONS)):
+            name, offset, length = _ENTRY.unpack_from(self._map, _HEADER.size + number * _ENTRY.size)
+            if offset + length > size:
+                raise SnapshotError("Truncated snapshot")
+            sections[name.rstrip(b'\x00').decode()] = (offset, length)
+        return sections
+
+    def __contains__(self, name):
+        return name in self._sections
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._strings = None
+        try:
+            self._map.close()
+        except BufferError:
+            # Views returned by array() are still in use; the mapping is
+            # released with the last of them
+            pass
+
+    def _view(self, name):
+        try:
+            offset, length = self._sections[name]
+        except KeyError:
+            raise SnapshotError(f"Snapshot has no {name} section") from None
+        return memoryview(self._map)[offset:offset + length]
+
+    def array(self, name, typecode):
+        """A section as a read-only memoryview of typecode items on the mapping"""
+        return self._view(name).cast(typecode)
+
+    def json(self, name):
+        with self._view(name) as view:
+            return json.loads(bytes(view))
+
+    def strings(self):
+        """The string table, decoded once; references index into it"""
+        if self._strings is None:
+            ends = self.array('string.ends', 'Q')
+            strings = []
+            start = 0
+            with self._view('strings') as heap:
+                for first in range(0, len(ends), STRING_CHUNK):
+                    chunk_ends = ends[first:first + STRING_CHUNK]
+                    raw = bytes(heap[start:chunk_ends[-1]])
+                    offsets = [end - start for end in chunk_ends]
+                    if raw.isascii():
+                        # One decode per chunk, then slices of it
+                        text = raw.decode('ascii')
+                        strings.extend(map(text.__getitem__, map(slice, [0] + offsets, offsets)))
+                    else:
+                        strings.extend(raw[begin:end].decode('utf-8', 'surrogatepass')
+                                       for begin, end in zip([0] + offsets, offsets))
+                    start = chunk_ends[-1]
+            self._strings = strings
+        return self._strings
+
+    def resolve(self, refs):
+        """Strings of an array of references"""
+        return list(map(self.strings().__getitem__, refs))
+
+    def _fix(self, record, columns, mask, extra):
+        """Drop the fields a row did not hold in columns and add its JSON part"""
+        for field in _absent_fields(columns, mask):
+            delattr(record, field)
+        if extra:
+            record.update(json.loads(self._strings[extra]))
+
+    def channels(self):
+        """The channel table, shared through records.channels like normalized videos' channels"""
+        strings = self.strings()
+        full = (1 << len(CHANNEL_COLUMNS)) - 1
+        channels = []
+        with self._view('channels') as view:
+            for mask, extra, name, avatar, subscribers in CHANNEL_ROW.iter_unpack(view):
+                fields = {'name': strings[name], 'avatar': strings[avatar], 'subscriberCount': subscribers}
+                if mask != full or extra:
+                    fields = {field: value for bit, (field, value) in enumerate(fields.items()) if mask & (1 << bit)}
+                    if extra:
+                        fields.update(json.loads(strings[extra]))
+                channels.append(channel_table.intern(fields))
+        return channels
+
+    def videos(self):
+        """The videos as records, in catalog order"""
+        strings = self.strings()
+        channels = self.channels()
+        full = (1 << len(VIDEO_COLUMNS)) - 1
+        new = Video.__new__
+        videos = []
+        with self._view('videos') as view:
+            for (mask, extra, video_id, title, description, thumbnail, video_url, channel,
+                 duration, views, uploaded_at) in VIDEO_ROW.iter_unpack(view):
+                video = new(Video)
+                video._extra = None
+                video.id = strings[video_id]
+                video.title = strings[title]
+                video.description = strings[description]
+                video.thumbnail = strings[thumbnail]
+                video.videoUrl = strings[video_url]
+                video.channel = channels[channel] if mask & 32 else None
+                video.durationSeconds = duration
+                video.viewCount = views
+                video.uploadedAt = uploaded_at
+                if mask != full or extra:
+                    self._fix(video, VIDEO_COLUMNS, mask, extra)
+                videos.append(video)
+        return videos
+
+    def comments(self):
+        """{video_id: comments in posting order}"""
+        strings = self.strings()
+        owners = self.array('comment.videos', 'I')
+        full = (1 << len(COMMENT_COLUMNS)) - 1
+        new = Comment.__new__
+        threads = {}
+        with self._view('comments') as view:
+            for owner, (mask, extra, comment_id, author, avatar, content, parent_id,
+                        replies, likes, posted_at) in zip(owners, COMMENT_ROW.iter_unpack(view)):
+                comment = new(Comment)
+                comment._extra = None
+                comment.id = strings[comment_id]
+                comment.author = strings[author]
+                comment.avatar = strings[avatar]
+                comment.content = strings[content]
+                comment.parentId = strings[parent_id]
+                comment.replyCount = replies
+                comment.likes = likes
+                comment.postedAt = posted_at
+                if mask != full or extra:
+                    self._fix(comment, COMMENT_COLUMNS, mask, extra)
+                thread = threads.get(owner)
+                if thread is None:
+                    thread = threads[owner] = []
+                thread.append(comment)
+        return {strings[owner]: thread for owner, thread in threads.items()}
+
+
+def snapshot_path(backend):
+    """SNAPSHOT_PATH, else a file next to the backend's database; None if it keeps nothing"""
+    if not backend.persistent:
+        return None
+    return os.environ.get('SNAPSHOT_PATH') or f"{backend.path}.snapshot"
+
+
+class SnapshotScheduler:
+    """Calls write() from a background thread whenever the snapshot at path
+    is older than interval seconds, and once more on close() if it still is
+
+    Every worker runs one, and a worker finding a snapshot another just
+    wrote skips its turn, so workers sharing path take turns. A stale
+    snapshot loses nothing: workers starting from it read the rows changed
+    since from the backend, so exiting workers (drains, reloads, recycles)
+    do not rewrite a recent one.
+    """
+
+    def __init__(self, path, write, interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self._write = write
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='snapshot-writer', daemon=True)
+            self._thread.start()
+        return self
+
+    def due(self):
+        try:
+            return time.time() - os.path.getmtime(self.path) >= self.interval
+        except OSError:
+            return True
+
+    def write(self):
+        """Write a snapshot now if one is due"""
+        if not self.due():
+            return
+        try:
+            # Claims the turn: workers checking meanwhile find it fresh
+            os.utime(self.path)
+        except OSError:
+            pass
+        start = time.perf_counter()
+        try:
+            if self._write():
+                logger.info("📸 Catalog snapshot written to %s in %.1fs", self.path, time.perf_counter() - start)
+        except Exception as e:
+            logger.error("❌ Catalog snapshot failed: %s", e)
+
+    def _run(self):
+        while not self._stop.wait(min(self.interval, 60.0)):
+            self.write()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write()
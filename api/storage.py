@@ -0,0 +1,526 @@
+"""Storage backends that persist the catalog underneath CatalogStore
+
+CatalogStore always serves reads from memory; a backend decides where the
+data comes from at startup, where writes go, and who allocates ids.
+MemoryBackend keeps nothing (development mode). SqliteBackend persists to a
+WAL-mode SQLite file so data survives restarts and several worker processes
+can share one catalog.
+"""
+import itertools
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from records import plain
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'catalog.db')
+
+
+def _next_number(ids, prefix=''):
+    """First free number after the numeric ids already in use"""
+    numbers = [int(i[len(prefix):]) for i in ids if i.startswith(prefix) and i[len(prefix):].isdigit()]
+    return max(numbers, default=0) + 1
+
+
+def _without_id(record):
+    return {key: value for key, value in plain(record).items() if key != 'id'}
+
+
+class MemoryBackend:
+    """Non-persistent backend: the seed data is the whole catalog"""
+
+    persistent = False
+
+    def __init__(self):
+        self._videos = []
+        self._comments = {}
+        self._video_ids = itertools.count(1)
+        self._comment_ids = itertools.count(1)
+
+    def open(self, seed_videos=(), seed_comments=None):
+        self._videos = [dict(video.items()) for video in seed_videos]
+        self._comments = {
+            video_id: [dict(comment.items()) for comment in thread]
+            for video_id, thread in (seed_comments or {}).items()
+        }
+        self._video_ids = itertools.count(_next_number(video['id'] for video in self._videos))
+        self._comment_ids = itertools.count(_next_number(
+            (comment['id'] for thread in self._comments.values() for comment in thread), prefix='c'))
+
+    def load(self):
+        """Return (videos, {video_id: comments}) to populate the store with"""
+        videos, comments = self._videos, self._comments
+        self._videos, self._comments = [], {}
+        return videos, comments
+
+    def poll(self):
+        """Changes made by other processes since the last poll: none here"""
+        return [], [], [], []
+
+    def snapshot_position(self):
+        """Nothing outlives the process, so there is nothing to resume"""
+        return None
+
+    def load_changes(self, position):
+        return None
+
+    def insert_videos(self, batch):
+        return [str(next(self._video_ids)) for _ in batch]
+
+    def insert_comment(self, video_id, fields):
+        return f"c{next(self._comment_ids)}"
+
+    def add_views(self, deltas):
+        pass
+
+    def update_video(self, video_id, fields):
+        pass
+
+    def add_comment_likes(self, deltas):
+        pass
+
+    def close(self):
+        pass
+
+
+class _PendingWrite:
+    __slots__ = ('sql', 'rows', 'done', 'ids', 'error')
+
+    def __init__(self, sql, rows):
+        self.sql = sql
+        self.rows = rows
+        self.done = threading.Event()
+        self.ids = None
+        self.error = None
+
+
+class SqliteBackend:
+    """SQLite persistence in WAL mode with pooled connections and group commit
+
+    Every thread reuses its own connection (sqlite3 caches the prepared
+    statements per connection). Writes are queued to one writer thread that
+    drains whatever is pending and commits it in a single transaction, so a
+    burst of concurrent comments or uploads costs one fsync instead of one
+    each; callers block until their batch is durable and get their row ids.
+    """
+
+    persistent = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS videos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data TEXT NOT NULL,
+            uploaded_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_videos_uploaded_at ON videos (uploaded_at);
+        CREATE TABLE IF NOT EXISTS comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            video_id TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_comments_video_id ON comments (video_id, id);
+        CREATE INDEX IF NOT EXISTS idx_comments_created_at ON comments (created_at);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value
+        );
+    """
+    # Rows changed in place carry the number of the write transaction that
+    # last changed them; added by _migrate() where missing
+    CHANGE_COLUMNS = """
+        ALTER TABLE videos ADD COLUMN changed INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE comments ADD COLUMN changed INTEGER NOT NULL DEFAULT 0;
+    """
+    CHANGE_INDEXES = """
+        CREATE INDEX IF NOT EXISTS idx_videos_changed ON videos (changed);
+        CREATE INDEX IF NOT EXISTS idx_comments_changed ON comments (changed);
+    """
+
+    INSERT_VIDEO = "INSERT INTO videos (id, data, uploaded_at) VALUES (?, ?, ?)"
+    INSERT_COMMENT = "INSERT INTO comments (id, video_id, data, created_at) VALUES (?, ?, ?, ?)"
+    CHANGE = "(SELECT value FROM meta WHERE key = 'changes')"
+    ADD_VIEWS = ("UPDATE videos SET data = json_set(data, '$.viewCount', "
+                 f"COALESCE(json_extract(data, '$.viewCount'), 0) + ?), changed = {CHANGE} WHERE id = ?")
+    UPDATE_VIDEO = f"UPDATE videos SET data = json_patch(data, ?), changed = {CHANGE} WHERE id = ?"
+    ADD_COMMENT_LIKES = ("UPDATE comments SET data = json_set(data, '$.likes', "
+                         f"COALESCE(json_extract(data, '$.likes'), 0) + ?), changed = {CHANGE} WHERE id = ?")
+    # Run first in every write transaction, which numbers it
+    NEXT_CHANGE = "UPDATE meta SET value = value + 1 WHERE key = 'changes'"
+    SELECT_CHANGE = "SELECT value FROM meta WHERE key = 'changes'"
+    SELECT_VIDEO = "SELECT id, data FROM videos WHERE id = ?"
+    SELECT_VIDEOS_AFTER = "SELECT id, data FROM videos WHERE id > ? ORDER BY id"
+    SELECT_VIDEOS_CHANGED = "SELECT id, data FROM videos WHERE changed > ? AND id <= ? ORDER BY id"
+    SELECT_COMMENTS = "SELECT id, data FROM comments WHERE video_id = ? ORDER BY id"
+    SELECT_COMMENTS_AFTER = "SELECT id, video_id, data FROM comments WHERE id > ? ORDER BY id"
+    SELECT_COMMENTS_CHANGED = ("SELECT id, video_id, data FROM comments WHERE changed > ? AND id <= ? "
+                               "ORDER BY id")
+    # Bulk imports keep given ids, skipping rows whose id is taken and
+    # comments on videos that do not exist
+    IMPORT_VIDEO = "INSERT OR IGNORE INTO videos (id, data, uploaded_at) VALUES (?, ?, ?)"
+    IMPORT_COMMENT = ("INSERT OR IGNORE INTO comments (id, video_id, data, created_at) "
+                      "SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM videos WHERE id = ?)")
+
+    # Writes committed together at most; larger bursts span several commits
+    MAX_BATCH = 512
+    # Minimum seconds between checks for commits made by other processes
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, path=DEFAULT_DB_PATH, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._pool = []
+        self._pool_lock = threading.Lock()
+        self._writes = queue.Queue()
+        self._writer = None
+        self._poll_lock = threading.Lock()
+        self._next_poll = 0.0
+        self._data_version = None
+        self._catalog_id = None
+        self._synced_video_id = 0
+        self._synced_comment_id = 0
+        self._synced_change = 0
+
+    # Connections
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.path, timeout=self.timeout, check_same_thread=False,
+            isolation_level=None, cached_statements=128)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        with self._pool_lock:
+            self._pool.append(connection)
+        return connection
+
+    def connection(self):
+        """This thread's pooled connection"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    # Lifecycle
+
+    def open(self, seed_videos=(), seed_comments=None):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self.connection()
+        connection.executescript(self.SCHEMA)
+        self._migrate(connection)
+        if seed_videos:
+            self._seed(connection, seed_videos, seed_comments or {})
+        self._poll_connection = self._connect()
+        self._data_version = self._poll_connection.execute("PRAGMA data_version").fetchone()[0]
+        self._writer = threading.Thread(target=self._write_loop, name='sqlite-writer', daemon=True)
+        self._writer.start()
+        logger.info("🗄️  SQLite catalog at %s", self.path)
+
+    def _migrate(self, connection):
+        """Bring a database made by an older version up to date and read its catalog id"""
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(videos)")}
+            if 'changed' not in columns:
+                for statement in self.CHANGE_COLUMNS.split(';'):
+                    if statement.strip():
+                        connection.execute(statement)
+            # Also recreates them after an interrupted bulk import
+            for statement in self.CHANGE_INDEXES.split(';'):
+                if statement.strip():
+                    connection.execute(statement)
+            # Snapshots of one database must never be applied to another
+            connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('catalog_id', ?)",
+                               (uuid.uuid4().hex,))
+            connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('changes', 0)")
+            self._catalog_id = connection.execute(
+                "SELECT value FROM meta WHERE key = 'catalog_id'").fetchone()[0]
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _seed(self, connection, videos, comments):
+        """Insert the seed data, only into a brand-new database"""
+        now = time.time()
+        # Checked inside the write transaction so concurrently starting
+        # workers cannot both seed
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if connection.execute("SELECT EXISTS (SELECT 1 FROM sqlite_sequence)").fetchone()[0]:
+                connection.execute("ROLLBACK")
+                return
+            connection.executemany(self.INSERT_VIDEO, [
+                (int(video['id']), json.dumps(_without_id(video)), now) for video in videos])
+            connection.executemany(self.INSERT_COMMENT, [
+                (int(comment['id'].lstrip('c')), video_id, json.dumps(_without_id(comment)), now)
+                for video_id, thread in comments.items() for comment in thread])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def load(self):
+        """Return (videos, {video_id: comments}) to populate the store with"""
+        self._synced_change = self._read_change()
+        videos, comments = self._read_after(0, 0)
+        by_video = {}
+        for video_id, comment in comments:
+            by_video.setdefault(video_id, []).append(comment)
+        return videos, by_video
+
+    def close(self):
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+        with self._pool_lock:
+            for connection in self._pool:
+                connection.close()
+            self._pool.clear()
+        self._local = threading.local()
+
+    # Reads
+
+    def _read_change(self):
+        """Number of the last committed write transaction"""
+        return self.connection().execute(self.SELECT_CHANGE).fetchone()[0]
+
+    def _read_after(self, video_id, comment_id):
+        connection = self.connection()
+        videos = []
+        for row_id, data in connection.execute(self.SELECT_VIDEOS_AFTER, (video_id,)):
+            videos.append(dict(json.loads(data), id=str(row_id)))
+            self._synced_video_id = max(self._synced_video_id, row_id)
+        comments = []
+        for row_id, owner, data in connection.execute(self.SELECT_COMMENTS_AFTER, (comment_id,)):
+            comments.append((owner, dict(json.loads(data), id=f"c{row_id}")))
+            self._synced_comment_id = max(self._synced_comment_id, row_id)
+        return videos, comments
+
+    def _read_changed(self, change, video_id, comment_id):
+        """Rows up to the given ids that were changed in place after transaction change"""
+        connection = self.connection()
+        videos = [dict(json.loads(data), id=str(row_id))
+                  for row_id, data in connection.execute(self.SELECT_VIDEOS_CHANGED, (change, video_id))]
+        comments = [(owner, dict(json.loads(data), id=f"c{row_id}"))
+                    for row_id, owner, data in connection.execute(
+                        self.SELECT_COMMENTS_CHANGED, (change, comment_id))]
+        return videos, comments
+
+    def _read_since(self, video_id, comment_id, change):
+        """(new videos, new comments, changed videos, changed comments) since a position
+
+        The change number is read first: transactions commit in number
+        order, so everything up to it is visible to the reads that follow
+        and nothing numbered below it can commit later.
+        """
+        latest = self._read_change()
+        videos, comments = self._read_after(video_id, comment_id)
+        changed_videos, changed_comments = self._read_changed(change, video_id, comment_id)
+        self._synced_change = max(self._synced_change, latest)
+        return videos, comments, changed_videos, changed_comments
+
+    def get_video(self, video_id):
+        if not video_id.isdigit():
+            return None
+        row = self.connection().execute(self.SELECT_VIDEO, (int(video_id),)).fetchone()
+        return dict(json.loads(row[1]), id=str(row[0])) if row else None
+
+    def get_comments(self, video_id):
+        return [dict(json.loads(data), id=f"c{row_id}")
+                for row_id, data in self.connection().execute(self.SELECT_COMMENTS, (video_id,))]
+
+    def poll(self):
+        """Rows committed since the last poll: (new videos, new (video_id,
+        comment) pairs, videos changed in place, comments changed in place)
+
+        Rows written by this process are included too; the store skips new
+        ones it already holds and takes changed ones as stored. Checks are
+        rate limited to POLL_INTERVAL and cost a single PRAGMA when nothing
+        changed.
+        """
+        now = time.monotonic()
+        if now < self._next_poll or not self._poll_lock.acquire(blocking=False):
+            return [], [], [], []
+        try:
+            self._next_poll = now + self.POLL_INTERVAL
+            version = self._poll_connection.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return [], [], [], []
+            self._data_version = version
+            return self._read_since(self._synced_video_id, self._synced_comment_id, self._synced_change)
+        finally:
+            self._poll_lock.release()
+
+    def snapshot_position(self):
+        """Where the rows read so far end, for load_changes() to resume from"""
+        return {
+            'catalog': self._catalog_id,
+            'video': self._synced_video_id,
+            'comment': self._synced_comment_id,
+            'change': self._synced_change,
+        }
+
+    def load_changes(self, position):
+        """Instead of load(): what poll() would have returned since position
+
+        Returns None when position is from another database, which then has
+        to be loaded in full.
+        """
+        if position.get('catalog') != self._catalog_id:
+            return None
+        self._synced_video_id = position['video']
+        self._synced_comment_id = position['comment']
+        self._synced_change = position['change']
+        return self._read_since(position['video'], position['comment'], position['change'])
+
+    # Writes
+
+    def _submit(self, sql, rows):
+        pending = _PendingWrite(sql, rows)
+        self._writes.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.ids
+
+    def insert_videos(self, batch):
+        now = time.time()
+        rows = [(None, json.dumps(_without_id(fields)), now) for fields in batch]
+        return [str(row_id) for row_id in self._submit(self.INSERT_VIDEO, rows)]
+
+    def insert_comment(self, video_id, fields):
+        rows = [(None, video_id, json.dumps(_without_id(fields)), time.time())]
+        return f"c{self._submit(self.INSERT_COMMENT, rows)[0]}"
+
+    def add_views(self, deltas):
+        """Add {video_id: count} view deltas in one transaction
+
+        Other workers pick up the new totals at their next poll().
+        """
+        rows = [(count, int(video_id)) for video_id, count in deltas.items() if video_id.isdigit()]
+        if rows:
+            self._submit(self.ADD_VIEWS, rows)
+
+    def update_video(self, video_id, fields):
+        """Merge fields into the stored video (JSON merge patch)"""
+        if video_id.isdigit():
+            self._submit(self.UPDATE_VIDEO, [(json.dumps(fields), int(video_id))])
+
+    def add_comment_likes(self, deltas):
+        """Add {comment_id: count} like deltas in one transaction"""
+        rows = [(count, int(comment_id[1:])) for comment_id, count in deltas.items()
+                if comment_id.startswith('c') and comment_id[1:].isdigit()]
+        if rows:
+            self._submit(self.ADD_COMMENT_LIKES, rows)
+
+    # Bulk import (see scripts/bulk_import.py)
+
+    def import_rows(self, sql, rows):
+        """Run sql (IMPORT_VIDEO or IMPORT_COMMENT) for every row in one
+        transaction on this thread's connection, bypassing the writer
+        queue; returns (inserted, refused) row counts
+
+        Rows asking for an id at or below the table's newest are refused:
+        workers only read rows above their position (SELECT_*_AFTER), so
+        such a row would be stored but never served.
+        """
+        table = 'videos' if sql == self.IMPORT_VIDEO else 'comments'
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            newest = connection.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+            accepted = [row for row in rows if row[0] is None or row[0] > newest]
+            connection.execute(self.NEXT_CHANGE)
+            inserted = connection.executemany(sql, accepted).rowcount
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return inserted, len(rows) - len(accepted)
+
+    def drop_indexes(self):
+        """Drop the secondary indexes so bulk inserts only append to the
+        tables; returns their definitions for create_indexes()
+        """
+        connection = self.connection()
+        indexes = connection.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall()
+        for name, _ in indexes:
+            connection.execute(f'DROP INDEX IF EXISTS "{name}"')
+        return [sql for _, sql in indexes]
+
+    def create_indexes(self, definitions):
+        """Rebuild indexes dropped by drop_indexes(), each in one pass over its table"""
+        connection = self.connection()
+        for sql in definitions:
+            if "IF NOT EXISTS" not in sql:
+                sql = sql.replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1)
+            connection.execute(sql)
+
+    def _write_loop(self):
+        connection = self.connection()
+        while True:
+            pending = [self._writes.get()]
+            while len(pending) < self.MAX_BATCH:
+                try:
+                    pending.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in pending
+            pending = [write for write in pending if write is not None]
+            if pending:
+                self._commit(connection, pending)
+            if stop:
+                return
+
+    def _commit(self, connection, pending):
+        # Any error, not just sqlite3.Error (a TypeError from bad parameters,
+        # say), is handed to its caller: one escaping would end the writer
+        # thread and leave every caller waiting forever
+        try:
+            self._execute_batch(connection, pending)
+        except Exception:
+            # Retry one by one so a single bad write cannot fail the others
+            for write in pending:
+                try:
+                    self._execute_batch(connection, [write])
+                except Exception as e:
+                    logger.error("❌ SQLite write failed: %s", e)
+                    write.error = e
+        finally:
+            for write in pending:
+                write.done.set()
+
+    @classmethod
+    def _execute_batch(cls, connection, pending):
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(cls.NEXT_CHANGE)
+            for write in pending:
+                write.ids = [connection.execute(write.sql, row).lastrowid for row in write.rows]
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+
+def create_backend(name=None, path=None):
+    """Build the backend selected by name or the STORAGE_BACKEND env var"""
+    name = (name or os.environ.get('STORAGE_BACKEND', 'memory')).lower()
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'sqlite':
+        return SqliteBackend(path or os.environ.get('STORAGE_PATH', DEFAULT_DB_PATH))
+    raise ValueError(f"Unknown storage backend: {name}")
@@ -0,0 +1,936 @@
+"""In-memory catalog store shared by the API handlers"""
+import gc
+import heapq
+import itertools
+import logging
+import math
+import operator
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from counters import ShardedCounter
+from facets import VideoFacets
+from formatting import display_comment, display_video, normalize_comment, normalize_video
+from fragments import FragmentCache
+from http_cache import ResourceVersions
+from pagination import PaginationError, SortedIndex, cursor_sort, decode_cursor, encode_cursor
+from projection import MAX_PROJECTIONS, Projection, SharedValues
+from records import Comment, Video, columns
+from related import RelatedIndex
+from search import SearchIndex, searchable_fields
+from snapshot import Snapshot, SnapshotError, SnapshotWriter
+from storage import MemoryBackend
+from suggest import SuggestIndex, Suggester
+
+logger = logging.getLogger(__name__)
+
+# sort parameter -> (sorted index, walk it in reverse)
+VIDEO_SORTS = {
+    'oldest': ('posted', False),
+    'newest': ('posted', True),
+    'views': ('views', False),
+    'duration': ('duration', False),
+}
+# Sort orders saved in snapshots as row numbers ('posted' is the row order)
+SNAPSHOT_ORDERS = ('views', 'duration', 'uploaded')
+# Filter combinations whose matches and facet counts are kept
+FILTER_CACHE_SIZE = 256
+COMMENT_SORTS = {
+    'oldest': ('posted', False),
+    'newest': ('posted', True),
+    'top': ('likes', False),
+    'likes': ('likes', False),
+}
+
+
+def _video_keys(video, sequence):
+    """Sort keys for each video index; every key ends with the video id"""
+    return {
+        'posted': (sequence, video['id']),
+        'views': (-video['viewCount'], sequence, video['id']),
+        'duration': (video['durationSeconds'], sequence, video['id']),
+        'uploaded': (video['uploadedAt'], sequence, video['id']),
+    }
+
+
+def _snapshot_orders(snapshot, size):
+    """{sort order name: row numbers in that order} saved in a snapshot of size videos"""
+    orders = {}
+    for name in SNAPSHOT_ORDERS:
+        section = f'order.{name}'
+        if section in snapshot:
+            rows = snapshot.array(section, 'I')
+            # Anything but a permutation of the rows is ignored, not trusted
+            if len(rows) == size and (not size or max(rows) < size) and len(set(rows)) == size:
+                orders[name] = rows
+    return orders
+
+
+# Stands in for a field a record does not have
+_ABSENT = object()
+
+
+def _event_id(record_id):
+    """Numeric part of a video or comment id; backends allocate them in order"""
+    digits = record_id.lstrip('c')
+    return int(digits) if digits.isdigit() else 0
+
+
+def _comment_keys(comment):
+    number = int(comment['id'].lstrip('c') or 0)
+    return {
+        'posted': (number, comment['id']),
+        'likes': (-comment['likes'], number, comment['id']),
+    }
+
+
+def _page_matching(index, matches, limit, cursor, sort, reverse):
+    """_page() over only the ids in matches, walking the full index"""
+    after = decode_cursor(cursor, sort) if cursor else None
+    try:
+        keys = list(itertools.islice((key for key in index.walk(after, reverse) if key[-1] in matches), limit + 1))
+    except TypeError as e:
+        raise PaginationError("Invalid cursor") from e
+    next_cursor = encode_cursor(sort, keys[limit - 1]) if len(keys) > limit else None
+    return [key[-1] for key in keys[:limit]], next_cursor
+
+
+def _page(index, limit, cursor, sort, reverse):
+    after = decode_cursor(cursor, sort) if cursor else None
+    try:
+        keys, has_more = index.page(limit, after=after, reverse=reverse)
+    except TypeError as e:
+        raise PaginationError("Invalid cursor") from e
+    next_cursor = encode_cursor(sort, keys[-1]) if has_more and keys else None
+    return [key[-1] for key in keys], next_cursor
+
+
+class CatalogStore:
+    """Thread-safe catalog of videos and their comments
+
+    Readers never take a lock. Writers serialize on a single lock and publish
+    copy-on-write snapshots: the video list is an immutable tuple swapped as a
+    whole, and each video's comments are a tuple replaced under its key, so a
+    reader always sees a complete before- or after-state.
+
+    Ids are allocated by the storage backend (see storage.py): monotonic
+    counters in memory, or the database when persistent. Backend writes run
+    outside the store lock so a persistent backend can batch concurrent
+    writers into one transaction.
+
+    Every write bumps the matching key in self.versions ('videos',
+    ('video', id) or ('comments', video_id)) for HTTP revalidation.
+    Encoded JSON for each record is cached until that record changes, so
+    list responses are assembled from bytes instead of re-encoded.
+
+    Listings can be paged through pre-sorted indexes (see pagination.py):
+    one per video sort order, built per video's comments on first use.
+
+    Records are the slotted Video and Comment classes of records.py and
+    hold numbers (see formatting.py); display strings are rendered into the
+    cached JSON. Relative labels like "2 hours ago" expire, so the
+    store remembers when each served resource's labels change and bumps its
+    version then. View pings go to a ShardedCounter and are applied to the
+    records in one batch per flush interval.
+
+    New videos and comments, including those polled from other workers, are
+    published to events (an events.EventHub) on the 'videos' and
+    ('comments', video_id) channels, with the record's number as event id.
+    Records other workers changed in place (view and like totals) are
+    polled too and taken as stored.
+
+    Given the path of a snapshot (see snapshot.py) of the same database,
+    the store starts from it and the backend changes made since, instead
+    of loading every row and rebuilding the indexes; write_snapshot()
+    writes one.
+    """
+
+    def __init__(self, videos=(), comments=None, backend=None, events=None, snapshot=None):
+        self._write_lock = threading.Lock()
+        # Held from reading the backend to applying what was read, and from
+        # writing counts to the backend to applying them, so polls and
+        # flushes cannot interleave (see write_snapshot())
+        self._refresh_lock = threading.Lock()
+        # Snapshot the catalog was loaded from (see _load_snapshot())
+        self._snapshot = None
+        self._videos = ()
+        self._videos_by_id = {}
+        self._comments = {}
+        self._comments_by_id = {}
+        # Threaded replies: parent comment id -> replies, comment id -> video id
+        self._replies = {}
+        self._comment_video = {}
+        # Comment ids published by only one of add_comment / refresh so far
+        self._unmatched_comment_ids = set()
+        self.search_index = SearchIndex()
+        self.related_index = RelatedIndex()
+        # Created once loaded, from the loaded catalog
+        self.suggester = None
+        self.versions = ResourceVersions()
+        self._video_fragments = FragmentCache(display_video)
+        # (fields, compact) -> Projection, least recently used first
+        self._projections = OrderedDict()
+        self._projection_lock = threading.Lock()
+        self._shared_values = SharedValues()
+        self._comment_fragments = FragmentCache(display_comment)
+        # Heap of (expires_at, tiebreak, version key) for labels in served
+        # responses; keys mix strings and tuples so they must never be compared
+        self._label_expiry = []
+        self._expiry_sequence = itertools.count()
+        self._label_watch = {}
+        self._expiry_lock = threading.Lock()
+        self._sequence = itertools.count()
+        # Sort orders; duration and uploaded also answer range filters
+        self._video_orders = {name: SortedIndex() for name in ('posted', 'views', 'duration', 'uploaded')}
+        self.facets = VideoFacets()
+        # Filter key -> (generations, matching ids, facet counts); uploads
+        # and duration changes bump the catalog generation, view flushes the
+        # views generation (which only minViews filters depend on)
+        self._filter_cache = OrderedDict()
+        self._filter_lock = threading.Lock()
+        self._catalog_generation = 0
+        self._views_generation = 0
+        self._comment_orders = {}
+        self._reply_orders = {}
+        # Channel -> event id of its newest record, where streams start
+        self._newest_event = {}
+        # Set once loaded: the initial catalog is not announced
+        self.events = None
+
+        # Loading creates millions of long-lived objects and no garbage
+        # cycles, which the cycle collector would otherwise re-scan on every
+        # pass as the catalog grows
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            now = time.time()
+            videos = [normalize_video(video, now) for video in videos]
+            comments = {
+                video_id: [normalize_comment(comment, now) for comment in thread]
+                for video_id, thread in (comments or {}).items()
+            }
+            self.backend = backend or MemoryBackend()
+            self.backend.open(videos, comments)
+            if not (snapshot and self._load_snapshot(snapshot, now)):
+                videos, comments = self.backend.load()
+                self._publish_videos([normalize_video(video, now) for video in videos])
+                self._add_loaded_comments({
+                    video_id: [normalize_comment(comment, now) for comment in thread]
+                    for video_id, thread in comments.items()
+                })
+        finally:
+            if collecting:
+                gc.enable()
+
+        self.view_counter = ShardedCounter(self.apply_view_deltas).start()
+        self.like_counter = ShardedCounter(self.apply_like_deltas).start()
+        if self.suggester is None:
+            self.suggester = self._new_suggester()
+        self.events = events
+
+    def _new_suggester(self, index=None):
+        return Suggester(self._suggestions, on_rebuild=lambda: self.versions.bump('suggestions'), index=index)
+
+    def _add_loaded_comments(self, comments):
+        """Add {video_id: comments in posting order} while loading, skipping
+        comments already held
+        """
+        replies = {}
+        comments_by_id, comment_video = self._comments_by_id, self._comment_video
+        for video_id, thread in comments.items():
+            top_level = []
+            added = []
+            for comment in thread:
+                comment_id = comment['id']
+                if comment_id in comments_by_id:
+                    continue
+                comments_by_id[comment_id] = comment
+                comment_video[comment_id] = video_id
+                added.append(comment_id)
+                parent_id = comment.get('parentId')
+                if parent_id:
+                    replies.setdefault(parent_id, []).append(comment)
+                else:
+                    top_level.append(comment)
+            if added:
+                self._note_events(('comments', video_id), added)
+            self._comments[video_id] = self._comments.get(video_id, ()) + tuple(top_level)
+        for parent_id, thread in replies.items():
+            thread = self._replies[parent_id] = self._replies.get(parent_id, ()) + tuple(thread)
+            if parent_id in self._comments_by_id:
+                self._comments_by_id[parent_id]['replyCount'] = len(thread)
+
+    def _load_snapshot(self, path, now):
+        """Load the catalog from the snapshot at path and the backend changes
+        made since; False if there is no usable snapshot there
+
+        Its records were current as of the backend position it holds, and
+        its indexes hold exactly those records. Rows added after that
+        position (this worker's own writes may be among them, and already
+        in the snapshot) are published on top; rows changed in place are
+        taken as stored.
+        """
+        if not os.path.exists(path):
+            return False
+        start = time.perf_counter()
+        try:
+            snapshot = Snapshot(path)
+        except (OSError, SnapshotError) as e:
+            logger.warning("⚠️  Ignoring catalog snapshot %s: %s", path, e)
+            return False
+        changes = self.backend.load_changes(snapshot.meta.get('position', {}))
+        if changes is None:
+            snapshot.close()
+            logger.warning("⚠️  Ignoring catalog snapshot %s: it is of another catalog", path)
+            return False
+        try:
+            videos = snapshot.videos()
+            comments = snapshot.comments()
+            if not self.search_index.load_snapshot(snapshot):
+                self.search_index.add_many(videos)
+            if not self.related_index.load_snapshot(snapshot):
+                self.related_index.add_many(videos)
+            suggest_index = SuggestIndex.from_snapshot(snapshot)
+            orders = _snapshot_orders(snapshot, len(videos))
+        except Exception as e:
+            # A damaged snapshot must not keep the worker from starting
+            logger.error("❌ Unreadable catalog snapshot %s: %s", path, e)
+            self.search_index, self.related_index = SearchIndex(), RelatedIndex()
+            snapshot.close()
+            return False
+        # The indexes read their arrays from the mapping, which stays open
+        # until close()
+        self._snapshot = snapshot
+        self._publish_videos(videos, indexed=True, orders=orders)
+        self._add_loaded_comments(comments)
+
+        new_videos, new_comments, changed_videos, changed_comments = changes
+        self._publish_videos([normalize_video(video, now) for video in new_videos
+                              if video['id'] not in self._videos_by_id])
+        threads = {}
+        for video_id, comment in new_comments:
+            threads.setdefault(video_id, []).append(normalize_comment(comment, now))
+        self._add_loaded_comments(threads)
+        self._apply_stored(changed_videos, changed_comments)
+        if suggest_index is not None:
+            self.suggester = self._new_suggester(suggest_index)
+            # Weighted by the view counts of when the snapshot was written
+            self.suggester.invalidate()
+        logger.info("📸 Loaded %s videos from %s in %.1fs (%s added and %s changed since)",
+                    len(videos), path, time.perf_counter() - start, len(new_videos), len(changed_videos))
+        return True
+
+    def close(self):
+        self.view_counter.close()
+        self.like_counter.close()
+        self.backend.close()
+        if self._snapshot is not None:
+            self._snapshot.close()
+
+    def _publish_videos(self, new_videos, indexed=False, orders=None):
+        """List new videos; indexed when the text indexes already hold them
+
+        orders maps sort order names to the positions of new_videos in that
+        order, as a snapshot saves them, so their keys need no sorting.
+        """
+        if not new_videos:
+            return
+        # Index first so a video is searchable by the time it is listed
+        if not indexed:
+            self.search_index.add_many(new_videos)
+            self.related_index.add_many(new_videos)
+        if self.suggester is not None:
+            self.suggester.invalidate()
+        # The keys _video_keys() makes, built a column at a time
+        ids, views, durations, uploaded, channels = columns(
+            new_videos, 'id', 'viewCount', 'durationSeconds', 'uploadedAt', 'channel.name')
+        first = next(self._sequence)
+        sequences = range(first, first + len(new_videos))
+        self._sequence = itertools.count(sequences.stop)
+        self._videos_by_id.update(zip(ids, new_videos))
+        keys = {
+            'posted': list(zip(sequences, ids)),
+            'views': list(zip(map(operator.neg, views), sequences, ids)),
+            'duration': list(zip(durations, sequences, ids)),
+            'uploaded': list(zip(uploaded, sequences, ids)),
+        }
+        for name, index in self._video_orders.items():
+            if orders and name in orders:
+                keys[name] = list(map(keys[name].__getitem__, orders[name]))
+            index.add_many(keys[name])
+        self.facets.add_many(ids, channels, durations)
+        self._catalog_generation += 1
+        self._videos = self._videos + tuple(new_videos)
+        self._note_events('videos', ids)
+        self.versions.bump('videos')
+
+    # Reads
+
+    def __len__(self):
+        return len(self._videos)
+
+    def list_videos(self):
+        """Snapshot of every video in upload order"""
+        return self._videos
+
+    def get_video(self, video_id):
+        return self._videos_by_id.get(video_id)
+
+    def related_videos(self, video_id, limit=24):
+        """Videos to suggest alongside video_id
+
+        The most similar by title, channel and description first, topped up
+        with the most viewed other videos.
+        """
+        by_id = self._videos_by_id
+        related = [by_id[other_id] for other_id in self.related_index.neighbors(video_id, limit)]
+        if len(related) < limit:
+            seen = {video_id, *(video['id'] for video in related)}
+            videos, _ = self.page_videos('views', limit + len(seen))
+            related += [video for video in videos if video['id'] not in seen][:limit - len(related)]
+        return related
+
+    def _suggestions(self):
+        """(text, kind, weight) completions: titles and channel names by view count"""
+        titles = {}
+        channels = {}
+        for video in self._videos:
+            title, channel = video['title'], video['channel']['name']
+            titles[title] = titles.get(title, 0) + video['viewCount']
+            channels[channel] = channels.get(channel, 0) + video['viewCount']
+        return ([(title, 'title', views) for title, views in titles.items()] +
+                [(channel, 'channel', views) for channel, views in channels.items()])
+
+    def suggest(self, query, limit=10):
+        """JSON fragments of the most viewed titles and channels completing query"""
+        return self.suggester.complete(query, limit)
+
+    def search(self, query, limit=None):
+        """Videos matching query, most relevant first"""
+        by_id = self._videos_by_id
+        return [by_id[video_id] for video_id in self.search_index.search(query, limit=limit)]
+
+    def get_comments(self, video_id):
+        """Snapshot of a video's top-level comments in posting order"""
+        return self._comments.get(video_id, ())
+
+    def get_comment(self, video_id, comment_id):
+        """The comment or reply comment_id if it belongs to video_id, else None"""
+        if self._comment_video.get(comment_id) != video_id:
+            return None
+        return self._comments_by_id.get(comment_id)
+
+    def get_replies(self, comment_id):
+        """Snapshot of the direct replies to a comment in posting order"""
+        return self._replies.get(comment_id, ())
+
+    def page_videos(self, sort=None, limit=24, cursor=None):
+        """One page of videos in sort order plus the cursor for the next
+
+        Without an explicit sort, a cursor continues in the order it came from.
+        """
+        sort = sort or (cursor and cursor_sort(cursor)) or 'oldest'
+        if sort not in VIDEO_SORTS:
+            raise PaginationError(f"Unsupported sort '{sort}', expected one of {', '.join(VIDEO_SORTS)}")
+        name, reverse = VIDEO_SORTS[sort]
+        ids, next_cursor = _page(self._video_orders[name], limit, cursor, sort, reverse)
+        by_id = self._videos_by_id
+        return [by_id[video_id] for video_id in ids], next_cursor
+
+    def filter_videos(self, filters, sort=None, limit=24, cursor=None):
+        """One page of the videos matching filters plus its next cursor, the
+        number of matches and facet counts over them
+
+        filters may hold channels (names, any of), minDuration and
+        maxDuration (seconds, inclusive), uploadedAfter and uploadedBefore
+        (epoch seconds) and minViews. Candidates come from whichever filter
+        matches fewest videos, a channel set or a range of a sorted index;
+        the other filters are checked on those candidates only.
+        """
+        sort = sort or (cursor and cursor_sort(cursor)) or 'oldest'
+        if sort not in VIDEO_SORTS:
+            raise PaginationError(f"Unsupported sort '{sort}', expected one of {', '.join(VIDEO_SORTS)}")
+        name, reverse = VIDEO_SORTS[sort]
+        order = self._video_orders[name]
+        by_id = self._videos_by_id
+        matches, facets = self._filter_matches(filters)
+        if matches is None:
+            ids, next_cursor = _page(order, limit, cursor, sort, reverse)
+            return [by_id[video_id] for video_id in ids], next_cursor, len(self._videos), facets
+
+        if len(matches) * len(matches) >= limit * len(order):
+            # Walking the sort order reaches a page after about
+            # limit * len(order) / len(matches) keys, fewer than sorting
+            # the matches would take
+            ids, next_cursor = _page_matching(order, matches, limit, cursor, sort, reverse)
+        else:
+            # A video being published may not be in every order yet
+            keys = (order.key(video_id) for video_id in matches)
+            ids, next_cursor = _page(SortedIndex(key for key in keys if key is not None),
+                                     limit, cursor, sort, reverse)
+        return [by_id[video_id] for video_id in ids], next_cursor, len(matches), facets
+
+    def _filter_matches(self, filters):
+        """(ids of the matching videos, facet counts); ids is None when every video matches"""
+        key = tuple(sorted((name, tuple(sorted(set(value))) if name == 'channels' else value)
+                           for name, value in filters.items()))
+        generations = (self._catalog_generation, self._views_generation if 'minViews' in filters else 0)
+        with self._filter_lock:
+            cached = self._filter_cache.get(key)
+            if cached is not None and cached[0] == generations:
+                self._filter_cache.move_to_end(key)
+                return cached[1], cached[2]
+
+        # A filter every video passes cannot narrow anything down
+        constraints = [constraint for constraint in self._filter_constraints(filters)
+                       if constraint[0] < len(self._videos)]
+        if constraints:
+            by_id = self._videos_by_id
+            constraints.sort(key=lambda constraint: constraint[0])
+            candidates = constraints[0][1]()
+            tests = [test for _, _, test in constraints[1:]]
+            if tests:
+                candidates = [video_id for video_id in candidates if all(test(by_id[video_id]) for test in tests)]
+            matches = frozenset(candidates)
+            facets = self.facets.counts(matches)
+        else:
+            matches, facets = None, self.facets.counts()
+
+        with self._filter_lock:
+            self._filter_cache[key] = (generations, matches, facets)
+            self._filter_cache.move_to_end(key)
+            if len(self._filter_cache) > FILTER_CACHE_SIZE:
+                self._filter_cache.popitem(last=False)
+        return matches, facets
+
+    def _filter_constraints(self, filters):
+        """(estimated matches, candidate ids(), test(video)) per active filter"""
+        constraints = []
+        names = set(filters.get('channels') or ())
+        if names:
+            sets = [self.facets.channel(name) for name in names]
+            constraints.append((sum(map(len, sets)), lambda: frozenset().union(*sets),
+                                lambda video: video['channel']['name'] in names))
+
+        def add_range(order_name, low, high, test):
+            order = self._video_orders[order_name]
+            constraints.append((order.count_between(low, high),
+                                lambda: [key[-1] for key in order.between(low, high)], test))
+
+        shortest, longest = filters.get('minDuration'), filters.get('maxDuration')
+        if shortest is not None or longest is not None:
+            shortest = 0 if shortest is None else shortest
+            longest = math.inf if longest is None else longest
+            add_range('duration', (shortest,), (longest, math.inf),
+                      lambda video: shortest <= video['durationSeconds'] <= longest)
+        after, before = filters.get('uploadedAfter'), filters.get('uploadedBefore')
+        if after is not None or before is not None:
+            after = -math.inf if after is None else after
+            before = math.inf if before is None else before
+            add_range('uploaded', (after,), (before,),
+                      lambda video: after <= video['uploadedAt'] < before)
+        min_views = filters.get('minViews')
+        if min_views is not None:
+            # Keys start with -viewCount, so the most viewed come first
+            add_range('views', None, (-min_views, math.inf),
+                      lambda video: video['viewCount'] >= min_views)
+        return constraints
+
+    def page_search(self, query, limit=None, cursor=None):
+        """One page of search results, most relevant first"""
+        after = decode_cursor(cursor, 'relevance') if cursor else None
+        try:
+            keys = self.search_index.search_page(query, limit=limit, after=after)
+        except TypeError as e:
+            raise PaginationError("Invalid cursor") from e
+        full_page = keys and len(keys) == (limit or self.search_index.max_results)
+        next_cursor = encode_cursor('relevance', keys[-1]) if full_page else None
+        by_id = self._videos_by_id
+        return [by_id[key[-1]] for key in keys], next_cursor
+
+    def page_comments(self, video_id, sort=None, limit=24, cursor=None):
+        """One page of a video's comments plus the cursor for the next"""
+        return self._page_thread(self._comment_orders, self._comments, video_id, sort, limit, cursor)
+
+    def page_replies(self, comment_id, sort=None, limit=24, cursor=None):
+        """One page of the direct replies to a comment plus the next cursor"""
+        return self._page_thread(self._reply_orders, self._replies, comment_id, sort, limit, cursor)
+
+    def _page_thread(self, all_orders, threads, thread_id, sort, limit, cursor):
+        sort = sort or (cursor and cursor_sort(cursor)) or 'oldest'
+        if sort not in COMMENT_SORTS:
+            raise PaginationError(f"Unsupported sort '{sort}', expected one of {', '.join(COMMENT_SORTS)}")
+        name, reverse = COMMENT_SORTS[sort]
+        orders = all_orders.get(thread_id)
+        if orders is None:
+            with self._write_lock:
+                orders = all_orders.get(thread_id)
+                if orders is None:
+                    orders = self._build_comment_orders(all_orders, threads, thread_id)
+        ids, next_cursor = _page(orders[name], limit, cursor, sort, reverse)
+        by_id = self._comments_by_id
+        return [by_id[comment_id] for comment_id in ids], next_cursor
+
+    @staticmethod
+    def _build_comment_orders(all_orders, threads, thread_id):
+        """Sorted indexes for one thread, built on its first paged read"""
+        keys = [_comment_keys(comment) for comment in threads.get(thread_id, ())]
+        orders = {name: SortedIndex(k[name] for k in keys) for name in ('posted', 'likes')}
+        all_orders[thread_id] = orders
+        return orders
+
+    # Serialization
+
+    def video_json(self, video):
+        """Cached JSON bytes for a video record"""
+        fragment, expires_at = self._video_fragments.get(video['id'], video, time.time())
+        self._watch_labels(('video', video['id']), expires_at)
+        return fragment
+
+    def videos_json(self, videos, version_key='videos'):
+        """Cached JSON bytes for each video of a listing served under version_key"""
+        fragments, expires_at = self._video_fragments.get_many(
+            ((video['id'], video) for video in videos), time.time())
+        self._watch_labels(version_key, expires_at)
+        return fragments
+
+    def projected_videos_json(self, videos, fields=None, compact=False, version_key='videos'):
+        """videos_json() restricted to fields (see projection.parse_fields)
+
+        Returns (fragments, shared) where shared is the encoded table the
+        fragments refer to when compact, else None.
+        """
+        projection = self._projection(fields, compact)
+        fragments, expires_at = projection.get_many(videos, time.time())
+        self._watch_labels(version_key, expires_at)
+        return fragments, projection.shared_json(videos) if compact else None
+
+    def _projection(self, fields, compact):
+        key = (fields, compact)
+        with self._projection_lock:
+            projection = self._projections.get(key)
+            if projection is None:
+                projection = self._projections[key] = Projection(fields, compact, self._shared_values)
+                if len(self._projections) > MAX_PROJECTIONS:
+                    self._projections.popitem(last=False)
+            self._projections.move_to_end(key)
+        return projection
+
+    def _invalidate_video(self, video_id):
+        self._video_fragments.invalidate(video_id)
+        for projection in list(self._projections.values()):
+            projection.invalidate(video_id)
+
+    def comment_json(self, video_id, comment):
+        fragment, expires_at = self._comment_fragments.get(comment['id'], comment, time.time())
+        self._watch_labels(('comments', video_id), expires_at)
+        return fragment
+
+    def comments_json(self, video_id, comments):
+        fragments, expires_at = self._comment_fragments.get_many(
+            ((comment['id'], comment) for comment in comments), time.time())
+        self._watch_labels(('comments', video_id), expires_at)
+        return fragments
+
+    def _watch_labels(self, version_key, expires_at):
+        """Bump version_key once the labels just served go stale"""
+        if expires_at == math.inf or expires_at >= self._label_watch.get(version_key, math.inf):
+            return
+        with self._expiry_lock:
+            self._label_watch[version_key] = expires_at
+            heapq.heappush(self._label_expiry, (expires_at, next(self._expiry_sequence), version_key))
+
+    def _expire_labels(self, now):
+        expired = []
+        with self._expiry_lock:
+            while self._label_expiry and self._label_expiry[0][0] <= now:
+                expires_at, _, version_key = heapq.heappop(self._label_expiry)
+                if self._label_watch.get(version_key) == expires_at:
+                    del self._label_watch[version_key]
+                    expired.append(version_key)
+        if expired:
+            self.versions.bump(*expired)
+
+    def comment_count(self):
+        return len(self._comments_by_id)
+
+    # Writes
+
+    def add_video(self, fields):
+        """Store a new video and return it with its allocated id"""
+        return self.add_videos([fields])[0]
+
+    def add_videos(self, batch):
+        """Store several videos under one snapshot swap"""
+        now = time.time()
+        batch = [normalize_video(fields, now) for fields in batch]
+        ids = self.backend.insert_videos(batch)
+        new_videos = [Video(fields, id=video_id) for fields, video_id in zip(batch, ids)]
+        with self._write_lock:
+            published = [v for v in new_videos if v['id'] not in self._videos_by_id]
+            self._publish_videos(published)
+        self._announce(published, [])
+        return new_videos
+
+    def add_comment(self, video_id, fields):
+        """Append a comment to a video's thread and return it with its id"""
+        fields = normalize_comment(fields)
+        comment = Comment(fields, id=self.backend.insert_comment(video_id, fields))
+        with self._write_lock:
+            published = self._publish_comment(video_id, comment)
+        if published:
+            self._announce([], [(video_id, comment)])
+        return comment
+
+    def _publish_comment(self, video_id, comment):
+        """Add a comment to its thread; False if it was already published"""
+        if self.backend.persistent:
+            # The same comment can also arrive through refresh(); publish once
+            if comment['id'] in self._unmatched_comment_ids:
+                self._unmatched_comment_ids.discard(comment['id'])
+                return False
+            self._unmatched_comment_ids.add(comment['id'])
+        self._comments_by_id[comment['id']] = comment
+        self._comment_video[comment['id']] = video_id
+        self._note_event(('comments', video_id), comment['id'])
+        parent_id = comment.get('parentId')
+        if parent_id:
+            self._replies[parent_id] = self._replies.get(parent_id, ()) + (comment,)
+            orders = self._reply_orders.get(parent_id)
+            parent = self._comments_by_id.get(parent_id)
+            if parent is not None:
+                parent['replyCount'] = parent.get('replyCount', 0) + 1
+                self._comment_fragments.invalidate(parent_id)
+        else:
+            self._comments[video_id] = self._comments.get(video_id, ()) + (comment,)
+            orders = self._comment_orders.get(video_id)
+        if orders is not None:
+            for name, key in _comment_keys(comment).items():
+                orders[name].add(key)
+        self.versions.bump(('comments', video_id))
+        return True
+
+    def _note_event(self, channel, record_id):
+        event_id = _event_id(record_id)
+        if event_id > self._newest_event.get(channel, 0):
+            self._newest_event[channel] = event_id
+
+    def _note_events(self, channel, record_ids):
+        """_note_event() for each of record_ids, which must not be empty"""
+        event_id = max(map(_event_id, record_ids))
+        if event_id > self._newest_event.get(channel, 0):
+            self._newest_event[channel] = event_id
+
+    def newest_event_id(self, channel):
+        """Event id of the newest record on an event channel (0 if none)"""
+        return self._newest_event.get(channel, 0)
+
+    def _announce(self, videos, comments):
+        """Publish new videos and (video_id, comment) pairs to the event hub"""
+        if self.events is None:
+            return
+        for video in videos:
+            self.events.publish('videos', _event_id(video['id']), 'video', self.video_json(video))
+        for video_id, comment in comments:
+            self.events.publish(('comments', video_id), _event_id(comment['id']), 'comment',
+                                self.comment_json(video_id, comment))
+
+    def update_video(self, video_id, fields):
+        """Merge fields into a stored video; returns it, or None if unknown"""
+        if video_id not in self._videos_by_id:
+            return None
+        self.backend.update_video(video_id, fields)
+        with self._write_lock:
+            video = self._videos_by_id[video_id]
+            old_duration = video['durationSeconds']
+            video.update(fields)
+            if video['durationSeconds'] != old_duration:
+                sequence = self._video_orders['posted'].key(video_id)[0]
+                self._video_orders['duration'].add(_video_keys(video, sequence)['duration'])
+                self.facets.move_duration(video_id, old_duration, video['durationSeconds'])
+                self._catalog_generation += 1
+            self._invalidate_video(video_id)
+            self.versions.bump('videos', ('video', video_id))
+        return video
+
+    def record_view(self, video_id):
+        """Count one view; applied to the record at the next counter flush"""
+        self.view_counter.increment(video_id)
+
+    def apply_view_deltas(self, deltas):
+        """Add batched view counts to the records, indexes and backend"""
+        deltas = {video_id: count for video_id, count in deltas.items() if video_id in self._videos_by_id}
+        if not deltas:
+            return
+        # A poll in between would read totals that already include deltas
+        with self._refresh_lock:
+            self.backend.add_views(deltas)
+            with self._write_lock:
+                views_keys = []
+                for video_id, count in deltas.items():
+                    video = self._videos_by_id[video_id]
+                    video['viewCount'] += count
+                    self._invalidate_video(video_id)
+                    sequence = self._video_orders['posted'].key(video_id)[0]
+                    views_keys.append(_video_keys(video, sequence)['views'])
+                self._video_orders['views'].add_many(views_keys)
+                self._views_generation += 1
+                self.versions.bump('videos', *(('video', video_id) for video_id in deltas))
+        self.suggester.invalidate()
+
+    def like_comment(self, comment_id):
+        """Count one like; returns the like count including unflushed likes"""
+        self.like_counter.increment(comment_id)
+        return self._comments_by_id[comment_id]['likes'] + self.like_counter.pending(comment_id)
+
+    def apply_like_deltas(self, deltas):
+        """Add batched likes to the comments, their ranking and the backend"""
+        deltas = {comment_id: count for comment_id, count in deltas.items() if comment_id in self._comments_by_id}
+        if not deltas:
+            return
+        with self._refresh_lock:
+            self.backend.add_comment_likes(deltas)
+            with self._write_lock:
+                for comment_id, count in deltas.items():
+                    self._comments_by_id[comment_id]['likes'] += count
+                self._likes_changed(deltas)
+
+    def _likes_changed(self, comment_ids):
+        """Re-rank comments whose likes changed and bump their threads' versions"""
+        # One index update per thread, however many of its comments changed
+        changed = {}
+        for comment_id in comment_ids:
+            comment = self._comments_by_id[comment_id]
+            self._comment_fragments.invalidate(comment_id)
+            parent_id = comment.get('parentId')
+            if parent_id:
+                orders = self._reply_orders.get(parent_id)
+            else:
+                orders = self._comment_orders.get(self._comment_video[comment_id])
+            if orders is not None:
+                changed.setdefault(id(orders), (orders, []))[1].append(_comment_keys(comment)['likes'])
+        for orders, keys in changed.values():
+            orders['likes'].add_many(keys)
+        self.versions.bump(*{('comments', self._comment_video[comment_id]) for comment_id in comment_ids})
+
+    def refresh(self):
+        """Apply label expiry and changes committed by other worker processes"""
+        if self._label_expiry and self._label_expiry[0][0] <= time.time():
+            self._expire_labels(time.time())
+        # Another thread is already polling
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            videos, comments, changed_videos, changed_comments = self.backend.poll()
+            if not (videos or comments or changed_videos or changed_comments):
+                return
+            with self._write_lock:
+                videos = [normalize_video(v) for v in videos if v['id'] not in self._videos_by_id]
+                self._publish_videos(videos)
+                published = []
+                for video_id, comment in comments:
+                    comment = normalize_comment(comment)
+                    if self._publish_comment(video_id, comment):
+                        published.append((video_id, comment))
+                self._apply_stored(changed_videos, changed_comments)
+        finally:
+            self._refresh_lock.release()
+        self._announce(videos, published)
+
+    def _apply_stored(self, videos, comments):
+        """Take videos and (video_id, comment) pairs that were changed in
+        place in the backend as stored
+
+        The stored totals include this worker's own flushed counts, so they
+        replace the in-memory ones rather than add to them.
+        """
+        views_keys = []
+        bumped = set()
+        for fields in videos:
+            video = self._videos_by_id.get(fields['id'])
+            if video is None:
+                continue
+            fields = normalize_video(fields)
+            changes = [(key, value) for key, value in fields.items() if video.get(key, _ABSENT) != value]
+            if not changes:
+                continue
+            old_duration, old_text = video['durationSeconds'], searchable_fields(video)
+            video.update(changes)
+            sequence = self._video_orders['posted'].key(video['id'])[0]
+            keys = _video_keys(video, sequence)
+            views_keys.append(keys['views'])
+            if video['durationSeconds'] != old_duration:
+                self._video_orders['duration'].add(keys['duration'])
+                self.facets.move_duration(video['id'], old_duration, video['durationSeconds'])
+                self._catalog_generation += 1
+            if searchable_fields(video) != old_text:
+                self.search_index.add(video)
+            self._invalidate_video(video['id'])
+            bumped.add(('video', video['id']))
+        if views_keys:
+            self._video_orders['views'].add_many(views_keys)
+            self._views_generation += 1
+            self.versions.bump('videos', *bumped)
+            if self.suggester is not None:
+                self.suggester.invalidate()
+
+        changed = []
+        for _, fields in comments:
+            comment = self._comments_by_id.get(fields['id'])
+            if comment is None:
+                continue
+            # Reply counts are kept in memory only
+            changes = [(key, value) for key, value in normalize_comment(fields).items()
+                       if key != 'replyCount' and comment.get(key, _ABSENT) != value]
+            if changes:
+                comment.update(changes)
+                changed.append(comment['id'])
+        if changed:
+            self._likes_changed(changed)
+
+    # Snapshots
+
+    def write_snapshot(self, path):
+        """Write the catalog and its indexes to a snapshot at path (see
+        snapshot.py); False if the backend keeps nothing to resume from
+
+        The records and the indexes' contents are captured under the locks,
+        then written out without them. Polls are held off during the
+        capture so the backend position matches the records exactly; counts
+        applied to the records while they are written may or may not be
+        included, which is harmless as the rows they changed are re-read
+        from the backend on load.
+        """
+        with self._refresh_lock, self._write_lock:
+            position = self.backend.snapshot_position()
+            if position is None:
+                return False
+            videos = self._videos
+            comments = [(self._comment_video[comment_id], comment)
+                        for comment_id, comment in self._comments_by_id.items()]
+            ids = [video['id'] for video in videos]
+            writes = [self.search_index.snapshot(ids), self.related_index.snapshot(ids), self.suggester.snapshot()]
+            orders = {name: self._video_orders[name].between() for name in SNAPSHOT_ORDERS}
+        writer = SnapshotWriter(path)
+        try:
+            writer.add_records(videos, comments)
+            rows = dict(zip(ids, range(len(ids))))
+            for name, keys in orders.items():
+                writer.add(f'order.{name}', array('I', map(rows.__getitem__, map(operator.itemgetter(-1), keys))))
+            # An index that could not be captured is rebuilt on load
+            for write in writes:
+                if write is not None:
+                    write(writer)
+            writer.commit({
+                'createdAt': time.time(),
+                'position': position,
+                'videos': len(videos),
+                'comments': len(comments),
+            })
+        except BaseException:
+            writer.abort()
+            raise
+        return True
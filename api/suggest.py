@@ -0,0 +1,229 @@
+"""Search-as-you-type completions over video titles and channel names"""
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from fragments import encode
+from search import tokenize
+
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 20
+# Matches on a later word of a suggestion rank below matches on its start
+INNER_WORD_WEIGHT = 0.5
+# Completions of recent prefixes kept per snapshot
+RESULT_CACHE_SIZE = 4096
+# Catalog changes are picked up by rebuilding at most this often (seconds)
+REBUILD_INTERVAL = 60.0
+
+
+def fold(text):
+    """Lowercase text with punctuation and runs of spaces collapsed, as typed prefixes are"""
+    return " ".join(tokenize(text))
+
+
+def fold_prefix(query):
+    """fold() a typed query, keeping a trailing space that ends the last word"""
+    folded = fold(query)
+    if folded and query[-1:].isspace():
+        folded += " "
+    return folded
+
+
+class SuggestIndex:
+    """Immutable prefix index over weighted suggestions
+
+    Every word start of every suggestion is an entry, sorted by the folded
+    text from that word on, so the entries completing a prefix form one
+    contiguous range found by bisection. A segment tree over the entry
+    weights yields the heaviest entries of any range in O(k log n), which
+    keeps completion time independent of how many suggestions match.
+    """
+
+    def __init__(self, suggestions=()):
+        """suggestions: iterable of (text, kind, weight)"""
+        self._fragments = []
+        self._folded = []
+        entry_suggestion = []
+        entry_offset = []
+        entry_weight = []
+        for text, kind, weight in suggestions:
+            folded = fold(text)
+            if not folded:
+                continue
+            number = len(self._folded)
+            self._folded.append(folded)
+            self._fragments.append(encode({'text': text, 'type': kind}))
+            offset = 0
+            for word in folded.split(" "):
+                entry_suggestion.append(number)
+                entry_offset.append(offset)
+                entry_weight.append(weight if offset == 0 else weight * INNER_WORD_WEIGHT)
+                offset += len(word) + 1
+
+        folded = self._folded
+        order = sorted(range(len(entry_suggestion)),
+                       key=lambda entry: folded[entry_suggestion[entry]][entry_offset[entry]:])
+        self._suggestion = array('i', [entry_suggestion[entry] for entry in order])
+        self._offset = array('i', [entry_offset[entry] for entry in order])
+        self._weight = array('d', [entry_weight[entry] for entry in order])
+        self._tree = self._build_tree()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._folded)
+
+    def snapshot(self):
+        """write(writer) storing the index in a snapshot (see snapshot.py)"""
+        def write(writer):
+            writer.add('suggest.folded', writer.strings(self._folded))
+            writer.add('suggest.fragments', writer.strings(fragment.decode() for fragment in self._fragments))
+            writer.add('suggest.suggestion', self._suggestion)
+            writer.add('suggest.offset', self._offset)
+            writer.add('suggest.weight', self._weight)
+            writer.add('suggest.tree', self._tree)
+        return write
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """The index stored in a snapshot, or None if it has none"""
+        if 'suggest.folded' not in snapshot:
+            return None
+        index = cls()
+        index._folded = snapshot.resolve(snapshot.array('suggest.folded', 'I'))
+        index._fragments = [fragment.encode() for fragment in
+                            snapshot.resolve(snapshot.array('suggest.fragments', 'I'))]
+        index._suggestion = snapshot.array('suggest.suggestion', 'i')
+        index._offset = snapshot.array('suggest.offset', 'i')
+        index._weight = snapshot.array('suggest.weight', 'd')
+        index._tree = snapshot.array('suggest.tree', 'i')
+        return index
+
+    def _build_tree(self):
+        """Bottom-up segment tree: each node holds the heaviest entry below it"""
+        size = len(self._weight)
+        weight = self._weight
+        tree = array('i', bytes(4 * 2 * size))
+        tree[size:] = array('i', range(size))
+        for node in range(size - 1, 0, -1):
+            left, right = tree[2 * node], tree[2 * node + 1]
+            tree[node] = left if weight[left] >= weight[right] else right
+        return tree
+
+    def _heaviest(self, lo, hi):
+        """Index of the heaviest entry in lo..hi-1, the first one on ties"""
+        weight, tree, size = self._weight, self._tree, len(self._weight)
+        best = lo
+        lo += size
+        hi += size
+        while lo < hi:
+            if lo & 1:
+                candidate = tree[lo]
+                if weight[candidate] > weight[best] or (weight[candidate] == weight[best] and candidate < best):
+                    best = candidate
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                candidate = tree[hi]
+                if weight[candidate] > weight[best] or (weight[candidate] == weight[best] and candidate < best):
+                    best = candidate
+            lo >>= 1
+            hi >>= 1
+        return best
+
+    def _range(self, prefix):
+        folded, suggestion, offset = self._folded, self._suggestion, self._offset
+        length = len(prefix)
+
+        def key(entry):
+            start = offset[entry]
+            return folded[suggestion[entry]][start:start + length]
+
+        entries = range(len(suggestion))
+        return bisect_left(entries, prefix, key=key), bisect_right(entries, prefix, key=key)
+
+    def complete(self, query, limit=DEFAULT_SUGGESTIONS):
+        """JSON fragments of the heaviest suggestions completing query"""
+        prefix = fold_prefix(query)
+        if not prefix or limit <= 0:
+            return []
+        cache_key = (prefix, limit)
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+                return cached
+        lo, hi = self._range(prefix)
+        results = []
+        if lo < hi:
+            seen = set()
+            best = self._heaviest(lo, hi)
+            # Best-first over subranges split around each entry taken
+            heap = [(-self._weight[best], best, lo, hi)]
+            while heap and len(results) < limit:
+                _, entry, lo, hi = heapq.heappop(heap)
+                number = self._suggestion[entry]
+                if number not in seen:
+                    seen.add(number)
+                    results.append(self._fragments[number])
+                for lo, hi in ((lo, entry), (entry + 1, hi)):
+                    if lo < hi:
+                        best = self._heaviest(lo, hi)
+                        heapq.heappush(heap, (-self._weight[best], best, lo, hi))
+        with self._lock:
+            self._cache[cache_key] = results
+            if len(self._cache) > RESULT_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return results
+
+
+class Suggester:
+    """Serves completions from a SuggestIndex that follows the catalog
+
+    source() returns the current (text, kind, weight) suggestions. After
+    invalidate(), the next completion starts a rebuild in the background
+    (at most once per rebuild_interval) and keeps answering from the
+    previous index until the new one is swapped in; on_rebuild is called
+    after every swap. Given an index (e.g. from a snapshot), it starts from
+    that instead of building one.
+    """
+
+    def __init__(self, source, on_rebuild=None, rebuild_interval=REBUILD_INTERVAL, index=None):
+        self._source = source
+        self._on_rebuild = on_rebuild
+        self.rebuild_interval = rebuild_interval
+        self._index = index if index is not None else SuggestIndex(source())
+        self._built_at = time.monotonic()
+        self._dirty = False
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._dirty = True
+
+    def snapshot(self):
+        return self._index.snapshot()
+
+    def complete(self, query, limit=DEFAULT_SUGGESTIONS):
+        if self._dirty and time.monotonic() - self._built_at >= self.rebuild_interval:
+            with self._lock:
+                start = not self._rebuilding
+                self._rebuilding = True
+            if start:
+                threading.Thread(target=self.rebuild, name='suggest-rebuild', daemon=True).start()
+        return self._index.complete(query, limit)
+
+    def rebuild(self):
+        """Build a new index from source() and swap it in"""
+        try:
+            self._dirty = False
+            self._index = SuggestIndex(self._source())
+            self._built_at = time.monotonic()
+            if self._on_rebuild is not None:
+                self._on_rebuild()
+        finally:
+            with self._lock:
+                self._rebuilding = False
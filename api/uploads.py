@@ -0,0 +1,311 @@
+"""Resumable chunked uploads streamed straight to disk
+
+Protocol:
+    POST /api/uploads                      create a session, returns its id
+    PUT  /api/uploads/<id>                 append bytes (Content-Range: bytes a-b/total)
+    GET  /api/uploads/<id>                 current offset, to resume after a disconnect
+    POST /api/uploads/<id>/finalize        verify, move into the media directory
+
+Chunks are copied from the request stream to a .part file in fixed-size
+blocks, so memory stays constant whatever the upload size. The size of the
+.part file is the session offset, and session metadata lives in a JSON
+sidecar, so any worker process can continue an upload another one started.
+A SHA-256 of the data received so far is kept per session (rebuilt from the
+file when another process wrote the last chunk) and checked on finalize.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: sessions are only locked within a process
+    fcntl = None
+
+DEFAULT_MEDIA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'media')
+
+BLOCK_SIZE = 1024 * 1024
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 20 * 1024 ** 3))
+# Unfinished sessions untouched for this long are deleted
+SESSION_TTL = 24 * 3600
+
+_UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+_EXTENSION_RE = re.compile(r'^\.[a-z0-9]{1,8}$')
+
+
+class UploadError(Exception):
+    """Raised for requests the upload protocol rejects; carries an HTTP status"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class UploadManager:
+    """Upload sessions under media_dir/.uploads, finished files in media_dir
+
+    Both directories are on one filesystem, so the final move is an atomic
+    rename and a half-written file is never visible in the media directory.
+    """
+
+    def __init__(self, media_dir=None):
+        self.media_dir = media_dir or os.environ.get('MEDIA_PATH', DEFAULT_MEDIA_DIR)
+        self.upload_dir = os.path.join(self.media_dir, '.uploads')
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # upload id -> (offset, hasher) for the data this process has seen
+        self._hashers = {}
+
+    # Paths and session state
+
+    def _paths(self, upload_id):
+        if not _UPLOAD_ID_RE.match(upload_id):
+            raise UploadError("Upload not found", 404)
+        base = os.path.join(self.upload_dir, upload_id)
+        return base + '.json', base + '.part'
+
+    def _lock(self, upload_id):
+        with self._locks_lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _load(self, upload_id):
+        meta_path, _ = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError("Upload not found", 404) from None
+
+    def _save(self, upload_id, session):
+        meta_path, _ = self._paths(upload_id)
+        temp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(session, f)
+        os.replace(temp_path, meta_path)
+
+    def _offset(self, upload_id):
+        _, part_path = self._paths(upload_id)
+        try:
+            return os.path.getsize(part_path)
+        except FileNotFoundError:
+            return 0
+
+    def media_path(self, name):
+        return os.path.join(self.media_dir, name)
+
+    # Protocol steps
+
+    def create(self, title, description='', channel='Your Channel', size=None, filename=''):
+        """Start a session and return its status"""
+        if size is not None:
+            if not isinstance(size, int) or size < 0:
+                raise UploadError("size must be a non-negative integer")
+            if size > MAX_UPLOAD_SIZE:
+                raise UploadError(f"Upload exceeds the {MAX_UPLOAD_SIZE} byte limit", 413)
+        extension = os.path.splitext(filename or '')[1].lower()
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self._sweep()
+
+        upload_id = uuid.uuid4().hex
+        session = {
+            'title': title,
+            'description': description,
+            'channel': channel,
+            'size': size,
+            'mediaFile': upload_id + (extension if _EXTENSION_RE.match(extension) else ''),
+            'created': time.time(),
+            'videoId': None,
+        }
+        _, part_path = self._paths(upload_id)
+        open(part_path, 'wb').close()
+        self._save(upload_id, session)
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        session = self._load(upload_id)
+        return {
+            'uploadId': upload_id,
+            'offset': session['size'] if session['videoId'] else self._offset(upload_id),
+            'size': session['size'],
+            'videoId': session['videoId'],
+        }
+
+    def _hasher(self, upload_id, f, offset):
+        """SHA-256 of the first offset bytes, reusing this process's running hash"""
+        cached = self._hashers.get(upload_id)
+        if cached is not None and cached[0] == offset:
+            return cached[1]
+        hasher = hashlib.sha256()
+        f.seek(0)
+        remaining = offset
+        while remaining:
+            block = f.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+        return hasher
+
+    def write(self, upload_id, stream, length, start=None, total=None, checksum=None):
+        """Append length bytes from stream at start; return the new offset
+
+        start must equal the current offset (409 with the real offset
+        otherwise). If checksum (SHA-256 hex of this chunk) is given and does
+        not match, the chunk is discarded. A chunk cut short by a disconnect
+        is kept, so the client resumes from exactly what arrived.
+        """
+        session = self._load(upload_id)
+        if session['videoId']:
+            raise UploadError("Upload already finalized", 409, offset=session['size'])
+        if total is not None:
+            if session['size'] is None:
+                if total > MAX_UPLOAD_SIZE:
+                    raise UploadError(f"Upload exceeds the {MAX_UPLOAD_SIZE} byte limit", 413)
+                session['size'] = total
+                self._save(upload_id, session)
+            elif total != session['size']:
+                raise UploadError(f"Total size {total} does not match the declared {session['size']}")
+
+        _, part_path = self._paths(upload_id)
+        with self._lock(upload_id):
+            try:
+                f = open(part_path, 'r+b')
+            except FileNotFoundError:
+                # finalize() moved it, in this process or another
+                raise UploadError("Upload already finalized", 409, offset=session['size']) from None
+            with f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                    # Another process may have finalized while we waited;
+                    # f would then be the media file
+                    if not os.path.exists(part_path):
+                        raise UploadError("Upload already finalized", 409, offset=session['size'])
+                return self._write_locked(upload_id, f, session, stream, length, start, checksum)
+
+    def _write_locked(self, upload_id, f, session, stream, length, start, checksum):
+        """write() once the session's .part file f is open and locked"""
+        offset = os.fstat(f.fileno()).st_size
+        if start is not None and start != offset:
+            raise UploadError(f"Chunk starts at {start} but the upload is at {offset}", 409, offset=offset)
+        limit = session['size'] if session['size'] is not None else MAX_UPLOAD_SIZE
+        if offset + length > limit:
+            raise UploadError(f"Chunk ends past the {limit} byte upload size", 416, offset=offset)
+
+        hasher = self._hasher(upload_id, f, offset).copy()
+        chunk_hasher = hashlib.sha256() if checksum else None
+        f.seek(offset)
+        written = 0
+        try:
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                f.write(block)
+                hasher.update(block)
+                if chunk_hasher is not None:
+                    chunk_hasher.update(block)
+                written += len(block)
+        except Exception:
+            # Client went away mid-chunk: keep what arrived (unless it
+            # cannot be verified) and let it resume from there
+            if chunk_hasher is not None:
+                f.truncate(offset)
+                self._hashers.pop(upload_id, None)
+            else:
+                f.flush()
+                self._hashers[upload_id] = (offset + written, hasher)
+            raise
+        if chunk_hasher is not None and (written != length or chunk_hasher.hexdigest() != checksum.lower()):
+            f.truncate(offset)
+            raise UploadError("Chunk checksum mismatch", 400, offset=offset)
+        f.flush()
+        self._hashers[upload_id] = (offset + written, hasher)
+        return offset + written
+
+    def finalize(self, upload_id, register, checksum=None):
+        """Verify the upload, move it into the media directory and register it
+
+        register(session) is called once the file is in place and returns the
+        new video id. Returns (session, created); retrying a finalized upload
+        returns its session with created False. If the process dies between
+        the move and registration, a retry verifies the moved file again.
+        """
+        _, part_path = self._paths(upload_id)
+        with self._lock(upload_id):
+            session = self._load(upload_id)
+            if session['videoId']:
+                return session, False
+            media_path = self.media_path(session['mediaFile'])
+            try:
+                f = open(part_path, 'rb')
+            except FileNotFoundError:
+                try:
+                    # Moved by a finalize in another process; same inode
+                    f = open(media_path, 'rb')
+                except FileNotFoundError:
+                    raise UploadError("Upload file is missing", 409) from None
+            with f:
+                if fcntl is not None:
+                    # Waits out a chunk or a finalize another process is
+                    # running; the lock is held until the session is saved
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                    session = self._load(upload_id)
+                    if session['videoId']:
+                        return session, False
+                # Already moved by a process that died before registering
+                moved = not os.path.exists(part_path)
+                size = os.fstat(f.fileno()).st_size
+                if session['size'] is not None and size != session['size']:
+                    raise UploadError(f"Upload incomplete: {size} of {session['size']} bytes", 409, offset=size)
+                if size == 0:
+                    raise UploadError("Upload is empty", 409, offset=0)
+                digest = self._hasher(upload_id, f, size).hexdigest()
+                if checksum and digest != checksum.lower():
+                    raise UploadError("Checksum mismatch", 422)
+                if not moved:
+                    os.fsync(f.fileno())
+                    os.replace(part_path, media_path)
+                    self._fsync_dir(self.media_dir)
+                self._hashers.pop(upload_id, None)
+
+                session.update(size=size, sha256=digest)
+                session['videoId'] = register(session)
+                self._save(upload_id, session)
+                return session, True
+
+    @staticmethod
+    def _fsync_dir(path):
+        if hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _sweep(self):
+        """Delete sessions nobody has touched for SESSION_TTL"""
+        cutoff = time.time() - SESSION_TTL
+        touched = {}
+        for entry in os.scandir(self.upload_dir):
+            upload_id = entry.name.split('.', 1)[0]
+            try:
+                touched[upload_id] = max(touched.get(upload_id, 0), entry.stat().st_mtime)
+            except FileNotFoundError:
+                pass
+        for upload_id, mtime in touched.items():
+            if mtime >= cutoff:
+                continue
+            for entry in os.scandir(self.upload_dir):
+                if entry.name.split('.', 1)[0] == upload_id:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+            with self._locks_lock:
+                self._locks.pop(upload_id, None)
+            self._hashers.pop(upload_id, None)
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""Throughput, latency percentiles and RSS for every API route
+
+Builds synthetic catalogs of each --sizes (with skewed comment counts) and
+drives every route in api/index.py with --concurrency threads, either
+in-process through the Flask test client or over a local socket against
+scripts/start_backend.py --production (or an already running --url).
+
+Results are written as JSON (--output); with --baseline the run fails when a
+route's throughput drops or its p95 latency rises by more than --tolerance.
+
+Usage:
+    python benchmarks/api_benchmark.py --sizes 1000 100000 --mode inprocess socket
+    python benchmarks/api_benchmark.py --output base.json
+    python benchmarks/api_benchmark.py --baseline base.json --tolerance 0.25
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from catalog import API_DIR, TOPICS, WORDS, make_catalog, make_comments
+
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+START_BACKEND = os.path.join(os.path.dirname(API_DIR), 'scripts', 'start_backend.py')
+
+# The full unpaged listing is skipped above this many videos
+LIST_ALL_LIMIT = 10000
+PERCENTILES = (50, 95, 99)
+
+
+def _popular_id(rng, size):
+    # Same skew as the comment distribution: popular videos get most traffic
+    return str(int(size ** rng.random()))
+
+
+# Facet selections a filter request picks from
+FILTERS = [
+    'minDuration=0&maxDuration=239', 'minDuration=240&maxDuration=1199', 'minDuration=1200',
+    'channel=CodeMaster', 'channel=ReactPro&minDuration=1200', 'minViews=100000',
+]
+
+# name -> request(rng, size) returning (method, path, json body or None).
+# Reads come first so the writes at the end do not change what they measure.
+ROUTES = {
+    'health': lambda rng, size: ('GET', '/api/health', None),
+    'list': lambda rng, size: ('GET', '/api/videos?limit=24', None),
+    'list_all': lambda rng, size: ('GET', '/api/videos', None),
+    'search': lambda rng, size: ('GET', f'/api/videos?search={rng.choice(TOPICS)}+{rng.choice(WORDS)}', None),
+    'suggest': lambda rng, size: ('GET', f'/api/suggest?q={rng.choice(TOPICS)[:rng.randint(1, 4)]}', None),
+    'filter': lambda rng, size: ('GET', f'/api/videos?{rng.choice(FILTERS)}&sort={rng.choice(["views", "newest"])}', None),
+    'video': lambda rng, size: ('GET', f'/api/videos/{_popular_id(rng, size)}', None),
+    'comments': lambda rng, size: ('GET', f'/api/videos/{_popular_id(rng, size)}/comments', None),
+    'watch': lambda rng, size: ('GET', f'/api/watch/{_popular_id(rng, size)}', None),
+    'batch': lambda rng, size: ('POST', '/api/batch', {'requests': [
+        f'/api/videos/{_popular_id(rng, size)}', f'/api/videos/{_popular_id(rng, size)}/comments?limit=24',
+        '/api/videos?sort=views&limit=24']}),
+    'metrics': lambda rng, size: ('GET', '/api/metrics', None),
+    'view': lambda rng, size: ('POST', f'/api/videos/{_popular_id(rng, size)}/view', None),
+    'comment_write': lambda rng, size: ('POST', f'/api/videos/{_popular_id(rng, size)}/comments',
+                                        {'author': 'bench', 'content': 'Benchmark comment'}),
+    'upload': lambda rng, size: ('POST', '/api/upload',
+                                 {'title': f'Benchmark upload {rng.random():.6f}', 'channel': 'Bench'}),
+}
+
+
+# Memory
+
+def _rss_of(pid):
+    """Resident set size of pid in bytes, or None off Linux"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as children:
+            return [int(child) for child in children.read().split()]
+    except OSError:
+        return []
+
+
+def tree_rss(pid):
+    """RSS of pid plus all of its descendants, in bytes"""
+    total = _rss_of(pid)
+    if total is None:
+        return None
+    for child in _children(pid):
+        total += tree_rss(child) or 0
+    return total
+
+
+def _mb(size):
+    return round(size / 2 ** 20, 1) if size is not None else None
+
+
+# Load generation
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def drive(send, route, size, requests, concurrency, seed=0):
+    """Issue requests of route from concurrency threads; return stats"""
+    per_thread = max(1, requests // concurrency)
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = send.client()
+        barrier.wait()
+        own = latencies[index]
+        for _ in range(per_thread):
+            method, path, body = ROUTES[route](rng, size)
+            start = time.perf_counter()
+            try:
+                status = send(client, method, path, body)
+            except OSError:
+                status = 0
+            own.append(time.perf_counter() - start)
+            if not 200 <= status < 400:
+                errors[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    merged = sorted(value for own in latencies for value in own)
+    result = {
+        'requests': len(merged),
+        'errors': sum(errors),
+        'throughput': round(len(merged) / elapsed, 1),
+    }
+    for pct in PERCENTILES:
+        result[f'p{pct}_ms'] = round(percentile(merged, pct) * 1000, 3)
+    return result
+
+
+class InProcessSender:
+    """Requests through the Flask test client, no socket involved"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def client(self):
+        return self.app.test_client()
+
+    def __call__(self, client, method, path, body):
+        return client.open(path, method=method, json=body).status_code
+
+
+class SocketSender:
+    """Requests over HTTP to a running server, one connection per request"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+
+    def client(self):
+        return None
+
+    def __call__(self, client, method, path, body):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            headers = {'Connection': 'close'}
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            connection.request(method, path, payload, headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+
+# Targets
+
+def build_catalog(size, comments_per_video):
+    started = time.perf_counter()
+    videos = make_catalog(size)
+    comments = make_comments(videos, comments_per_video)
+    print(f"📦 {size:,} videos / {sum(map(len, comments.values())):,} comments "
+          f"generated in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return videos, comments
+
+
+def inprocess_target(videos, comments):
+    """Swap index.store for a catalog of the given data; return (sender, rss)"""
+    import index
+    from store import CatalogStore
+
+    previous = index.store
+    index.store = CatalogStore(videos, comments)
+    previous.close()
+    return InProcessSender(index.app), lambda: _rss_of(os.getpid())
+
+
+def _wait_ready(sender, deadline):
+    while time.monotonic() < deadline:
+        try:
+            if sender(None, 'GET', '/api/health', None) == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def spawn_server(videos, comments, directory, options):
+    """Seed a SQLite catalog and serve it with the production server"""
+    from formatting import normalize_comment, normalize_video
+    from storage import SqliteBackend
+
+    path = os.path.join(directory, f'catalog-{len(videos)}.db')
+    now = time.time()
+    backend = SqliteBackend(path)
+    backend.open([normalize_video(video, now) for video in videos],
+                 {video_id: [normalize_comment(comment, now) for comment in thread]
+                  for video_id, thread in comments.items()})
+    backend.close()
+
+    env = dict(os.environ, STORAGE_BACKEND='sqlite', STORAGE_PATH=path,
+               LOG_LEVEL='WARNING', ACCESS_LOG_SAMPLE='0')
+    process = subprocess.Popen(
+        [sys.executable, START_BACKEND, '--production', '--port', str(options.port),
+         '--workers', str(options.workers), '--threads', str(options.threads)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    sender = SocketSender(f'http://127.0.0.1:{options.port}')
+    if not _wait_ready(sender, time.monotonic() + options.startup_timeout):
+        process.terminate()
+        process.wait()
+        raise RuntimeError(f"server on port {options.port} did not become ready")
+    return process, sender
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# Reporting
+
+def run_routes(mode, size, comment_count, sender, rss, options):
+    rows = []
+    for route in options.routes:
+        if route == 'list_all' and size > LIST_ALL_LIMIT:
+            continue
+        drive(sender, route, size, min(options.warmup, options.requests), options.concurrency, seed=1)
+        result = drive(sender, route, size, options.requests, options.concurrency)
+        result.update(mode=mode, videos=size, comments=comment_count, route=route,
+                      rss_mb=_mb(rss()))
+        rows.append(result)
+        print(f"{mode:>10}{size:>10,}{route:>15}{result['throughput']:>10,.0f}"
+              f"{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+              f"{result['errors']:>7}{result['rss_mb'] or 0:>9.0f}")
+    return rows
+
+
+def compare(results, baseline, tolerance):
+    """Return a line per route that regressed against baseline"""
+    previous = {(row['mode'], row['videos'], row['route']): row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        old = previous.get((row['mode'], row['videos'], row['route']))
+        if old is None:
+            continue
+        label = f"{row['mode']} {row['videos']:,} {row['route']}"
+        if row['throughput'] < old['throughput'] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {old['throughput']:,.0f} -> {row['throughput']:,.0f} req/s")
+        if row['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {old['p95_ms']:.2f} -> {row['p95_ms']:.2f} ms")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--comments-per-video', type=int, default=5)
+    parser.add_argument('--mode', nargs='+', choices=['inprocess', 'socket'], default=['inprocess'])
+    parser.add_argument('--routes', nargs='+', choices=list(ROUTES), default=list(ROUTES))
+    parser.add_argument('--requests', type=int, default=1000, help="timed requests per route")
+    parser.add_argument('--warmup', type=int, default=100, help="untimed requests per route")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--url', help="benchmark this running server instead of spawning one (socket mode)")
+    parser.add_argument('--port', type=int, default=5399, help="port for the spawned server")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--startup-timeout', type=float, default=300.0)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--baseline', help="fail on regressions against this results file")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed relative throughput drop / p95 rise (default 0.2)")
+    return parser.parse_args(argv)
+
+
+def main():
+    options = parse_args()
+    results = []
+    print(f"{'mode':>10}{'videos':>10}{'route':>15}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'errors':>7}{'RSS MB':>9}")
+    directory = tempfile.mkdtemp(prefix='api-benchmark-')
+    try:
+        for size in options.sizes:
+            videos, comments = build_catalog(size, options.comments_per_video)
+            comment_count = sum(map(len, comments.values()))
+            if 'inprocess' in options.mode:
+                sender, rss = inprocess_target(videos, comments)
+                results += run_routes('inprocess', size, comment_count, sender, rss, options)
+            if 'socket' in options.mode:
+                if options.url:
+                    # An external server has its own catalog; size is only a label
+                    results += run_routes('socket', size, comment_count, SocketSender(options.url),
+                                          lambda: None, options)
+                else:
+                    process, sender = spawn_server(videos, comments, directory, options)
+                    try:
+                        results += run_routes('socket', size, comment_count, sender,
+                                              lambda: tree_rss(process.pid), options)
+                    finally:
+                        stop_server(process)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'requests': options.requests,
+            'concurrency': options.concurrency,
+            'workers': options.workers,
+            'threads': options.threads,
+        },
+        'results': results,
+    }
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"\n💾 Results written to {options.output}")
+
+    if options.baseline:
+        with open(options.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), options.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {options.tolerance:.0%}:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print(f"\n✅ No regressions beyond {options.tolerance:.0%} against {options.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Synthetic catalog generation shared by the benchmark scripts"""
+import os
+import random
+import sys
+
+# Make the backend modules in api/ importable from the benchmarks
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api')
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+TOPICS = [
+    "python", "flask", "react", "hooks", "nextjs", "javascript", "database", "design",
+    "css", "grid", "flexbox", "docker", "kubernetes", "rust", "golang", "testing",
+    "performance", "security", "api", "rest", "graphql", "typescript", "linux", "git",
+]
+WORDS = [
+    "tutorial", "guide", "introduction", "advanced", "beginner", "complete", "deep",
+    "dive", "explained", "crash", "course", "tips", "tricks", "best", "practices",
+    "building", "modern", "scalable", "application", "development", "fundamentals",
+    "examples", "project", "production", "deployment", "patterns", "workshop",
+]
+# Long tail of pseudo-words so term frequencies follow a realistic skew
+SYLLABLES = ["ka", "lo", "mi", "ren", "to", "sa", "vi", "dor", "el", "qu", "an", "zu", "per", "ix"]
+
+
+def _long_tail_words(count, rng):
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+CHANNELS = [
+    "TechTutorials", "CodeMaster", "ReactPro", "DataScience Hub", "JS Mastery",
+    "DevOps Daily", "Frontend Focus", "Backend Basics", "Cloud Native", "Rustaceans",
+]
+
+
+def make_video(video_id, rng, vocabulary):
+    """Build one video dict in the same shape as api/index.py's mock data"""
+    topic_words = rng.sample(TOPICS, 1) + rng.sample(WORDS, 2) + _zipf_words(rng, vocabulary, 2)
+    title = " ".join(word.capitalize() for word in topic_words)
+    description_words = rng.sample(TOPICS + WORDS, 5) + _zipf_words(rng, vocabulary, rng.randint(10, 30))
+    rng.shuffle(description_words)
+    description = " ".join(description_words)
+    return {
+        "id": str(video_id),
+        "title": title,
+        "description": description.capitalize() + ".",
+        "thumbnail": "/placeholder.svg?height=180&width=320",
+        "duration": f"{rng.randint(1, 59)}:{rng.randint(0, 59):02d}",
+        "views": f"{rng.randint(1, 999)}K",
+        "uploadDate": f"{rng.randint(1, 6)} days ago",
+        "channel": {
+            "name": rng.choice(CHANNELS),
+            "avatar": "/placeholder.svg?height=40&width=40",
+            "subscribers": f"{rng.randint(1, 999)}K",
+        },
+        "videoUrl": "https://sample-videos.com/zip/10/mp4/SampleVideo_1280x720_1mb.mp4",
+    }
+
+
+def _zipf_words(rng, vocabulary, count):
+    # Inverse-power sampling: low indexes (common words) are picked far more often
+    return [vocabulary[int(len(vocabulary) ** rng.random()) - 1] for _ in range(count)]
+
+
+def iter_catalog(size, seed=42, vocabulary_size=20000):
+    """Yield the videos of make_catalog() one at a time"""
+    rng = random.Random(seed)
+    vocabulary = _long_tail_words(vocabulary_size, rng)
+    rng.shuffle(vocabulary)
+    for video_id in range(1, size + 1):
+        yield make_video(video_id, rng, vocabulary)
+
+
+def make_catalog(size, seed=42, vocabulary_size=20000):
+    """Return a deterministic list of size synthetic videos"""
+    return list(iter_catalog(size, seed, vocabulary_size))
+
+
+AUTHORS = ["DevEnthusiast", "CodeNewbie", "FullStackDev", "ReactFan", "PyDev", "NightOwl", "Lurker42"]
+
+
+def make_comments(videos, per_video=5, seed=42):
+    """Return {video_id: comments} with len(videos) * per_video comments in total
+
+    Comment counts are skewed like real traffic: a handful of popular videos
+    hold most of the comments and the long tail has none.
+    """
+    comments = {}
+    for video_id, comment in iter_comments([video["id"] for video in videos], len(videos) * per_video, seed):
+        comments.setdefault(video_id, []).append(comment)
+    return comments
+
+
+def iter_comments(video_ids, count, seed=42):
+    """Yield count (video_id, comment) pairs skewed as in make_comments()"""
+    rng = random.Random(seed)
+    for number in range(1, count + 1):
+        video_id = video_ids[int(len(video_ids) ** rng.random()) - 1]
+        yield video_id, {
+            "id": f"c{number}",
+            "author": rng.choice(AUTHORS),
+            "avatar": "/placeholder.svg?height=32&width=32",
+            "content": " ".join(rng.sample(WORDS + TOPICS, rng.randint(4, 16))).capitalize() + ".",
+            "timestamp": f"{rng.randint(1, 23)} hours ago",
+            "likes": rng.randint(0, 500),
+        }
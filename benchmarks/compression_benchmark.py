@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Cost of compressing listing responses per request against the compressed-body cache
+
+For each catalog size the full /api/videos body and a 24-video page are
+run through compress_response() with every available encoding: once cold
+(compressed per request, as without the cache), once warm (the cached body
+reused, costing a digest of the body and a lookup) and, for bodies large
+enough to stream, the time until the first compressed chunk is ready.
+
+Usage: python benchmarks/compression_benchmark.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import time
+
+from catalog import make_catalog
+from flask import Flask
+
+from compression import ENCODINGS, STREAM_MIN_SIZE, CompressedBodies, compress_response
+from fragments import json_array
+from store import CatalogStore
+
+app = Flask(__name__)
+
+
+def respond(body, encoding, cache):
+    """compress_response() for a versioned JSON body; returns (seconds to first byte, total seconds, size)"""
+    with app.test_request_context('/api/videos', headers={'Accept-Encoding': encoding}):
+        start = time.perf_counter()
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag('bench-1')
+        response = compress_response(response, cache)
+        chunks = iter(response.response)
+        first = next(chunks)
+        first_byte = time.perf_counter() - start
+        size = len(first) + sum(len(chunk) for chunk in chunks)
+        return first_byte, time.perf_counter() - start, size
+
+
+def run(size):
+    store = CatalogStore(make_catalog(size), {})
+    videos = store.list_videos()
+    with app.app_context():
+        bodies = {
+            'page': json_array(store.videos_json(videos[:24])) + b'\n',
+            'full': json_array(store.videos_json(videos)) + b'\n',
+        }
+    store.close()
+    print(f"\n📊 {size:,} videos")
+    print(f"{'body':<6}{'encoding':<10}{'bytes':>13}{'encoded':>12}{'ratio':>7}"
+          f"{'cold ms':>10}{'first ms':>10}{'warm ms':>10}")
+    for name, body in bodies.items():
+        for encoding in ENCODINGS:
+            cache = CompressedBodies()
+            first_byte, cold, encoded = respond(body, encoding, cache)
+            repeat = 20
+            warm = sum(respond(body, encoding, cache)[1] for _ in range(repeat)) / repeat
+            first = f"{first_byte * 1000:>10.2f}" if len(body) >= STREAM_MIN_SIZE else f"{'-':>10}"
+            print(f"{name:<6}{encoding:<10}{len(body):>13,}{encoded:>12,}{encoded / len(body):>7.1%}"
+                  f"{cold * 1000:>10.2f}{first}{warm * 1000:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size)
+
+
+if __name__ == '__main__':
+    main()
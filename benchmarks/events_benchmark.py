@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Memory per idle live-event subscriber and fan-out latency
+
+In-process, --subscribers streams are attached to an EventHub over socket
+pairs (as start_backend.py --production hands them over) and the Python
+heap they use is measured with tracemalloc; for comparison, --threaded
+streams wait on request threads the way the development server serves
+them. One published event is then timed until every client can read it.
+
+With --server the same is done end to end: a production server is
+started with a single worker, --subscribers HTTP connections open the
+comment stream, and the worker's RSS growth, the fan-out time of one
+posted comment and the latency of a normal request are reported.
+
+Usage: python benchmarks/events_benchmark.py [--subscribers 5000] [--threaded 500] [--server]
+"""
+import argparse
+import gc
+import http.client
+import json
+import os
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+import catalog  # noqa: F401  (puts api/ on sys.path)
+
+from api_benchmark import START_BACKEND, tree_rss
+from events import EventHub
+
+
+def raise_fd_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, needed), hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def wait_readable(sockets, marker, timeout=30):
+    """Read each socket until marker arrives; return seconds until all had it"""
+    start = time.perf_counter()
+    selector = selectors.DefaultSelector()
+    buffers = {}
+    for sock in sockets:
+        selector.register(sock, selectors.EVENT_READ)
+        buffers[sock] = b''
+    deadline = time.monotonic() + timeout
+    while buffers and time.monotonic() < deadline:
+        for key, _ in selector.select(1):
+            data = key.fileobj.recv(65536)
+            buffers[key.fileobj] += data
+            if marker in buffers[key.fileobj] or not data:
+                selector.unregister(key.fileobj)
+                del buffers[key.fileobj]
+    selector.close()
+    if buffers:
+        raise RuntimeError(f"{len(buffers)} subscribers did not receive {marker!r}")
+    return time.perf_counter() - start
+
+
+def detached_cost(count):
+    hub = EventHub(heartbeat_interval=3600)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    clients = []
+    for _ in range(count):
+        server_end, client_end = socket.socketpair()
+        hub.attach(hub.subscribe('videos'), server_end)
+        clients.append(client_end)
+    wait_readable(clients, b'retry:')
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    per_subscriber = sum(stat.size_diff for stat in after.compare_to(before, 'filename')) / count
+
+    start = time.perf_counter()
+    hub.publish('videos', 1, 'video', b'{"id":"1"}')
+    publish = time.perf_counter() - start
+    fan_out = publish + wait_readable(clients, b'event: video')
+    hub.close()
+    for client in clients:
+        client.close()
+    return per_subscriber, publish, fan_out
+
+
+def threaded_cost(count):
+    hub = EventHub(heartbeat_interval=3600)
+    gc.collect()
+    rss_before = tree_rss(os.getpid())
+    received = threading.Barrier(count + 1)
+    started = threading.Barrier(count + 1)
+
+    def reader():
+        stream = hub.stream(hub.subscribe('videos'))
+        next(stream)  # retry hint
+        started.wait()
+        next(stream)
+        received.wait()
+        stream.close()
+
+    threads = [threading.Thread(target=reader, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    rss_after = tree_rss(os.getpid())
+    start = time.perf_counter()
+    hub.publish('videos', 1, 'video', b'{"id":"1"}')
+    received.wait()
+    fan_out = time.perf_counter() - start
+    for thread in threads:
+        thread.join()
+    hub.close()
+    per_subscriber = (rss_after - rss_before) / count if rss_before is not None else None
+    return per_subscriber, fan_out
+
+
+def request(port, method, path, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    start = time.perf_counter()
+    connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+    status = connection.getresponse().status
+    connection.close()
+    return status, time.perf_counter() - start
+
+
+def server_cost(count, port):
+    env = dict(os.environ, STORAGE_BACKEND='memory', LOG_LEVEL='WARNING', ACCESS_LOG_SAMPLE='0')
+    process = subprocess.Popen(
+        [sys.executable, START_BACKEND, '--production', '--port', str(port), '--workers', '1', '--threads', '4'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    clients = []
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                request(port, 'GET', '/api/health')
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"server on port {port} did not become ready")
+                time.sleep(0.1)
+        request(port, 'GET', '/api/videos/1/comments')  # warm up the worker
+        rss_before = tree_rss(process.pid)
+        for _ in range(count):
+            client = socket.create_connection(('127.0.0.1', port))
+            client.sendall(b'GET /api/videos/1/comments/stream HTTP/1.1\r\nHost: bench\r\n\r\n')
+            clients.append(client)
+        wait_readable(clients, b'retry:')
+        time.sleep(0.5)
+        rss_after = tree_rss(process.pid)
+        _, health = request(port, 'GET', '/api/health')
+        start = time.perf_counter()
+        request(port, 'POST', '/api/videos/1/comments', {'content': 'fan-out'})
+        fan_out = time.perf_counter() - start + wait_readable(clients, b'event: comment')
+        per_subscriber = (rss_after - rss_before) / count if rss_before is not None else None
+        return per_subscriber, health, fan_out
+    finally:
+        for client in clients:
+            client.close()
+        process.terminate()
+        process.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subscribers', type=int, default=5000)
+    parser.add_argument('--threaded', type=int, default=500,
+                        help="subscribers waiting on their own thread (0 to skip)")
+    parser.add_argument('--server', action='store_true', help="also measure a production server over HTTP")
+    parser.add_argument('--port', type=int, default=5399)
+    args = parser.parse_args()
+    limit = raise_fd_limit(2 * args.subscribers + 256)
+    if limit < 2 * args.subscribers + 256:
+        args.subscribers = (limit - 256) // 2
+        print(f"⚠️  Open file limit {limit}: measuring {args.subscribers} subscribers")
+
+    per_subscriber, publish, fan_out = detached_cost(args.subscribers)
+    print(f"detached: {args.subscribers} idle subscribers, {per_subscriber:,.0f} B Python heap each")
+    print(f"          publish {publish * 1000:.2f} ms, delivered to all in {fan_out * 1000:.1f} ms")
+
+    if args.threaded:
+        per_subscriber, fan_out = threaded_cost(args.threaded)
+        rss = f"{per_subscriber / 1024:,.1f} KiB RSS each" if per_subscriber is not None else "RSS unavailable"
+        print(f"threaded: {args.threaded} idle subscribers, {rss}, delivered to all in {fan_out * 1000:.1f} ms")
+
+    if args.server:
+        per_subscriber, health, fan_out = server_cost(args.subscribers, args.port)
+        rss = f"{per_subscriber / 1024:,.1f} KiB worker RSS each" if per_subscriber is not None else "RSS unavailable"
+        print(f"server:   {args.subscribers} idle HTTP streams, {rss}")
+        print(f"          GET /api/health {health * 1000:.1f} ms while they are open, "
+              f"comment delivered to all in {fan_out * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Requests/sec of the API with access logging off, synchronous and queued
+
+The sink is a file; --sink-delay adds a per-write sleep to mimic a slow
+terminal or disk, which is where writing from the request thread hurts.
+
+Usage: python benchmarks/logging_benchmark.py [--requests 2000] [--threads 8]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import catalog  # noqa: F401  (puts api/ on sys.path)
+
+import access_log
+import index
+
+PATHS = ('/api/videos', '/api/videos/1', '/api/videos/1/comments', '/api/videos?q=python')
+
+
+class SlowFile:
+    """File wrapper whose writes take at least delay seconds"""
+
+    def __init__(self, path, delay):
+        self._file = open(path, 'a')
+        self.delay = delay
+
+    def write(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        return self._file.write(text)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def configure(mode, sink, sample_rate):
+    """sync writes from the request thread (sampling unused); queued defers to the listener"""
+    access_log.stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if mode == 'off':
+        root.setLevel(logging.WARNING)
+    elif mode == 'sync':
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(access_log.AccessTextFormatter(access_log.LOG_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    else:
+        access_log.configure_logging('INFO', stream=sink, sample_rate=sample_rate)
+
+
+def run(requests, threads):
+    per_thread = requests // threads
+
+    def worker():
+        client = index.app.test_client()
+        for i in range(per_thread):
+            client.get(PATHS[i % len(PATHS)])
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--sink-delay', type=float, default=0.0002, help='seconds per log write')
+    args = parser.parse_args()
+
+    modes = (('off', 1.0), ('sync', 1.0), ('queued', 1.0), ('queued', 0.1))
+    with tempfile.TemporaryDirectory() as directory:
+        sink = SlowFile(os.path.join(directory, 'access.log'), args.sink_delay)
+        run(200, 1)  # warm caches
+        print(f"{'mode':>10}{'sample':>8}{'req/s':>10}{'vs off':>9}")
+        baseline = None
+        for mode, sample_rate in modes:
+            configure(mode, sink, sample_rate)
+            rate = run(args.requests, args.threads)
+            access_log.stop_logging()
+            baseline = baseline or rate
+            print(f"{mode:>10}{sample_rate:>8g}{rate:>10,.0f}{rate / baseline:>8.0%}")
+        sink.close()
+
+
+if __name__ == '__main__':
+    main()
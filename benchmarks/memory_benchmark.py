@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Memory per stored video and comment: slotted records against plain dicts
+
+Each (kind, representation) runs in a fresh child process that builds
+--videos videos or --comments comments and keeps them in a list, as the
+store does. Raw records go through a JSON round trip first, like records
+loaded from the SQLite backend, so no string is shared unless the
+representation shares it. 'dict' is the stored form before records.py:
+nested dicts with per-record strings; 'records' is normalize_video() /
+normalize_comment() today.
+
+Reports the RSS growth of the whole build, and bytes per record measured
+exactly with tracemalloc over the first --sample records (which leaves out
+what later records share, such as the channel table).
+
+Usage: python benchmarks/memory_benchmark.py [--videos 1000000] [--comments 10000000]
+"""
+import argparse
+import gc
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from catalog import iter_catalog, iter_comments
+
+from formatting import VIDEO_DISPLAY_FIELDS, normalize_comment, normalize_video, parse_count, parse_duration
+
+REPRESENTATIONS = ('dict', 'records')
+
+
+def dict_video(video, now):
+    """The pre-records stored form of a video"""
+    record = {key: value for key, value in video.items() if key not in VIDEO_DISPLAY_FIELDS}
+    record['viewCount'] = parse_count(video['views'])
+    record['durationSeconds'] = parse_duration(video['duration'])
+    record['uploadedAt'] = now
+    channel = dict(video['channel'])
+    channel['subscriberCount'] = parse_count(channel.pop('subscribers'))
+    record['channel'] = channel
+    return record
+
+
+def dict_comment(comment, now):
+    record = {key: value for key, value in comment.items() if key != 'timestamp'}
+    record['likes'] = parse_count(record['likes'])
+    record['postedAt'] = now
+    return record
+
+
+def rss():
+    """Resident set size of this process in bytes, or 0 off Linux"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def source(kind, count):
+    """count raw records of kind as JSON text"""
+    if kind == 'videos':
+        raw = iter_catalog(count)
+    else:
+        raw = (comment for _, comment in iter_comments([str(number) for number in range(1, 1001)], count))
+    return (json.dumps(record) for record in raw)
+
+
+def build(kind, representation, records):
+    now = time.time()
+    if representation == 'dict':
+        convert = dict_video if kind == 'videos' else dict_comment
+    else:
+        convert = normalize_video if kind == 'videos' else normalize_comment
+    return [convert(json.loads(record), now) for record in records]
+
+
+def child(kind, representation, count, sample):
+    """Measure one build; prints a JSON result line"""
+    # JSON text is made first so only loading and converting it is traced
+    raw = list(source(kind, sample))
+    tracemalloc.start()
+    kept = build(kind, representation, raw)
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept, raw
+    gc.collect()
+
+    baseline = rss()
+    start = time.perf_counter()
+    kept = build(kind, representation, source(kind, count))
+    seconds = time.perf_counter() - start
+    gc.collect()
+    print(json.dumps({
+        'rss': rss() - baseline,
+        'traced_per_record': traced / sample,
+        'seconds': seconds,
+        'count': len(kept),
+    }))
+
+
+def run(kind, count, sample):
+    print(f"\n📊 {count:,} {kind}")
+    print(f"{'representation':<16}{'RSS MB':>10}{'B/record':>10}{'traced B/rec':>14}{'build s':>9}{'vs dict':>9}")
+    base = None
+    for representation in REPRESENTATIONS:
+        result = subprocess.run(
+            [sys.executable, __file__, '--child', kind, representation, str(count), '--sample', str(sample)],
+            capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"{representation:<16}failed (exit {result.returncode}; out of memory?)")
+            continue
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+        if representation == 'dict':
+            base = stats['rss']
+        ratio = f"{stats['rss'] / base:>9.0%}" if base else f"{'-':>9}"
+        print(f"{representation:<16}{stats['rss'] / 2 ** 20:>10,.0f}{stats['rss'] / count:>10,.0f}"
+              f"{stats['traced_per_record']:>14,.0f}{stats['seconds']:>9.1f}{ratio:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--videos', type=int, default=1_000_000)
+    parser.add_argument('--comments', type=int, default=10_000_000)
+    parser.add_argument('--sample', type=int, default=20000)
+    parser.add_argument('--child', nargs=3, metavar=('KIND', 'REPRESENTATION', 'COUNT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        kind, representation, count = args.child
+        child(kind, representation, int(count), min(args.sample, int(count)))
+        return
+    run('videos', args.videos, min(args.sample, args.videos))
+    run('comments', args.comments, min(args.sample, args.comments))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Cost of the /api/metrics request hooks and of a scrape
+
+Compares API requests/sec with the metrics hooks live and replaced by
+no-ops, times one request_finished() call, and times a scrape after many
+distinct threads have recorded requests.
+
+Usage: python benchmarks/metrics_benchmark.py [--requests 4000] [--threads 8]
+"""
+import argparse
+import logging
+import threading
+import time
+
+import catalog  # noqa: F401  (puts api/ on sys.path)
+
+import index
+from metrics import Metrics
+
+
+class NullMetrics:
+    def request_started(self):
+        pass
+
+    def request_finished(self, response, seconds):
+        pass
+
+
+def requests_per_second(requests, threads):
+    per_thread = requests // threads
+
+    def worker():
+        client = index.app.test_client()
+        for i in range(per_thread):
+            client.get('/api/videos/1' if i % 2 else '/api/videos')
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--calls', type=int, default=200000)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    live = index.metrics
+    requests_per_second(200, 1)  # warm caches
+    rates = {'off': [], 'on': []}
+    # Interleave runs so drift in machine load hits both sides equally
+    for _ in range(args.repeat):
+        for mode in ('off', 'on'):
+            index.metrics = NullMetrics() if mode == 'off' else live
+            rates[mode].append(requests_per_second(args.requests, args.threads))
+    index.metrics = live
+    off, on = max(rates['off']), max(rates['on'])
+    print(f"{'hooks':>8}{'req/s':>10}")
+    print(f"{'off':>8}{off:>10,.0f}")
+    print(f"{'on':>8}{on:>10,.0f}   ({(off - on) / off:+.1%} overhead)")
+
+    metrics = Metrics()
+    response = index.app.response_class(b'{}', mimetype='application/json')
+    with index.app.test_request_context('/api/videos/1'):
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            metrics.request_started()
+            metrics.request_finished(response, 0.003)
+        per_call = (time.perf_counter() - start) / args.calls
+    print(f"\nrequest_started + request_finished: {per_call * 1e6:.2f} µs")
+
+    def record():
+        with index.app.test_request_context('/api/videos/1'):
+            for _ in range(100):
+                metrics.request_started()
+                metrics.request_finished(response, 0.003)
+
+    for count in (10, 1000):
+        threads = [threading.Thread(target=record) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        start = time.perf_counter()
+        metrics.render()
+        print(f"scrape after {count:>5} more threads: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
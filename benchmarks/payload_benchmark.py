@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Listing payload size and encode time per response shape
+
+For each catalog size the full listing is encoded as the default full
+records, with the grid's fields= projection, compact, and both. Reports
+bytes (raw and gzipped), the cold encode time (empty fragment caches) and
+the warm time (fragments cached, as in steady state).
+
+Usage: python benchmarks/payload_benchmark.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import gzip
+import time
+
+from catalog import make_catalog
+from flask import Flask
+
+from fragments import json_array, json_object_response
+from projection import parse_fields
+from store import CatalogStore
+
+GRID_FIELDS = 'id,title,thumbnail,duration,views,uploadDate,channel.name,channel.avatar'
+MODES = {
+    'full': (None, False),
+    'fields': (GRID_FIELDS, False),
+    'compact': (None, True),
+    'fields+compact': (GRID_FIELDS, True),
+}
+
+
+def encode_listing(store, videos, fields, compact):
+    """Response body bytes as GET /api/videos builds them"""
+    if fields is None and not compact:
+        return json_array(store.videos_json(videos)) + b'\n'
+    fragments, shared = store.projected_videos_json(videos, fields, compact)
+    if shared is None:
+        return json_array(fragments) + b'\n'
+    return json_object_response({'videos': json_array(fragments), 'shared': shared}).get_data()
+
+
+def run(size):
+    store = CatalogStore(make_catalog(size), {})
+    videos = store.list_videos()
+    print(f"\n📊 {size:,} videos")
+    print(f"{'mode':<16}{'bytes':>14}{'gzip bytes':>14}{'vs full':>9}{'cold ms':>10}{'warm ms':>10}")
+    full_size = None
+    with Flask(__name__).app_context():
+        for mode, (spec, compact) in MODES.items():
+            fields = parse_fields(spec)
+            store._video_fragments.clear()
+            store._projections.clear()
+            start = time.perf_counter()
+            body = encode_listing(store, videos, fields, compact)
+            cold = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(3):
+                encode_listing(store, videos, fields, compact)
+            warm = (time.perf_counter() - start) / 3
+            full_size = full_size or len(body)
+            print(f"{mode:<16}{len(body):>14,}{len(gzip.compress(body, 6)):>14,}"
+                  f"{len(body) / full_size:>8.0%}{cold * 1000:>10.1f}{warm * 1000:>10.1f}")
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size)
+
+
+if __name__ == '__main__':
+    main()
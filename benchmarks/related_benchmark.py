@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Related-video lookups: vectorized TF-IDF scoring against plain Python
+
+Builds a RelatedIndex over a synthetic catalog and times uncached neighbour
+lookups with NumPy and with the pure Python fallback, cached lookups, and
+adding single uploads. The NumPy neighbours of a sample of videos are
+checked against a brute-force cosine over every vector.
+
+Usage: python benchmarks/related_benchmark.py [--sizes 10000 100000]
+"""
+import argparse
+import random
+import time
+
+from catalog import make_catalog
+
+import related
+from related import RelatedIndex
+
+SAMPLE = 20
+
+
+def time_per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def brute_force_neighbors(index, video_id, count):
+    """Top count neighbours by comparing video_id's vector with every row"""
+    terms, weights = index._vector(index._rows[video_id], index._idf)
+    query = dict(zip(terms, weights))
+    scored = []
+    for row in range(len(index)):
+        if index._ids[row] == video_id:
+            continue
+        row_terms, row_weights = index._vector(row, index._idf)
+        score = sum(query.get(term, 0.0) * weight for term, weight in zip(row_terms, row_weights))
+        if score > 0:
+            scored.append((-score, row))
+    return [index._ids[row] for _, row in sorted(scored)[:count]]
+
+
+def run(size, check):
+    videos = make_catalog(size)
+    start = time.perf_counter()
+    index = RelatedIndex()
+    index.add_many(videos)
+    build_seconds = time.perf_counter() - start
+    sample = [video['id'] for video in random.Random(size).sample(videos, SAMPLE)]
+    print(f"\n📊 {size:,} videos (index built in {build_seconds:.2f}s, {len(index._idf):,} terms)")
+
+    def cold_lookups():
+        for video_id in sample:
+            index.clear_cache()
+            index.neighbors(video_id)
+
+    numpy_module = related.np
+    results = {}
+    for name, module in (('numpy', numpy_module), ('python', None)):
+        if name == 'numpy' and module is None:
+            print("numpy not installed, skipping the vectorized path")
+            continue
+        related.np = module
+        results[name] = time_per_call(cold_lookups, repeat=1) / SAMPLE
+    related.np = numpy_module
+    for name, seconds in results.items():
+        print(f"{name:<8} uncached lookup {seconds * 1000:>9.2f} ms")
+    if len(results) == 2:
+        print(f"         speedup {results['python'] / results['numpy']:.0f}x")
+    cached = time_per_call(lambda: index.neighbors(sample[0]), repeat=1000)
+    print(f"cached   lookup {cached * 1000:>10.4f} ms")
+
+    uploads = make_catalog(size + 100)[size:]
+    for number, video in enumerate(uploads):
+        video['id'] = f"upload-{number}"
+    add = time_per_call(lambda: index.add_many([uploads.pop()]), repeat=100)
+    print(f"add one upload  {add * 1000:>10.3f} ms")
+
+    if check:
+        mismatches = 0
+        for video_id in sample[:5]:
+            index.clear_cache()
+            expected = brute_force_neighbors(index, video_id, index.neighbor_count)
+            got = index.neighbors(video_id)
+            # Equal scores may be ordered differently by float rounding
+            mismatches += len(set(expected) ^ set(got)) > 2
+        print(f"brute-force check: {5 - mismatches}/5 neighbour lists match")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--no-check', action='store_true', help="skip the brute-force comparison")
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, check=not args.no_check and size <= 20000)
+
+
+if __name__ == '__main__':
+    main()
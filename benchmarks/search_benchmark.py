@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Compare the inverted search index against the old substring scan
+
+Usage: python benchmarks/search_benchmark.py [--sizes 10000 100000 300000]
+"""
+import argparse
+import time
+
+from catalog import make_catalog
+
+from search import SearchIndex
+
+QUERIES = ["python", "react hooks", "flask tutorial", "codemaster", '"deep dive"', "kubern", "kalo"]
+
+
+def linear_search(videos, query):
+    """The original get_videos list comprehension"""
+    query = query.lower().strip()
+    return [
+        video for video in videos
+        if (query in video['title'].lower() or
+            query in video['description'].lower() or
+            query in video['channel']['name'].lower())
+    ]
+
+
+def time_per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(size):
+    videos = make_catalog(size)
+    start = time.perf_counter()
+    index = SearchIndex()
+    index.add_many(videos)
+    build_seconds = time.perf_counter() - start
+    print(f"\n📊 {size:,} videos (index built in {build_seconds:.2f}s)")
+    print(f"{'query':<18}{'scan ms':>12}{'index ms':>12}{'cached ms':>12}{'speedup':>10}")
+    for query in QUERIES:
+        scan = time_per_call(lambda: linear_search(videos, query.strip('"')), repeat=3)
+        cold = time_per_call(lambda: (index.clear_cache(), index.search(query)), repeat=20)
+        cached = time_per_call(lambda: index.search(query), repeat=200)
+        print(f"{query:<18}{scan * 1000:>12.2f}{cold * 1000:>12.3f}{cached * 1000:>12.4f}"
+              f"{scan / cold:>9.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size)
+
+
+if __name__ == '__main__':
+    main()
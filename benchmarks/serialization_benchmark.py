@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Per-request encode cost of the video list: jsonify vs. cached fragments
+
+Usage: python benchmarks/serialization_benchmark.py [--sizes 10000 100000]
+"""
+import argparse
+import time
+
+from catalog import make_catalog
+
+from flask import Flask, jsonify
+
+from fragments import FragmentCache, json_list_response
+
+
+def time_per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    print(f"{'videos':>10}{'jsonify ms':>14}{'cold frag ms':>14}{'warm frag ms':>14}{'speedup':>10}")
+    with app.app_context():
+        for size in args.sizes:
+            videos = make_catalog(size)
+            cache = FragmentCache()
+
+            def fragments_response():
+                now = time.time()
+                return json_list_response([cache.get(video["id"], video, now)[0] for video in videos])
+
+            baseline = time_per_call(lambda: jsonify(videos), args.repeat)
+            cold = time_per_call(lambda: (cache.clear(), fragments_response()), 1)
+            fragments_response()
+            warm = time_per_call(fragments_response, args.repeat)
+            assert fragments_response().data == jsonify(videos).data
+            print(f"{size:>10,}{baseline * 1000:>14.1f}{cold * 1000:>14.1f}{warm * 1000:>14.2f}"
+                  f"{baseline / warm:>9.0f}x")
+
+
+if __name__ == '__main__':
+    main()
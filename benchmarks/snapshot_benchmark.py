@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Worker cold start: loading from a snapshot against a full reload from SQLite
+
+For each size, a child process seeds a SQLite catalog and writes its
+snapshot (see api/snapshot.py). Fresh child processes then start a store
+the two ways a worker can: 'reload' reads every row back from the database
+(JSON columns included) and rebuilds every index, 'snapshot' maps the
+snapshot file and catches up with the database from the position it
+records. Each reports the time to a ready store, the time of a first search
+after it, and its RSS growth.
+
+Usage: python benchmarks/snapshot_benchmark.py [--sizes 100000 1000000] [--comments 1]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from catalog import iter_catalog, make_comments
+
+from memory_benchmark import rss
+from storage import SqliteBackend
+from store import CatalogStore
+
+MODES = ('reload', 'snapshot')
+
+
+def seed(path, size, per_video):
+    """Build the database at path and its snapshot; prints a JSON result line"""
+    videos = list(iter_catalog(size))
+    comments = make_comments(videos, per_video)
+    store = CatalogStore(videos, comments, backend=SqliteBackend(path))
+    del videos, comments
+    start = time.perf_counter()
+    store.write_snapshot(f"{path}.snapshot")
+    seconds = time.perf_counter() - start
+    store.close()
+    print(json.dumps({'write': seconds}))
+
+
+def start(path, mode):
+    """Start a store from path one way; prints a JSON result line"""
+    baseline = rss()
+    began = time.perf_counter()
+    snapshot = f"{path}.snapshot" if mode == 'snapshot' else None
+    store = CatalogStore(backend=SqliteBackend(path), snapshot=snapshot)
+    ready = time.perf_counter() - began
+    began = time.perf_counter()
+    store.search('python tutorial')
+    first_search = time.perf_counter() - began
+    print(json.dumps({
+        'ready': ready,
+        'first_search': first_search,
+        'rss': rss() - baseline,
+        'videos': len(store),
+    }))
+    store.close()
+
+
+def child(*args):
+    result = subprocess.run([sys.executable, __file__, '--child', *map(str, args)], capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(size, per_video):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'catalog.db')
+        seeded = child('seed', path, size, per_video)
+        if seeded is None:
+            print(f"\n📊 {size:,} videos: seeding failed (out of memory?)")
+            return
+        print(f"\n📊 {size:,} videos, {size * per_video:,} comments")
+        print(f"database {os.path.getsize(path) / 2 ** 20:,.0f} MB, snapshot "
+              f"{os.path.getsize(f'{path}.snapshot') / 2 ** 20:,.0f} MB written in {seeded['write']:.1f}s")
+        print(f"{'start':<12}{'ready s':>10}{'1st search ms':>15}{'RSS MB':>10}{'vs reload':>11}")
+        base = None
+        for mode in MODES:
+            stats = child('start', path, mode)
+            if stats is None:
+                print(f"{mode:<12}failed")
+                continue
+            if mode == 'reload':
+                base = stats['ready']
+            ratio = f"{stats['ready'] / base:>11.0%}" if base else f"{'-':>11}"
+            print(f"{mode:<12}{stats['ready']:>10.2f}{stats['first_search'] * 1000:>15.1f}"
+                  f"{stats['rss'] / 2 ** 20:>10,.0f}{ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--comments', type=int, default=1, help='comments per video')
+    parser.add_argument('--child', nargs='+', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        action, path, *rest = args.child
+        if action == 'seed':
+            seed(path, int(rest[0]), int(rest[1]))
+        else:
+            start(path, rest[0])
+        return
+    for size in args.sizes:
+        run(size, args.comments)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Sort-order writes: SortedIndex against re-sorting one flat list
+
+Every upload adds a key to each video sort order and every view-count
+flush moves the flushed videos in the 'views' order, all under the store
+lock. This times both on a bucketed SortedIndex and on the flat list it
+replaced, and checks that the two end up with the same keys.
+
+Usage: python benchmarks/sorted_index_benchmark.py [--sizes 200000 1000000] [--flush 1000]
+"""
+import argparse
+import random
+import time
+from bisect import bisect_left, insort
+
+import catalog  # noqa: F401  (puts api/ on sys.path)
+
+from pagination import SortedIndex
+
+REPEAT = 20
+
+
+class FlatIndex:
+    """The previous SortedIndex writes: copy the list, then insort or re-sort"""
+
+    def __init__(self, keys):
+        self._keys = sorted(keys)
+        self._key_by_id = {key[-1]: key for key in self._keys}
+
+    def add_many(self, keys):
+        stale = set()
+        for key in keys:
+            old = self._key_by_id.get(key[-1])
+            if old is not None:
+                stale.add(old)
+            self._key_by_id[key[-1]] = key
+        if len(keys) <= 64:
+            updated = list(self._keys)
+            for old in stale:
+                del updated[bisect_left(updated, old)]
+            for key in keys:
+                insort(updated, key)
+        else:
+            updated = [key for key in self._keys if key not in stale]
+            updated.extend(keys)
+            updated.sort()
+        self._keys = updated
+
+    def between(self):
+        return self._keys
+
+
+def views_key(views, number):
+    """Shaped like the store's 'views' keys: most viewed first, then newest"""
+    return (-views, -number, str(number))
+
+
+def time_writes(index, batches):
+    start = time.perf_counter()
+    for batch in batches:
+        index.add_many(batch)
+    return (time.perf_counter() - start) / len(batches)
+
+
+def run(size, flush):
+    rng = random.Random(size)
+    keys = [views_key(rng.randrange(10 ** 6), number) for number in range(size)]
+    uploads = [[views_key(0, size + number)] for number in range(REPEAT)]
+    flushes = [[views_key(rng.randrange(10 ** 6), number) for number in rng.sample(range(size), flush)]
+               for _ in range(REPEAT // 4)]
+    print(f"\n📊 {size:,} keys, flushes of {flush:,} videos")
+    print(f"{'index':<10}{'upload ms':>12}{'flush ms':>12}")
+    results = []
+    for name, cls in (('flat', FlatIndex), ('bucketed', SortedIndex)):
+        index = cls(keys)
+        upload = time_writes(index, uploads)
+        moved = time_writes(index, flushes)
+        print(f"{name:<10}{upload * 1000:>12.2f}{moved * 1000:>12.1f}")
+        results.append(index.between())
+    print(f"same keys: {'yes' if results[0] == results[1] else 'NO'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[200000, 1000000])
+    parser.add_argument('--flush', type=int, default=1000, help="videos per view-count flush")
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.flush)
+
+
+if __name__ == '__main__':
+    main()
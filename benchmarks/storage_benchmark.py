@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Read vs. write throughput of the SQLite backend under concurrent threads
+
+Usage: python benchmarks/storage_benchmark.py [--videos 10000] [--threads 1 4 16]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from catalog import make_catalog
+
+from storage import SqliteBackend
+from store import CatalogStore
+
+
+def run_threads(threads, operations, work):
+    """Run work(rng) operations times on each thread, return ops/sec"""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        barrier.wait()
+        for _ in range(operations):
+            work(rng)
+
+    pool = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    return threads * operations / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--videos', type=int, default=10000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--operations', type=int, default=2000, help='operations per thread')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SqliteBackend(os.path.join(directory, 'catalog.db'))
+        start = time.perf_counter()
+        store = CatalogStore(make_catalog(args.videos), {}, backend=backend)
+        print(f"📦 Seeded and loaded {args.videos:,} videos in {time.perf_counter() - start:.2f}s")
+
+        def random_id(rng):
+            return str(rng.randint(1, args.videos))
+
+        workloads = [
+            ("store read (memory)", lambda rng: store.get_video(random_id(rng))),
+            ("backend read (SQL)", lambda rng: backend.get_video(random_id(rng))),
+            ("comment write", lambda rng: store.add_comment(random_id(rng), {"content": "benchmark"})),
+        ]
+        print(f"{'workload':<22}" + "".join(f"{f'{t} thr ops/s':>16}" for t in args.threads))
+        for name, work in workloads:
+            operations = args.operations if 'write' not in name else max(1, args.operations // 4)
+            rates = [run_threads(threads, operations, work) for threads in args.threads]
+            print(f"{name:<22}" + "".join(f"{rate:>16,.0f}" for rate in rates))
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
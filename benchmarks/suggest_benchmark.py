@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Completion latency of the suggest prefix index against a catalog scan
+
+Prefixes of one to several characters are completed uncached (a fresh
+index result cache per call) at each catalog size; with the segment tree
+the time should stay flat as the catalog grows, while the scan grows
+linearly.
+
+Usage: python benchmarks/suggest_benchmark.py [--sizes 10000 100000 300000]
+"""
+import argparse
+import heapq
+import time
+
+from catalog import make_catalog
+
+from formatting import normalize_video
+from suggest import SuggestIndex, fold, fold_prefix
+
+PREFIXES = ["p", "py", "pyt", "react h", "kubernetes tu", "ka", "kalo"]
+
+
+def suggestions(videos):
+    titles = {}
+    channels = {}
+    for video in videos:
+        titles[video['title']] = titles.get(video['title'], 0) + video['viewCount']
+        name = video['channel']['name']
+        channels[name] = channels.get(name, 0) + video['viewCount']
+    return ([(title, 'title', views) for title, views in titles.items()] +
+            [(name, 'channel', views) for name, views in channels.items()])
+
+
+def scan(folded, query, limit=10):
+    """Check every suggestion's word starts, keep the heaviest"""
+    prefix = fold_prefix(query)
+    matches = ((weight, text) for text, weight in folded
+               if text.startswith(prefix) or f" {prefix}" in text)
+    return heapq.nlargest(limit, matches)
+
+
+def time_per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(size):
+    candidates = suggestions([normalize_video(video) for video in make_catalog(size)])
+    start = time.perf_counter()
+    index = SuggestIndex(candidates)
+    build_seconds = time.perf_counter() - start
+    folded = [(fold(text), weight) for text, _, weight in candidates]
+    print(f"\n📊 {size:,} videos, {len(index):,} suggestions (index built in {build_seconds:.2f}s)")
+    print(f"{'prefix':<16}{'scan ms':>10}{'index ms':>10}{'cached ms':>11}")
+    for prefix in PREFIXES:
+        scanned = time_per_call(lambda: scan(folded, prefix), repeat=3)
+        cold = time_per_call(lambda: (index._cache.clear(), index.complete(prefix)), repeat=200)
+        cached = time_per_call(lambda: index.complete(prefix), repeat=2000)
+        print(f"{prefix:<16}{scanned * 1000:>10.2f}{cold * 1000:>10.3f}{cached * 1000:>11.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 300000])
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size)
+
+
+if __name__ == '__main__':
+    main()
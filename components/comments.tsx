@@ -5,7 +5,7 @@ import Image from 'next/image'
 import { Button } from '@/components/ui/button'
 import { Textarea } from '@/components/ui/textarea'
 
-interface Comment {
+export interface Comment {
   id: string
   author: string
   avatar: string
@@ -17,6 +17,8 @@ interface Comment {
 interface CommentsProps {
   videoId: string
   backendMode?: boolean
+  // First page of comments, already loaded with the rest of the watch page
+  initialComments?: Comment[]
 }
 
 // Demo comments data
@@ -59,17 +61,30 @@ const demoComments: { [key: string]: Comment[] } = {
   ]
 }
 
-export default function Comments({ videoId, backendMode = false }: CommentsProps) {
+export default function Comments({ videoId, backendMode = false, initialComments }: CommentsProps) {
   const [comments, setComments] = useState<Comment[]>([])
   const [newComment, setNewComment] = useState('')
   const [loading, setLoading] = useState(true)
 
   useEffect(() => {
-    // Always start with demo data
-    const videoComments = demoComments[videoId] || []
+    // Start with demo data unless the backend's comments came with the page
+    const videoComments = backendMode && initialComments ? initialComments : demoComments[videoId] || []
     setComments(videoComments)
     setLoading(false)
-  }, [videoId])
+  }, [videoId, backendMode, initialComments])
+
+  // New top-level comments arrive over server-sent events while the video is open
+  useEffect(() => {
+    if (!backendMode) return
+
+    const source = new EventSource(`http://127.0.0.1:5328/api/videos/${videoId}/comments/stream`)
+    source.addEventListener('comment', (event) => {
+      const comment: Comment & { parentId?: string } = JSON.parse((event as MessageEvent).data)
+      if (comment.parentId) return
+      setComments((current) => current.some((c) => c.id === comment.id) ? current : [comment, ...current])
+    })
+    return () => source.close()
+  }, [videoId, backendMode])
 
   const handleSubmitComment = async (e: React.FormEvent) => {
     e.preventDefault()
@@ -1,21 +1,60 @@
 'use client'
 
-import { useState } from 'react'
+import { useEffect, useState } from 'react'
 import Link from 'next/link'
 import { Search, Upload, Bell, User } from 'lucide-react'
 import { Button } from '@/components/ui/button'
 import { Input } from '@/components/ui/input'
 import { useRouter } from 'next/navigation'
 
+// Wait for a pause in typing before asking the backend for completions
+const SUGGEST_DELAY_MS = 100
+
+interface Suggestion {
+  text: string
+  type: 'title' | 'channel'
+}
+
 export default function Header() {
   const [searchQuery, setSearchQuery] = useState('')
+  const [suggestions, setSuggestions] = useState<Suggestion[]>([])
+  const [showSuggestions, setShowSuggestions] = useState(false)
   const router = useRouter()
 
+  useEffect(() => {
+    if (!searchQuery.trim()) {
+      setSuggestions([])
+      return
+    }
+    const controller = new AbortController()
+    const timer = setTimeout(async () => {
+      try {
+        const response = await fetch(`/api/suggest?q=${encodeURIComponent(searchQuery)}`, {
+          signal: controller.signal,
+        })
+        if (response.ok) {
+          setSuggestions(await response.json())
+        }
+      } catch {
+        // No backend (demo mode) or a newer keystroke aborted the request
+      }
+    }, SUGGEST_DELAY_MS)
+    return () => {
+      clearTimeout(timer)
+      controller.abort()
+    }
+  }, [searchQuery])
+
+  const search = (query: string) => {
+    setShowSuggestions(false)
+    if (query.trim()) {
+      router.push(`/?search=${encodeURIComponent(query)}`)
+    }
+  }
+
   const handleSearch = (e: React.FormEvent) => {
     e.preventDefault()
-    if (searchQuery.trim()) {
-      router.push(`/?search=${encodeURIComponent(searchQuery)}`)
-    }
+    search(searchQuery)
   }
 
   return (
@@ -29,14 +68,42 @@ export default function Header() {
         </Link>
 
         <form onSubmit={handleSearch} className="flex-1 max-w-2xl mx-8">
-          <div className="flex">
+          <div className="flex relative">
             <Input
               type="search"
               placeholder="Search"
               value={searchQuery}
-              onChange={(e) => setSearchQuery(e.target.value)}
+              onChange={(e) => {
+                setSearchQuery(e.target.value)
+                setShowSuggestions(true)
+              }}
+              onFocus={() => setShowSuggestions(true)}
+              onBlur={() => setShowSuggestions(false)}
               className="rounded-r-none border-r-0"
             />
+            {showSuggestions && suggestions.length > 0 && (
+              <ul className="absolute left-0 right-0 top-full mt-1 bg-white border border-gray-200 rounded-md shadow-lg py-1 z-50">
+                {suggestions.map((suggestion) => (
+                  <li key={`${suggestion.type}:${suggestion.text}`}>
+                    <button
+                      type="button"
+                      // Before the input's blur hides the list
+                      onMouseDown={(e) => {
+                        e.preventDefault()
+                        setSearchQuery(suggestion.text)
+                        search(suggestion.text)
+                      }}
+                      className="w-full flex items-center gap-3 px-4 py-1.5 text-left text-sm hover:bg-gray-100"
+                    >
+                      {suggestion.type === 'channel'
+                        ? <User className="w-4 h-4 text-gray-400" />
+                        : <Search className="w-4 h-4 text-gray-400" />}
+                      <span className="truncate">{suggestion.text}</span>
+                    </button>
+                  </li>
+                ))}
+              </ul>
+            )}
             <Button type="submit" variant="outline" className="rounded-l-none px-6">
               <Search className="w-4 h-4" />
             </Button>
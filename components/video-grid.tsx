@@ -20,6 +20,22 @@ interface Video {
   }
 }
 
+// Only what the grid renders, with repeated channels and URLs sent once
+const GRID_QUERY = 'fields=id,title,thumbnail,duration,views,uploadDate,channel.name,channel.avatar&compact=1'
+
+interface CompactListing {
+  videos: Array<Omit<Video, 'thumbnail' | 'channel'> & { thumbnail: number, channel: number }>
+  shared: Record<string, any>
+}
+
+function expandListing({ videos, shared }: CompactListing): Video[] {
+  return videos.map((video) => ({
+    ...video,
+    thumbnail: shared[video.thumbnail],
+    channel: shared[video.channel],
+  }))
+}
+
 // Demo data - this is the primary data source
 const demoVideos: Video[] = [
   {
@@ -117,11 +133,30 @@ export default function VideoGrid() {
     setLoading(false)
   }, [searchQuery])
 
+  // New uploads arrive over server-sent events instead of refetching the list
+  useEffect(() => {
+    if (!backendMode) return
+
+    const source = new EventSource('http://127.0.0.1:5328/api/videos/stream')
+    source.addEventListener('video', (event) => {
+      const video: Video = JSON.parse((event as MessageEvent).data)
+      if (searchQuery &&
+          !video.title.toLowerCase().includes(searchQuery.toLowerCase()) &&
+          !video.channel.name.toLowerCase().includes(searchQuery.toLowerCase())) {
+        return
+      }
+      setVideos((current) => current.some((v) => v.id === video.id) ? current : [video, ...current])
+    })
+    // Missed more events than the server keeps for replay: reload the list
+    source.addEventListener('reset', () => tryBackendConnection())
+    return () => source.close()
+  }, [backendMode, searchQuery])
+
   const tryBackendConnection = async () => {
     setBackendStatus('connecting')
     
     try {
-      const flaskUrl = 'http://127.0.0.1:5328/api/videos'
+      const flaskUrl = `http://127.0.0.1:5328/api/videos?${GRID_QUERY}`
       
       const response = await fetch(flaskUrl, {
         method: 'GET',
@@ -141,11 +176,11 @@ export default function VideoGrid() {
         throw new Error('Flask server is not returning JSON')
       }
       
-      const data = await response.json()
+      const data = expandListing(await response.json())
       
       // Filter for search if needed
       let filteredData = data
-      if (searchQuery && Array.isArray(data)) {
+      if (searchQuery) {
         filteredData = data.filter((video: Video) => 
           video.title.toLowerCase().includes(searchQuery.toLowerCase()) ||
           video.channel.name.toLowerCase().includes(searchQuery.toLowerCase())
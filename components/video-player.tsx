@@ -5,7 +5,8 @@ import Image from 'next/image'
 import { Button } from '@/components/ui/button'
 import { ThumbsUp, ThumbsDown, Share, Download, Wifi, WifiOff } from 'lucide-react'
 import { Alert, AlertDescription } from '@/components/ui/alert'
-import Comments from './comments'
+import Comments, { type Comment } from './comments'
+import { loadWatchPage } from '@/lib/watch'
 
 interface Video {
   id: string
@@ -72,6 +73,7 @@ export default function VideoPlayer({ videoId }: VideoPlayerProps) {
   const [video, setVideo] = useState<Video | null>(null)
   const [loading, setLoading] = useState(true)
   const [backendMode, setBackendMode] = useState(false)
+  const [comments, setComments] = useState<Comment[] | undefined>(undefined)
   const [backendStatus, setBackendStatus] = useState<'disconnected' | 'connecting' | 'connected' | 'error'>('disconnected')
 
   // Initialize with demo data
@@ -102,28 +104,10 @@ export default function VideoPlayer({ videoId }: VideoPlayerProps) {
     setBackendStatus('connecting')
     
     try {
-      const flaskUrl = `http://127.0.0.1:5328/api/videos/${videoId}`
-      
-      const response = await fetch(flaskUrl, {
-        method: 'GET',
-        headers: {
-          'Accept': 'application/json',
-          'Content-Type': 'application/json',
-        },
-        mode: 'cors'
-      })
-      
-      if (!response.ok) {
-        throw new Error(`Flask server responded with status: ${response.status}`)
-      }
-      
-      const contentType = response.headers.get('content-type')
-      if (!contentType || !contentType.includes('application/json')) {
-        throw new Error('Flask server is not returning JSON')
-      }
-      
-      const data = await response.json()
-      setVideo(data)
+      // Video, first comment page and related videos in one round trip
+      const data = await loadWatchPage(videoId)
+      setVideo(data.video)
+      setComments(data.comments)
       setBackendMode(true)
       setBackendStatus('connected')
       
@@ -205,8 +189,10 @@ export default function VideoPlayer({ videoId }: VideoPlayerProps) {
       {/* Video Player */}
       <div className="aspect-video rounded-lg overflow-hidden bg-black">
         <video 
+          key={video.videoUrl}
           className="w-full h-full" 
           controls 
+          preload="metadata"
           poster={`/placeholder.svg?height=480&width=854&query=${encodeURIComponent(video.title)}`}
         >
           {video.videoUrl && <source src={video.videoUrl} type="video/mp4" />}
@@ -262,7 +248,7 @@ export default function VideoPlayer({ videoId }: VideoPlayerProps) {
           <p className="text-sm">{video.description}</p>
         </div>
 
-        <Comments videoId={videoId} backendMode={backendMode} />
+        <Comments videoId={videoId} backendMode={backendMode} initialComments={comments} />
       </div>
     </div>
   )
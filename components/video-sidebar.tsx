@@ -2,6 +2,7 @@
 
 import { useEffect, useState } from 'react'
 import VideoCard from './video-card'
+import { loadWatchPage } from '@/lib/watch'
 
 interface Video {
   id: string
@@ -26,11 +27,9 @@ export default function VideoSidebar({ currentVideoId }: VideoSidebarProps) {
   useEffect(() => {
     const fetchVideos = async () => {
       try {
-        const response = await fetch('/api/videos')
-        const data = await response.json()
-        // Filter out current video
-        const filteredVideos = data.filter((video: Video) => video.id !== currentVideoId)
-        setVideos(filteredVideos)
+        // Shares the player's /api/watch request; related videos exclude the current one
+        const data = await loadWatchPage(currentVideoId)
+        setVideos(data.related)
       } catch (error) {
         console.error('Error fetching videos:', error)
       }
@@ -0,0 +1,38 @@
+// Everything the watch page shows comes from one request (GET /api/watch/<id>).
+// The player and the sidebar mount separately, so they share the in-flight
+// request and reuse its result for a short while instead of each fetching.
+const REUSE_MS = 30_000
+
+export interface WatchPage<Video = any, Comment = any> {
+  video: Video
+  comments: Comment[]
+  commentsNextCursor: string | null
+  related: Video[]
+}
+
+const requests = new Map<string, Promise<WatchPage>>()
+
+export function loadWatchPage(videoId: string): Promise<WatchPage> {
+  const existing = requests.get(videoId)
+  if (existing) return existing
+
+  const request = fetch(`/api/watch/${encodeURIComponent(videoId)}`, {
+    headers: { 'Accept': 'application/json' },
+  }).then(async (response) => {
+    if (!response.ok) {
+      throw new Error(`Flask server responded with status: ${response.status}`)
+    }
+    const contentType = response.headers.get('content-type')
+    if (!contentType || !contentType.includes('application/json')) {
+      throw new Error('Flask server is not returning JSON')
+    }
+    return response.json()
+  })
+
+  requests.set(videoId, request)
+  request.then(
+    () => setTimeout(() => requests.delete(videoId), REUSE_MS),
+    () => requests.delete(videoId),
+  )
+  return request
+}
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""Bulk-import videos and comments from JSONL or CSV files into the SQLite catalog
+
+Files are read in blocks of whole records and parsed and validated on a
+process pool, a bounded number of blocks ahead of the writer, so memory
+stays constant however large the input. Valid rows are inserted in large
+transactions with the secondary indexes dropped, and the indexes are
+rebuilt once at the end; a catalog snapshot (see api/snapshot.py) is then
+written so workers start with the search, related and suggest indexes
+already built instead of building them from the new rows.
+
+    python scripts/bulk_import.py --videos videos.jsonl --comments comments.csv
+
+Records use the API's field names. Videos need a title and may give an id,
+description, thumbnail, videoUrl, channel (a name or an object), viewCount
+or views, durationSeconds or duration, uploadedAt or uploadDate. Comments
+need a videoId and content and may give an id, author, avatar, likes,
+parentId, postedAt or timestamp. CSV files have a header row; dotted
+columns such as channel.avatar fill nested objects and empty cells count
+as missing. Comments on videos that do not exist are skipped. Records whose
+id is not above the newest already in the catalog are refused, since
+workers only pick up rows past the newest id they have seen; leave ids out
+to have them allocated.
+
+Importing into the database of a running server works (workers pick the new
+rows up at their next poll), but pass --keep-indexes so their queries do
+not lose the indexes meanwhile.
+"""
+
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+API_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api')
+if API_PATH not in sys.path:
+    sys.path.insert(0, API_PATH)
+
+from formatting import normalize_comment, normalize_video
+from records import plain
+from snapshot import snapshot_path
+from storage import DEFAULT_DB_PATH, SqliteBackend
+
+# Bytes read per block handed to a parser process
+BLOCK_SIZE = 4 * 2 ** 20
+# Rows inserted per transaction
+BATCH_SIZE = 50000
+# Seconds between progress lines
+PROGRESS_INTERVAL = 2.0
+# Invalid records reported one by one; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+FORMATS = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl', '.csv': 'csv'}
+
+# Fields filled in for videos that do not give them, as for API uploads
+VIDEO_DEFAULTS = {
+    'description': '',
+    'thumbnail': '/placeholder.svg?height=180&width=320',
+    'videoUrl': '',
+}
+CHANNEL_DEFAULTS = {
+    'name': 'Your Channel',
+    'avatar': '/placeholder.svg?height=40&width=40',
+}
+COMMENT_DEFAULTS = {
+    'author': 'Anonymous',
+    'avatar': '/placeholder.svg?height=32&width=32',
+}
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+# Parsing (runs in the pool's processes)
+
+def _record_id(record, prefix=''):
+    """Numeric id the record asks for, or None to allocate one"""
+    value = record.pop('id', None)
+    if value is None or value == '':
+        return None
+    text = str(value)
+    if prefix and text.startswith(prefix):
+        text = text[len(prefix):]
+    if not text.isdigit() or int(text) == 0:
+        raise InvalidRecord(f"invalid id {value!r}")
+    return int(text)
+
+
+def _text(record, field, required=False):
+    value = record.get(field)
+    if value is None:
+        if required:
+            raise InvalidRecord(f"missing {field}")
+        return
+    if not isinstance(value, str) or (required and not value.strip()):
+        raise InvalidRecord(f"invalid {field} {value!r}")
+
+
+def video_row(record, now):
+    """(id, data, uploaded_at) of a video record, for IMPORT_VIDEO"""
+    video_id = _record_id(record)
+    _text(record, 'title', required=True)
+    for field in VIDEO_DEFAULTS:
+        _text(record, field)
+    channel = record.get('channel') or {}
+    if isinstance(channel, str):
+        channel = {'name': channel}
+    if not isinstance(channel, dict):
+        raise InvalidRecord(f"invalid channel {channel!r}")
+    record['channel'] = {**CHANNEL_DEFAULTS, **channel}
+    try:
+        video = normalize_video({**VIDEO_DEFAULTS, **record}, now)
+    except (TypeError, ValueError) as e:
+        raise InvalidRecord(str(e)) from None
+    if video['viewCount'] < 0 or video['durationSeconds'] < 0:
+        raise InvalidRecord("negative viewCount or durationSeconds")
+    return video_id, json.dumps(plain(video)), video['uploadedAt']
+
+
+def comment_row(record, now):
+    """(id, video_id, data, created_at, video_id) of a comment record, for IMPORT_COMMENT"""
+    comment_id = _record_id(record, prefix='c')
+    video_id = str(record.pop('videoId', ''))
+    if not video_id.isdigit():
+        raise InvalidRecord(f"invalid videoId {video_id!r}" if video_id else "missing videoId")
+    _text(record, 'content', required=True)
+    for field in (*COMMENT_DEFAULTS, 'parentId'):
+        _text(record, field)
+    try:
+        comment = normalize_comment({**COMMENT_DEFAULTS, **record}, now)
+    except (TypeError, ValueError) as e:
+        raise InvalidRecord(str(e)) from None
+    if comment['likes'] < 0:
+        raise InvalidRecord("negative likes")
+    return comment_id, video_id, json.dumps(plain(comment)), comment['postedAt'], int(video_id)
+
+
+ROW_BUILDERS = {'videos': video_row, 'comments': comment_row}
+
+
+def _csv_record(header, values):
+    """Record of a CSV row: empty cells left out, dotted columns nested"""
+    if len(values) != len(header):
+        raise InvalidRecord(f"{len(values)} columns, expected {len(header)}")
+    record = {}
+    for column, value in zip(header, values):
+        if value == '':
+            continue
+        *parents, field = column.split('.')
+        target = record
+        for parent in parents:
+            target = target.setdefault(parent, {})
+            if not isinstance(target, dict):
+                raise InvalidRecord(f"column {column} conflicts with {parent}")
+        target[field] = value
+    return record
+
+
+def _iter_records(text, fmt, header, first_line):
+    """(line number, record or the InvalidRecord it failed with) for a block"""
+    if fmt == 'jsonl':
+        for number, line in enumerate(text.split('\n'), first_line):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, InvalidRecord(f"invalid JSON: {e}")
+                continue
+            if not isinstance(record, dict):
+                yield number, InvalidRecord("not a JSON object")
+                continue
+            yield number, record
+        return
+    reader = csv.reader(io.StringIO(text, newline=''))
+    while True:
+        # Number of the line the row starts on; rows may span several
+        number = first_line + reader.line_num
+        try:
+            values = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield number, InvalidRecord(f"invalid CSV: {e}")
+            continue
+        if not values:
+            continue
+        try:
+            yield number, _csv_record(header, values)
+        except InvalidRecord as e:
+            yield number, e
+
+
+def parse_block(kind, fmt, header, data, first_line, now):
+    """Rows of the valid records in a block of whole records, and
+    (line number, message) for the others
+    """
+    build = ROW_BUILDERS[kind]
+    rows = []
+    errors = []
+    for number, record in _iter_records(data.decode('utf-8', 'replace'), fmt, header, first_line):
+        if isinstance(record, InvalidRecord):
+            errors.append((number, str(record)))
+            continue
+        try:
+            rows.append(build(record, now))
+        except InvalidRecord as e:
+            errors.append((number, str(e)))
+    return rows, errors
+
+
+# Reading
+
+def _block_end(data, fmt):
+    """Length of the whole records at the start of data: up to its last
+    line break, and for CSV one outside a quoted field; 0 if none
+    """
+    end = data.rfind(b'\n') + 1
+    if fmt == 'csv':
+        # Quotes are escaped by doubling, so a line break is outside every
+        # quoted field exactly when an even number of quotes precede it
+        while end and data.count(b'"', 0, end) % 2:
+            end = data.rfind(b'\n', 0, end - 1) + 1
+    return end
+
+
+def iter_blocks(file, fmt, block_size=BLOCK_SIZE, line=1):
+    """(first line number, bytes) blocks of whole records read from file,
+    counting lines from line
+    """
+    pending = b''
+    while True:
+        chunk = file.read(block_size)
+        data = pending + chunk
+        if not chunk:
+            if data.strip():
+                yield line, data
+            return
+        end = _block_end(data, fmt)
+        if not end:
+            # A record longer than a block: keep reading
+            pending = data
+            continue
+        block, pending = data[:end], data[end:]
+        yield line, block
+        line += block.count(b'\n')
+
+
+def read_header(file, fmt):
+    """Column names of a CSV file (consuming its first line); None for JSONL"""
+    if fmt != 'csv':
+        return None
+    first = file.readline()
+    if first.startswith(b'\xef\xbb\xbf'):
+        first = first[3:]
+    return next(csv.reader([first.decode('utf-8', 'replace')]), [])
+
+
+def file_format(path, fmt=None):
+    if fmt:
+        return fmt
+    try:
+        return FORMATS[os.path.splitext(path)[1].lower()]
+    except KeyError:
+        raise SystemExit(f"❌ Cannot tell the format of {path}; pass --format jsonl or csv") from None
+
+
+# Importing
+
+class Progress:
+    """Counts of one file's import, printed every PROGRESS_INTERVAL seconds"""
+
+    def __init__(self, kind, path):
+        self.kind = kind
+        self.size = os.path.getsize(path)
+        self.read = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.refused = 0
+        self.invalid = 0
+        self.started = time.perf_counter()
+        self._next_report = self.started + PROGRESS_INTERVAL
+
+    @property
+    def rows(self):
+        return self.inserted + self.skipped + self.refused + self.invalid
+
+    def rate(self):
+        return self.rows / max(time.perf_counter() - self.started, 1e-9)
+
+    def error(self, line, message):
+        self.invalid += 1
+        if self.invalid <= MAX_REPORTED_ERRORS:
+            print(f"⚠️  {self.kind} line {line}: {message}")
+        elif self.invalid == MAX_REPORTED_ERRORS + 1:
+            print(f"⚠️  More invalid {self.kind}; only counting them from here")
+
+    def report(self, final=False):
+        now = time.perf_counter()
+        if not final and now < self._next_report:
+            return
+        self._next_report = now + PROGRESS_INTERVAL
+        percent = f"{self.read / self.size:.0%}" if self.size else "100%"
+        print(f"{'✅' if final else '⏳'} {self.kind}: {self.rows:,} rows ({percent}) in {now - self.started:.1f}s, "
+              f"{self.rate():,.0f} rows/s; {self.inserted:,} inserted, {self.skipped:,} skipped, "
+              f"{self.refused:,} refused, {self.invalid:,} invalid")
+
+
+def import_file(backend, pool, kind, path, options):
+    """Stream one file into the database; returns its Progress"""
+    fmt = file_format(path, options.format)
+    sql = backend.IMPORT_VIDEO if kind == 'videos' else backend.IMPORT_COMMENT
+    progress = Progress(kind, path)
+    now = time.time()
+    batch = []
+
+    def write():
+        inserted, refused = backend.import_rows(sql, batch)
+        progress.inserted += inserted
+        progress.refused += refused
+        progress.skipped += len(batch) - inserted - refused
+        batch.clear()
+
+    def collect(result, size):
+        rows, errors = result
+        for line, message in errors:
+            progress.error(line, message)
+        batch.extend(rows)
+        progress.read += size
+        if len(batch) >= options.batch_size:
+            write()
+        progress.report()
+
+    with open(path, 'rb') as file:
+        header = read_header(file, fmt)
+        progress.read = file.tell()
+        blocks = iter_blocks(file, fmt, options.block_size, line=2 if header else 1)
+        if pool is None:
+            for first_line, block in blocks:
+                collect(parse_block(kind, fmt, header, block, first_line, now), len(block))
+        else:
+            # Parse a bounded number of blocks ahead; results are taken in
+            # file order so allocated ids follow it
+            pending = deque()
+            for first_line, block in blocks:
+                pending.append((pool.submit(parse_block, kind, fmt, header, block, first_line, now), len(block)))
+                if len(pending) >= 2 * options.workers:
+                    future, size = pending.popleft()
+                    collect(future.result(), size)
+            while pending:
+                future, size = pending.popleft()
+                collect(future.result(), size)
+    if batch:
+        write()
+    progress.report(final=True)
+    return progress
+
+
+def write_snapshot(path):
+    """Load the imported catalog once and write the snapshot workers start from"""
+    # Imported here: the store pulls in Flask, which the import itself does not need
+    from store import CatalogStore
+
+    print("📸 Building indexes and writing the catalog snapshot...")
+    started = time.perf_counter()
+    backend = SqliteBackend(path)
+    store = CatalogStore(backend=backend)
+    try:
+        target = snapshot_path(backend)
+        store.write_snapshot(target)
+    finally:
+        store.close()
+    print(f"✅ {len(store):,} videos indexed and written to {target} in {time.perf_counter() - started:.1f}s")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--videos', nargs='+', default=[], metavar='FILE', help="video JSONL/CSV files")
+    parser.add_argument('--comments', nargs='+', default=[], metavar='FILE',
+                        help="comment JSONL/CSV files, imported after the videos")
+    parser.add_argument('--db', default=os.environ.get('STORAGE_PATH', DEFAULT_DB_PATH),
+                        help="SQLite catalog to import into (default: STORAGE_PATH or api/data/catalog.db)")
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help="input format (default: from the file extension)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="parser processes (default: CPU count; 0 parses in this process)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="rows per transaction")
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help="bytes per parsed block")
+    parser.add_argument('--keep-indexes', action='store_true',
+                        help="keep the database indexes during the import (for a live database)")
+    parser.add_argument('--no-snapshot', action='store_true', help="do not write a catalog snapshot afterwards")
+    options = parser.parse_args(argv)
+    if not options.videos and not options.comments:
+        parser.error("nothing to import: pass --videos and/or --comments")
+    return options
+
+
+def main():
+    options = parse_args()
+    print("🎬 YouTube Clone - Bulk Import")
+    print("=" * 50)
+    pool = None
+    if options.workers > 0:
+        # Started before the database is opened, so forked parsers inherit
+        # no connections or writer thread
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork') if 'fork' in methods else None
+        pool = ProcessPoolExecutor(max_workers=options.workers, mp_context=context)
+    backend = SqliteBackend(options.db)
+    started = time.perf_counter()
+    results = []
+    try:
+        backend.open()
+        indexes = [] if options.keep_indexes else backend.drop_indexes()
+        try:
+            for kind, paths in (('videos', options.videos), ('comments', options.comments)):
+                for path in paths:
+                    print(f"\n📥 Importing {kind} from {path}")
+                    results.append(import_file(backend, pool, kind, path, options))
+        finally:
+            if indexes:
+                print("\n🗂️  Rebuilding database indexes...")
+                backend.create_indexes(indexes)
+    finally:
+        backend.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    rows = sum(progress.rows for progress in results)
+    seconds = time.perf_counter() - started
+    print(f"\n✅ Imported {sum(progress.inserted for progress in results):,} of {rows:,} rows into {options.db} "
+          f"in {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+    if any(progress.refused for progress in results):
+        print("⚠️  Refused records asked for ids at or below the newest in the catalog; "
+              "import them without ids to have new ones allocated")
+    if not options.no_snapshot:
+        write_snapshot(options.db)
+    return True
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        print("\n👋 Import interrupted; rows committed so far are kept")
+        sys.exit(1)
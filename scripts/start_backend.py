@@ -1,11 +1,30 @@
 #!/usr/bin/env python3
+"""Start the Flask backend
 
+Without arguments this runs the development server (api/index.py). With
+--production it runs a pre-fork server: one master process owns the
+listening socket and forks worker processes that accept from it, each
+serving requests on a bounded thread pool.
+
+    python scripts/start_backend.py --production --workers 4 --threads 8
+"""
+
+import argparse
+import logging
+import random
+import signal
+import socket
 import subprocess
 import sys
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
+API_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api')
+
 def check_dependencies():
     """Check if required Python packages are installed"""
     missing_packages = []
@@ -37,18 +56,17 @@ def check_dependencies():
     
     return True
 
-def check_port_available():
-    """Check if port 5328 is available"""
-    import socket
+def check_port_available(port=5328):
+    """Check if the server port is available"""
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    result = sock.connect_ex(('127.0.0.1', 5328))
+    result = sock.connect_ex(('127.0.0.1', port))
     sock.close()
     
     if result == 0:
-        print("⚠️  Port 5328 is already in use")
+        print(f"⚠️  Port {port} is already in use")
         return False
     else:
-        print("✅ Port 5328 is available")
+        print(f"✅ Port {port} is available")
         return True
 
 def start_flask_server():
@@ -91,7 +109,249 @@ def test_server():
     print("❌ Server is not responding")
     return False
 
+def make_pooled_server(host, port, app, fd, threads, max_requests):
+    """Werkzeug WSGI server that serves on a fixed-size thread pool"""
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class DetachableRequestHandler(WSGIRequestHandler):
+        """Lets the app take over the connection (live event streams, api/events.py)"""
+
+        detached = False
+
+        def make_environ(self):
+            environ = super().make_environ()
+            environ['app.detach_socket'] = self.detach_socket
+            return environ
+
+        def detach_socket(self):
+            """Return a duplicate of the client socket; the server will not close the connection"""
+            self.detached = True
+            # The body then ends when the app closes the socket, so no chunked framing
+            self.protocol_version = 'HTTP/1.0'
+            return self.connection.dup()
+
+    class PooledWSGIServer(BaseWSGIServer):
+        multithread = True
+
+        def __init__(self):
+            # super().__init__ may call server_close() before we are set up
+            self.executor = None
+            # Only accept while a thread is free, so idle workers pick up the rest
+            self.free_threads = threading.Semaphore(threads)
+            self.max_requests = max_requests
+            self.handled = 0
+            self.stopping = threading.Event()
+            super().__init__(host, port, app, handler=DetachableRequestHandler, fd=fd)
+            self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+
+        def process_request(self, request, client_address):
+            self.free_threads.acquire()
+            self.executor.submit(self.process_in_thread, request, client_address)
+            self.handled += 1
+            if self.max_requests and self.handled >= self.max_requests:
+                self.stop()
+
+        def finish_request(self, request, client_address):
+            """Handle one connection; True if the app detached it"""
+            return self.RequestHandlerClass(request, client_address, self).detached
+
+        def process_in_thread(self, request, client_address):
+            detached = False
+            try:
+                detached = self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                if detached:
+                    # The app owns a duplicate; shutdown() would end its stream too
+                    request.close()
+                else:
+                    self.shutdown_request(request)
+                self.free_threads.release()
+
+        def stop(self):
+            """Stop accepting; serve_forever returns once in-flight requests finish"""
+            if not self.stopping.is_set():
+                self.stopping.set()
+                threading.Thread(target=self.shutdown, daemon=True).start()
+
+        def server_close(self):
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+            super().server_close()
+
+    return PooledWSGIServer()
+
+
+def run_worker(listener, options):
+    """Serve requests from the shared listening socket until told to stop"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    sys.path.insert(0, API_PATH)
+    import index
+    # The app writes its own access log; skip werkzeug's duplicate request lines
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    # Jitter so workers started together do not all recycle at once
+    max_requests = options.max_requests
+    if max_requests:
+        max_requests += random.randint(0, max(1, max_requests // 10))
+    host, port = listener.getsockname()[:2]
+    server = make_pooled_server(host, port, index.app, listener.fileno(), options.threads, max_requests)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    print(f"👷 Worker {os.getpid()} ready ({options.threads} threads)")
+    try:
+        server.serve_forever()
+    finally:
+        index.shutdown()
+    reason = "recycling" if server.max_requests and server.handled >= server.max_requests else "stopped"
+    print(f"👋 Worker {os.getpid()} {reason} after {server.handled} requests")
+
+
+class PreforkMaster:
+    """Owns the listening socket and keeps options.workers workers alive
+
+    SIGHUP starts a fresh set of workers (picking up new code) and then
+    gracefully stops the old ones; SIGTERM/SIGINT stop every worker, which
+    finish their in-flight requests before exiting. Workers that exit on
+    their own (e.g. recycling after --max-requests) are replaced.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.workers = {}
+        self.listener = None
+        self.respawn_after = 0.0
+        self.stopping = False
+        self.reloading = False
+
+    def listen(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.options.host, self.options.port))
+        listener.listen(self.options.backlog)
+        # Workers race to accept; the losers must not block in accept()
+        listener.setblocking(False)
+        listener.set_inheritable(True)
+        self.listener = listener
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.listener, self.options)
+            except BaseException as e:
+                code = e.code if isinstance(e, SystemExit) and isinstance(e.code, int) else 1
+                if code:
+                    print(f"❌ Worker {os.getpid()} crashed: {e!r}")
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+
+    def signal_workers(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def reap(self):
+        """Forget exited workers; return how many exited"""
+        exited = 0
+        while self.workers:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                break
+            if pid == 0:
+                break
+            started = self.workers.pop(pid, None)
+            if started is not None and time.monotonic() - started < 2:
+                # Crashing on startup; do not respawn in a tight loop
+                self.respawn_after = time.monotonic() + 1
+            exited += 1
+        return exited
+
+    def reload(self):
+        print("🔄 Reloading workers...")
+        old_workers = list(self.workers)
+        for _ in range(self.options.workers):
+            self.spawn()
+        self.signal_workers(old_workers, signal.SIGTERM)
+
+    def stop(self):
+        print(f"\n⏹️  Stopping {len(self.workers)} workers...")
+        self.signal_workers(list(self.workers), signal.SIGTERM)
+        deadline = time.monotonic() + self.options.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        if self.workers:
+            print(f"⚠️  Killing {len(self.workers)} workers that did not finish in time")
+            self.signal_workers(list(self.workers), signal.SIGKILL)
+            while self.workers:
+                self.reap()
+                time.sleep(0.05)
+        self.listener.close()
+        print("✅ Server stopped gracefully")
+
+    def run(self):
+        self.listen()
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, 'reloading', True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, 'stopping', True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, 'stopping', True))
+        print(f"🚀 Master {os.getpid()} listening on http://{self.options.host}:{self.options.port}")
+        for _ in range(self.options.workers):
+            self.spawn()
+
+        while not self.stopping:
+            time.sleep(0.2)
+            if self.reloading:
+                self.reloading = False
+                self.reload()
+            self.reap()
+            # Replace recycled or crashed workers; during a reload the old
+            # set drains while the new set is already running
+            while (len(self.workers) < self.options.workers and not self.stopping
+                   and time.monotonic() >= self.respawn_after):
+                self.spawn()
+        self.stop()
+        return True
+
+
+def start_production_server(options):
+    """Run the pre-fork production server"""
+    if not hasattr(os, 'fork'):
+        print("⚠️  Production mode needs os.fork (Linux/macOS); starting the development server instead")
+        return start_flask_server()
+    if options.workers > 1 and os.environ.get('STORAGE_BACKEND', 'memory') == 'memory':
+        print("⚠️  Each worker keeps its own in-memory catalog; set STORAGE_BACKEND=sqlite to share one")
+    print(f"🏭 Production mode: {options.workers} workers x {options.threads} threads"
+          + (f", recycling after ~{options.max_requests} requests" if options.max_requests else ""))
+    return PreforkMaster(options).run()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Start the YouTube Clone backend server")
+    parser.add_argument('--production', action='store_true',
+                        help="run the pre-fork server instead of the Flask development server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5328)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument('--threads', type=int, default=8, help="request threads per worker")
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help="recycle a worker after about this many requests (0 = never)")
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help="seconds workers get to finish in-flight requests on shutdown")
+    parser.add_argument('--backlog', type=int, default=2048)
+    return parser.parse_args(argv)
+
 def main():
+    options = parse_args()
     print("🎬 YouTube Clone - Backend Server Starter")
     print("=" * 50)
     
@@ -102,12 +362,14 @@ def main():
     
     # Check port
     print("\n🔍 Checking port availability...")
-    if not check_port_available():
+    if not check_port_available(options.port):
         print("💡 Try stopping any existing Flask servers or use a different port")
         return False
     
     # Start server
     print("\n🚀 Starting server...")
+    if options.production:
+        return start_production_server(options)
     return start_flask_server()
 
 if __name__ == "__main__":